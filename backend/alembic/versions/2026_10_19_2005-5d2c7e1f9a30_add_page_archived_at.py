@@ -0,0 +1,30 @@
+"""add page archived_at
+
+Revision ID: 5d2c7e1f9a30
+Revises: b3f0a8c4d912
+Create Date: 2026-10-19 20:05:12.318604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2c7e1f9a30'
+down_revision: Union[str, None] = 'b3f0a8c4d912'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('pages', sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True))
+    # Pages archived before this revision count from their last update
+    op.execute("UPDATE pages SET archived_at = COALESCE(updated_at, created_at) WHERE is_archived")
+    op.create_index('ix_pages_is_archived_archived_at', 'pages', ['is_archived', 'archived_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_pages_is_archived_archived_at', table_name='pages')
+    op.drop_column('pages', 'archived_at')
@@ -0,0 +1,64 @@
+"""add page path and position
+
+Revision ID: 8e4b1d6c3f57
+Revises: 5d2c7e1f9a30
+Create Date: 2026-10-19 20:40:27.915230
+
+"""
+from itertools import groupby
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.fractional_index import keys_after
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4b1d6c3f57'
+down_revision: Union[str, None] = '5d2c7e1f9a30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+byte_ordered = sa.String().with_variant(sa.String(collation='C'), 'postgresql')
+
+
+def upgrade() -> None:
+    op.add_column('pages', sa.Column('path', byte_ordered, nullable=True))
+    op.add_column('pages', sa.Column('position', byte_ordered, nullable=True))
+
+    # Paths from the top-level pages down; the depth limit stops at cycles in old data
+    op.execute("""
+        WITH RECURSIVE tree (id, path, depth) AS (
+            SELECT id, '/' || id || '/', 0 FROM pages WHERE parent_id IS NULL
+            UNION ALL
+            SELECT pages.id, tree.path || pages.id || '/', tree.depth + 1
+            FROM pages JOIN tree ON pages.parent_id = tree.id
+            WHERE tree.depth < 64
+        )
+        UPDATE pages SET path = tree.path FROM tree WHERE pages.id = tree.id
+    """)
+
+    # Siblings keep their creation order
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT id, parent_id, owner_id FROM pages "
+        "ORDER BY parent_id, CASE WHEN parent_id IS NULL THEN owner_id END, created_at, id"
+    )).all()
+    updates = []
+    for _, siblings in groupby(rows, key=lambda row: (row.parent_id, row.owner_id if row.parent_id is None else None)):
+        siblings = list(siblings)
+        for row, position in zip(siblings, keys_after(None, len(siblings))):
+            updates.append({"id": row.id, "position": position})
+    if updates:
+        bind.execute(sa.text("UPDATE pages SET position = :position WHERE id = :id"), updates)
+
+    op.create_index(op.f('ix_pages_path'), 'pages', ['path'], unique=False)
+    op.create_index('ix_pages_parent_id_position', 'pages', ['parent_id', 'position'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_pages_parent_id_position', table_name='pages')
+    op.drop_index(op.f('ix_pages_path'), table_name='pages')
+    op.drop_column('pages', 'position')
+    op.drop_column('pages', 'path')
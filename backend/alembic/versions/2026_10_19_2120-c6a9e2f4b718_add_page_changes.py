@@ -0,0 +1,40 @@
+"""add page changes
+
+Revision ID: c6a9e2f4b718
+Revises: 8e4b1d6c3f57
+Create Date: 2026-10-19 21:20:44.503917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6a9e2f4b718'
+down_revision: Union[str, None] = '8e4b1d6c3f57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('page_changes',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('entity', sa.String(), nullable=False),
+    sa.Column('entity_id', sa.String(), nullable=False),
+    sa.Column('page_id', sa.String(), nullable=False),
+    sa.Column('owner_id', sa.String(), nullable=False),
+    sa.Column('op', sa.String(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_page_changes_owner_id_id', 'page_changes', ['owner_id', 'id'], unique=False)
+    op.create_index('ix_page_changes_page_id_id', 'page_changes', ['page_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_page_changes_page_id_id', table_name='page_changes')
+    op.drop_index('ix_page_changes_owner_id_id', table_name='page_changes')
+    op.drop_table('page_changes')
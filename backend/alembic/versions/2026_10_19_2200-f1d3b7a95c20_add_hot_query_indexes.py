@@ -0,0 +1,46 @@
+"""add hot query indexes
+
+Revision ID: f1d3b7a95c20
+Revises: c6a9e2f4b718
+Create Date: 2026-10-19 22:00:18.640352
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1d3b7a95c20'
+down_revision: Union[str, None] = 'c6a9e2f4b718'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, dialect options)
+INDEXES = [
+    ('ix_pages_owner_id', 'pages', ['owner_id'], {}),
+    ('ix_pages_active_owner_id_parent_id_position', 'pages', ['owner_id', 'parent_id', 'position'], {
+        'postgresql_where': sa.text('is_archived = false'),
+        'sqlite_where': sa.text('is_archived = 0'),
+    }),
+    ('ix_page_collaborations_page_id_user_id', 'page_collaborations', ['page_id', 'user_id'], {}),
+    ('ix_page_collaborations_user_id_page_id', 'page_collaborations', ['user_id', 'page_id'], {}),
+    ('ix_page_versions_page_id_version_number', 'page_versions', ['page_id', 'version_number'], {}),
+    ('ix_comments_page_id_parent_comment_id', 'comments', ['page_id', 'parent_comment_id'], {}),
+    ('ix_comments_parent_comment_id', 'comments', ['parent_comment_id'], {}),
+    ('ix_password_reset_tokens_expires_at', 'password_reset_tokens', ['expires_at'], {}),
+]
+
+
+def upgrade() -> None:
+    # Built without blocking writes on postgres, which cannot happen inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, **options)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
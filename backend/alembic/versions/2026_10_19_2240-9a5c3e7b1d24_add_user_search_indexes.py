@@ -0,0 +1,43 @@
+"""add user search indexes
+
+Revision ID: 9a5c3e7b1d24
+Revises: f1d3b7a95c20
+Create Date: 2026-10-19 22:40:07.318264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a5c3e7b1d24'
+down_revision: Union[str, None] = 'f1d3b7a95c20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, column)
+INDEXES = [
+    ('ix_users_lower_username', 'username'),
+    ('ix_users_lower_full_name', 'full_name'),
+    ('ix_users_lower_email', 'email'),
+]
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        # Trigram indexes serve prefix, substring and similarity matches alike
+        with op.get_context().autocommit_block():
+            for name, column in INDEXES:
+                op.execute(f'CREATE INDEX CONCURRENTLY {name} ON users USING gin (lower({column}) gin_trgm_ops)')
+    else:
+        for name, column in INDEXES:
+            op.create_index(name, 'users', [sa.text(f'lower({column})')], unique=False)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, column in reversed(INDEXES):
+            op.drop_index(name, table_name='users', postgresql_concurrently=True)
@@ -0,0 +1,39 @@
+"""add page links
+
+Revision ID: d2b8f5a1c743
+Revises: 9a5c3e7b1d24
+Create Date: 2026-10-19 23:20:41.902715
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b8f5a1c743'
+down_revision: Union[str, None] = '9a5c3e7b1d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled for existing pages by `python -m scripts.rebuild_page_links`
+    op.create_table('page_links',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('source_page_id', sa.String(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('target_id', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['source_page_id'], ['pages.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_page_links_source_page_id', 'page_links', ['source_page_id'], unique=False)
+    op.create_index('ix_page_links_target_id_kind', 'page_links', ['target_id', 'kind'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_page_links_target_id_kind', table_name='page_links')
+    op.drop_index('ix_page_links_source_page_id', table_name='page_links')
+    op.drop_table('page_links')
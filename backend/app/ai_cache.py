@@ -0,0 +1,164 @@
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from app.config import settings
+from app.metrics import metrics
+
+def cache_key(model: str, command: str, prompt: str, context: Optional[str]) -> str:
+    """Content address of an AI request."""
+    context_hash = hashlib.sha256((context or "").encode()).hexdigest()
+    material = json.dumps([model, command, prompt, context_hash])
+    return "ai:" + hashlib.sha256(material.encode()).hexdigest()
+
+class AIResultCache:
+    """LRU + TTL cache of AI results, optionally shared through Redis.
+
+    Entries are fresh for the TTL of their command and may then be served stale
+    for `stale_seconds` while a single background request refreshes them.
+    Concurrent misses on the same key share one upstream request.
+    """
+
+    def __init__(self, max_entries: int, stale_seconds: int, rules: Dict[str, int], redis_url: Optional[str] = None):
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self.rules = rules
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.refreshing: Set[str] = set()
+        self.background_tasks: Set[asyncio.Task] = set()
+        self.redis = None
+        if redis_url:
+            import redis.asyncio as redis_asyncio
+            self.redis = redis_asyncio.from_url(redis_url)
+
+    def ttl_for(self, command: str) -> int:
+        """Seconds a result of this command stays fresh, 0 if it is not cacheable."""
+        return self.rules.get(command, 0)
+
+    # Storage
+
+    async def _load(self, key: str) -> Optional[dict]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(key)
+            except Exception as e:
+                print(f"[AICache] Redis read failed: {e}")
+                return None
+            if raw is not None:
+                entry = json.loads(raw)
+                self._store_local(key, entry)
+                return entry
+        return None
+
+    def _store_local(self, key: str, entry: dict):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            metrics.inc("ai_cache_evictions")
+
+    async def _store(self, key: str, value: dict, ttl: int):
+        now = time.time()
+        entry = {
+            "value": value,
+            "fresh_until": now + ttl,
+            "stale_until": now + ttl + self.stale_seconds,
+        }
+        self._store_local(key, entry)
+
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, json.dumps(entry), ex=ttl + self.stale_seconds)
+            except Exception as e:
+                print(f"[AICache] Redis write failed: {e}")
+
+    # Lookups
+
+    async def _fetch(self, key: str, ttl: int, fetch: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        """Call upstream once per key; results that are None are not cached."""
+        future = self.inflight.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The request that was fetching the key went away, not this one
+                return await self._fetch(key, ttl, fetch)
+
+        future = self.inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await fetch()
+            if value is not None:
+                await self._store(key, value, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no one else is waiting
+            future.exception()
+            raise
+        finally:
+            del self.inflight[key]
+
+    async def _refresh(self, key: str, ttl: int, fetch):
+        try:
+            await self._fetch(key, ttl, fetch)
+        except Exception as e:
+            print(f"[AICache] Background refresh failed: {e}")
+        finally:
+            self.refreshing.discard(key)
+
+    async def get_or_fetch(self, key: str, ttl: int, fetch: Callable[[], Awaitable[Optional[dict]]]):
+        """Return `(value, cached)` for a key, calling `fetch` on a miss."""
+        entry = await self._load(key)
+        now = time.time()
+
+        if entry is not None and now < entry["fresh_until"]:
+            metrics.inc("ai_cache_requests", result="hit")
+            return entry["value"], True
+
+        if entry is not None and now < entry["stale_until"]:
+            metrics.inc("ai_cache_requests", result="stale")
+            if key not in self.refreshing:
+                self.refreshing.add(key)
+                task = asyncio.create_task(self._refresh(key, ttl, fetch))
+                self.background_tasks.add(task)
+                task.add_done_callback(self.background_tasks.discard)
+            return entry["value"], True
+
+        metrics.inc("ai_cache_requests", result="coalesced" if key in self.inflight else "miss")
+        return await self._fetch(key, ttl, fetch), False
+
+    def stats(self) -> dict:
+        counters = metrics.snapshot()["counters"]
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "redis": self.redis is not None,
+            "requests": {
+                result: counters.get(f"ai_cache_requests{{result={result}}}", 0)
+                for result in ("hit", "stale", "miss", "coalesced", "bypass")
+            },
+            "evictions": counters.get("ai_cache_evictions", 0),
+        }
+
+# Global AI result cache instance
+ai_cache = AIResultCache(
+    max_entries=settings.AI_CACHE_MAX_ENTRIES,
+    stale_seconds=settings.AI_CACHE_STALE_SECONDS,
+    rules=settings.AI_CACHE_TTL_SECONDS,
+    redis_url=settings.REDIS_URL if settings.AI_CACHE_REDIS_ENABLED else None
+)
@@ -0,0 +1,205 @@
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.metrics import metrics
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+class SchedulerRejected(Exception):
+    """Raised when a user may not queue another AI request right now."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+class Ticket:
+    """A request waiting for, or holding, an upstream slot."""
+
+    __slots__ = ("user_id", "priority", "future", "enqueued_at", "granted")
+
+    def __init__(self, user_id: str, priority: int):
+        self.user_id = user_id
+        self.priority = priority
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.perf_counter()
+        self.granted = False
+
+class AIScheduler:
+    """Admission control for upstream AI requests.
+
+    At most `max_concurrency` requests run upstream at once. Waiting requests
+    are queued per priority, and within a priority each user has their own
+    queue served round-robin, so one heavy user cannot starve the others.
+    Tokens reported in `usage` are charged against a per-user budget over a
+    sliding window.
+    """
+
+    def __init__(self, max_concurrency: int, max_queued_per_user: int, token_budget: int, budget_window: float):
+        self.max_concurrency = max_concurrency
+        self.max_queued_per_user = max_queued_per_user
+        self.token_budget = token_budget
+        self.budget_window = budget_window
+        self.active = 0
+        # priority -> user_id -> waiting tickets; OrderedDict order is the round-robin order
+        self.queues: Dict[int, "OrderedDict[str, Deque[Ticket]]"] = {INTERACTIVE: OrderedDict(), BULK: OrderedDict()}
+        self.usage: Dict[str, Deque[Tuple[float, int]]] = {}
+
+    def priority_for(self, command: str, stream: bool = False) -> int:
+        if stream or command in settings.AI_INTERACTIVE_COMMANDS:
+            return INTERACTIVE
+        return BULK
+
+    # Budgets
+
+    def tokens_used(self, user_id: str) -> int:
+        entries = self.usage.get(user_id)
+        if not entries:
+            return 0
+        cutoff = time.time() - self.budget_window
+        while entries and entries[0][0] < cutoff:
+            entries.popleft()
+        if not entries:
+            del self.usage[user_id]
+            return 0
+        return sum(tokens for _, tokens in entries)
+
+    def charge(self, user_id: str, usage: Optional[dict]):
+        """Charge the tokens reported by the upstream to a user's budget."""
+        if not usage:
+            return
+        tokens = usage.get("input_tokens", 0) + usage.get("output_tokens", 0) or usage.get("tokens", 0)
+        if tokens:
+            self.usage.setdefault(user_id, deque()).append((time.time(), tokens))
+            metrics.inc("ai_tokens", tokens)
+
+    def queued_for(self, user_id: str) -> int:
+        return sum(len(queue.get(user_id, ())) for queue in self.queues.values())
+
+    def check_admission(self, user_id: str):
+        """Raise SchedulerRejected if the user is over budget or has too many queued requests."""
+        if self.token_budget and self.tokens_used(user_id) >= self.token_budget:
+            metrics.inc("ai_scheduler_rejected", reason="budget")
+            raise SchedulerRejected("budget", "AI token budget exhausted, try again later")
+        if self.queued_for(user_id) >= self.max_queued_per_user:
+            metrics.inc("ai_scheduler_rejected", reason="queue_full")
+            raise SchedulerRejected("queue_full", "Too many AI requests queued")
+
+    # Queueing
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self.active += 1
+            ticket.granted = True
+            metrics.observe(
+                "ai_queue_wait_seconds", time.perf_counter() - ticket.enqueued_at,
+                priority=PRIORITY_NAMES[ticket.priority]
+            )
+            ticket.future.set_result(None)
+
+    def _next_ticket(self) -> Optional[Ticket]:
+        for priority in (INTERACTIVE, BULK):
+            users = self.queues[priority]
+            if not users:
+                continue
+            user_id, waiting = next(iter(users.items()))
+            ticket = waiting.popleft()
+            # The user goes to the back of the rotation, or leaves it if they have nothing left
+            if waiting:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            return ticket
+        return None
+
+    def enqueue(self, user_id: str, priority: int) -> Ticket:
+        ticket = Ticket(user_id, priority)
+        self.queues[priority].setdefault(user_id, deque()).append(ticket)
+        self._dispatch()
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """Give back a granted slot, or drop a ticket that is still waiting."""
+        if ticket.granted:
+            ticket.granted = False
+            self.active -= 1
+        else:
+            waiting = self.queues[ticket.priority].get(ticket.user_id)
+            if waiting is not None and ticket in waiting:
+                waiting.remove(ticket)
+                if not waiting:
+                    del self.queues[ticket.priority][ticket.user_id]
+            if not ticket.future.done():
+                ticket.future.cancel()
+        self._dispatch()
+
+    def position(self, ticket: Ticket) -> int:
+        """Number of requests that will be dispatched before this one, 0 once it is running."""
+        if ticket.granted or ticket.future.done():
+            return 0
+        ahead = 0
+        for priority in (INTERACTIVE, BULK):
+            users = self.queues[priority]
+            if priority < ticket.priority:
+                ahead += sum(len(waiting) for waiting in users.values())
+                continue
+            # Replay the round-robin order for this priority
+            queues = [list(waiting) for waiting in users.values()]
+            for depth in range(max(map(len, queues), default=0)):
+                for waiting in queues:
+                    if depth < len(waiting):
+                        if waiting[depth] is ticket:
+                            return ahead + 1
+                        ahead += 1
+        return ahead + 1
+
+    async def wait(self, ticket: Ticket, timeout: Optional[float] = None):
+        """Wait until the ticket is granted a slot."""
+        await asyncio.wait_for(asyncio.shield(ticket.future), timeout)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, priority: int, timeout: Optional[float] = None):
+        ticket = self.enqueue(user_id, priority)
+        try:
+            await self.wait(ticket, timeout)
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self, user_id: Optional[str] = None) -> dict:
+        stats = {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queued": {
+                PRIORITY_NAMES[priority]: sum(len(waiting) for waiting in users.values())
+                for priority, users in self.queues.items()
+            },
+        }
+        if user_id is not None:
+            waiting: List[Ticket] = [
+                ticket for users in self.queues.values() for ticket in users.get(user_id, ())
+            ]
+            stats["user"] = {
+                "queued": len(waiting),
+                "positions": sorted(self.position(ticket) for ticket in waiting),
+                "tokens_used": self.tokens_used(user_id),
+                "token_budget": self.token_budget,
+                "budget_window_seconds": self.budget_window,
+            }
+        return stats
+
+# Global AI scheduler instance
+ai_scheduler = AIScheduler(
+    max_concurrency=settings.AI_MAX_CONCURRENCY,
+    max_queued_per_user=settings.AI_MAX_QUEUED_PER_USER,
+    token_budget=settings.AI_USER_TOKEN_BUDGET,
+    budget_window=settings.AI_BUDGET_WINDOW_SECONDS
+)
@@ -0,0 +1,47 @@
+from celery import Celery
+from celery.signals import worker_process_init
+
+from app.config import settings
+from app.database import engine
+
+# Start a worker (and the scheduler for periodic tasks) from the backend directory:
+#   celery -A app.celery_app worker --beat --loglevel=info
+celery_app = Celery(
+    "notion_clone",
+    broker=settings.CELERY_BROKER_URL or settings.REDIS_URL,
+    include=["app.email_outbox", "app.jobs", "app.job_handlers"]
+)
+
+celery_app.conf.update(
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    task_ignore_result=True,
+    beat_schedule={
+        # Picks up retries that are due and anything a lost wake-up left behind
+        "deliver-email-outbox": {
+            "task": "email_outbox.deliver",
+            "schedule": settings.EMAIL_POLL_INTERVAL_SECONDS,
+        },
+        "dispatch-queued-jobs": {
+            "task": "jobs.dispatch_queued",
+            "schedule": settings.JOBS_REDISPATCH_AFTER_SECONDS,
+        },
+        "purge-archived-pages": {
+            "task": "pages.purge_archived",
+            "schedule": settings.PAGE_PURGE_INTERVAL_SECONDS,
+        },
+        "prune-change-feed": {
+            "task": "sync.prune_changes",
+            "schedule": settings.PAGE_PURGE_INTERVAL_SECONDS,
+        },
+        "prune-export-files": {
+            "task": "jobs.prune_exports",
+            "schedule": settings.PAGE_PURGE_INTERVAL_SECONDS,
+        },
+    },
+)
+
+@worker_process_init.connect
+def reset_database_pool(**kwargs):
+    # Forked worker processes must not reuse connections inherited from the parent
+    engine.dispose(close=False)
@@ -0,0 +1,127 @@
+"""Append-only log of changes to pages and what hangs off them.
+
+Every mutation logs its changes in the transaction that makes them, so the
+log is exactly as durable as the data. GET /api/sync reads it to send
+clients compact deltas instead of whole trees.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+from sqlalchemy import String, delete, func, insert, literal, or_, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Page, PageChange, PageCollaboration, Comment
+
+CHANGE_COLUMNS = ["entity", "entity_id", "page_id", "owner_id", "op", "user_id", "created_at"]
+
+def _log_from_pages(db: Session, entity: str, entity_id, op: str, user_id: Optional[str], where):
+    # Rows are copied from the pages they belong to, so callers need not load owners
+    db.execute(insert(PageChange).from_select(CHANGE_COLUMNS, select(
+        literal(entity), entity_id, Page.id, Page.owner_id, literal(op),
+        literal(user_id, String), literal(datetime.utcnow())
+    ).where(where)))
+
+def record_page_changes(db: Session, page_ids: Iterable[str], user_id: Optional[str], op: str = "upsert"):
+    """Log changes to pages in the current transaction, without committing."""
+    page_ids = list(dict.fromkeys(page_ids))
+    if not page_ids:
+        return
+    # Pages added through the session must exist for the INSERT ... SELECT
+    db.flush()
+    batch_size = settings.PAGE_BULK_BATCH_SIZE
+    for start in range(0, len(page_ids), batch_size):
+        _log_from_pages(db, "page", Page.id, op, user_id, Page.id.in_(page_ids[start:start + batch_size]))
+
+def record_change(db: Session, entity: str, entity_id: str, page_id: str, user_id: Optional[str], op: str = "upsert"):
+    """Log a change to a comment or collaboration of a page, without committing."""
+    db.flush()
+    _log_from_pages(db, entity, literal(entity_id, String), op, user_id, Page.id == page_id)
+
+def settled_cursor(db: Session) -> int:
+    """Newest change id that is safe to hand out as a cursor.
+
+    Ids are taken when a change is logged but show up when its transaction
+    commits, so a slow transaction can commit a lower id after a higher one
+    was read. Changes younger than CHANGE_FEED_SETTLE_SECONDS are held back
+    so that a cursor never moves past one that is still to come.
+    """
+    settled = datetime.utcnow() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+    return db.query(func.max(PageChange.id)).filter(PageChange.created_at < settled).scalar() or 0
+
+def changes_since(db: Session, user_id: str, since: Optional[int], limit: int) -> dict:
+    """What changed for a user after `since`, as current rows rather than a list of events.
+
+    Covers the pages the user owns or collaborates on. Many changes to the
+    same row collapse into one entry. Without a cursor, or with one from
+    before the retained log, the result asks the client to reset: reload
+    through the regular endpoints, then sync from the returned cursor.
+    """
+    head = settled_cursor(db)
+    result = {
+        "cursor": head, "reset": False, "has_more": False,
+        "pages": [], "deleted_pages": [], "comments": [], "collaborations": []
+    }
+    oldest = db.query(func.min(PageChange.id)).scalar()
+    if since is None or since > head or (oldest is not None and since < oldest - 1):
+        result["reset"] = True
+        return result
+
+    shared = select(PageCollaboration.page_id).where(PageCollaboration.user_id == user_id)
+    rows = db.query(
+        PageChange.id, PageChange.entity, PageChange.entity_id, PageChange.page_id, PageChange.op
+    ).filter(
+        PageChange.id > since,
+        PageChange.id <= head,
+        or_(PageChange.owner_id == user_id, PageChange.page_id.in_(shared))
+    ).order_by(PageChange.id).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        result["has_more"] = True
+        result["cursor"] = rows[-1].id
+
+    # Only the last change to each row matters
+    latest: Dict[tuple, str] = {}
+    for row in rows:
+        latest[(row.entity, row.entity_id)] = row.op
+    page_ids = [entity_id for (entity, entity_id), op in latest.items() if entity == "page" and op == "upsert"]
+    deleted = {entity_id for (entity, entity_id), op in latest.items() if entity == "page" and op == "delete"}
+    comment_ids = [entity_id for (entity, entity_id), op in latest.items() if entity == "comment" and op == "upsert"]
+    collaboration_ids = [
+        entity_id for (entity, entity_id), op in latest.items() if entity == "collaboration" and op == "upsert"
+    ]
+
+    if collaboration_ids:
+        result["collaborations"] = db.query(
+            PageCollaboration.id, PageCollaboration.page_id, PageCollaboration.user_id,
+            PageCollaboration.permission, PageCollaboration.created_at
+        ).filter(PageCollaboration.id.in_(collaboration_ids)).all()
+        # A page newly shared with the user is new to them as well
+        page_ids += [
+            collaboration.page_id for collaboration in result["collaborations"]
+            if collaboration.user_id == user_id
+        ]
+    if page_ids:
+        result["pages"] = db.query(
+            Page.id, Page.parent_id, Page.owner_id, Page.title, Page.icon, Page.content, Page.position,
+            Page.is_public, Page.is_archived, Page.archived_at, Page.created_at, Page.updated_at
+        ).filter(Page.id.in_(set(page_ids))).all()
+        # Pages purged since their last change are gone too
+        deleted |= set(page_ids) - {page.id for page in result["pages"]}
+    if comment_ids:
+        result["comments"] = db.query(
+            Comment.id, Comment.page_id, Comment.author_id, Comment.content, Comment.parent_comment_id,
+            Comment.created_at, Comment.updated_at
+        ).filter(Comment.id.in_(comment_ids)).all()
+    result["deleted_pages"] = sorted(deleted)
+    return result
+
+def prune_changes(db: Session, cutoff: datetime) -> int:
+    """Delete changes logged before `cutoff`; clients with older cursors are asked to reset."""
+    last_id = db.query(func.max(PageChange.id)).filter(PageChange.created_at < cutoff).scalar()
+    # The newest change stays, it tells cursors at the head from stale ones
+    if last_id is None:
+        return 0
+    last_id = min(last_id, db.query(func.max(PageChange.id)).scalar() - 1)
+    deleted = db.execute(delete(PageChange).where(PageChange.id <= last_id)).rowcount
+    db.commit()
+    return deleted
@@ -14,11 +14,73 @@ class Settings(BaseSettings):
     # Redis (for real-time features)
     REDIS_URL: str = "redis://localhost:6379"
     
+    # Real-time page persistence
+    PAGE_FLUSH_INTERVAL_SECONDS: float = 2.0
+    PAGE_FLUSH_CREATE_VERSIONS: bool = False
+    PAGE_BUFFER_LOG_PATH: Optional[str] = "page_buffer.log"
+    PAGE_BUFFER_LOG_MAX_BYTES: int = 8 * 1024 * 1024
+    
+    # WebSocket reconnect resume
+    WS_EVENT_BUFFER_SIZE: int = 256
+    WS_EVENT_BUFFER_TTL_SECONDS: int = 300
+    WS_MAX_SUBSCRIPTIONS: int = 100
+    
+    # WebSocket heartbeats and presence
+    WS_HEARTBEAT_INTERVAL_SECONDS: float = 25.0
+    WS_IDLE_TIMEOUT_SECONDS: float = 75.0
+    
+    # WebSocket wire format, see app/ws_protocol.py
+    WS_PER_MESSAGE_DEFLATE: bool = True
+    
     # CORS
     ALLOWED_ORIGINS: list = ["http://localhost:3000", "https://your-frontend-domain.vercel.app"]
     
     # AI Integration
     CLAUDE_API_KEY: Optional[str] = None
+    CLAUDE_API_URL: str = "https://api.anthropic.com/v1/messages"
+    CLAUDE_MODEL: str = "claude-3-opus-20240229"
+    
+    # AI result cache: seconds a result stays fresh per command, unlisted commands are not cached
+    AI_CACHE_ENABLED: bool = True
+    AI_CACHE_TTL_SECONDS: dict = {
+        "summarize": 3600,
+        "bullets": 3600,
+        "simplify": 3600,
+        "formal": 3600,
+        "casual": 3600,
+        "improve": 1800,
+        "expand": 1800,
+    }
+    AI_CACHE_STALE_SECONDS: int = 600
+    AI_CACHE_MAX_ENTRIES: int = 1000
+    AI_CACHE_REDIS_ENABLED: bool = False
+    
+    # AI request scheduler: upstream concurrency cap, per-user queue limit and token budget
+    AI_MAX_CONCURRENCY: int = 8
+    AI_MAX_QUEUED_PER_USER: int = 10
+    AI_QUEUE_TIMEOUT_SECONDS: float = 60.0
+    AI_USER_TOKEN_BUDGET: int = 100000
+    AI_BUDGET_WINDOW_SECONDS: int = 3600
+    AI_INTERACTIVE_COMMANDS: list = ["continue", "improve", "custom"]
+    
+    # Retrieval index used to assemble AI context from pages
+    RETRIEVAL_CHUNK_WORDS: int = 120
+    AI_CONTEXT_TOKEN_BUDGET: int = 1500
+    AI_CONTEXT_RELATED_PAGES: int = 3
+    
+    # Outbound HTTP (Claude, OAuth providers) through one pooled client
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 100
+    HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_CLIENT_TIMEOUT_SECONDS: float = 30.0
+    HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    HTTP_CLIENT_HTTP2: bool = True
+    HTTP_CLIENT_RETRIES: int = 2
+    HTTP_CLIENT_BACKOFF_BASE_SECONDS: float = 0.2
+    HTTP_CLIENT_BACKOFF_MAX_SECONDS: float = 5.0
+    HTTP_CLIENT_BREAKER_FAILURES: int = 5
+    HTTP_CLIENT_BREAKER_RESET_SECONDS: float = 30.0
     
     # OAuth2
     GOOGLE_CLIENT_ID: Optional[str] = os.getenv("GOOGLE_CLIENT_ID")
@@ -34,6 +96,69 @@ class Settings(BaseSettings):
     SENDGRID_API_KEY: Optional[str] = os.getenv("SENDGRID_API_KEY")
     SENDGRID_SENDER_EMAIL: Optional[str] = os.getenv("SENDGRID_SENDER_EMAIL")
     
+    # Email outbox: transport is sendgrid, smtp, file or console (default: sendgrid when a key is set, else none)
+    EMAIL_TRANSPORT: Optional[str] = None
+    EMAIL_FILE_DIR: str = "outbox_mail"
+    SMTP_HOST: str = "localhost"
+    SMTP_PORT: int = 1025
+    SMTP_USERNAME: Optional[str] = None
+    SMTP_PASSWORD: Optional[str] = None
+    SMTP_STARTTLS: bool = False
+    EMAIL_BATCH_SIZE: int = 50
+    EMAIL_MAX_ATTEMPTS: int = 6
+    EMAIL_RETRY_BASE_SECONDS: float = 30.0
+    EMAIL_RETRY_MAX_SECONDS: float = 3600.0
+    EMAIL_CLAIM_TIMEOUT_SECONDS: int = 600
+    EMAIL_POLL_INTERVAL_SECONDS: float = 30.0
+    
+    # Celery workers share REDIS_URL; when disabled, background work runs in the API process
+    CELERY_ENABLED: bool = False
+    CELERY_BROKER_URL: Optional[str] = None
+    JOBS_INPROCESS_WORKERS: int = 2
+    JOBS_REDISPATCH_AFTER_SECONDS: int = 120
+    PAGE_VERSIONS_KEEP: int = 50
+    
+    # Bulk page operations
+    PAGE_BULK_BATCH_SIZE: int = 500
+    PAGE_DUPLICATE_INLINE_LIMIT: int = 500
+    PAGE_BATCH_MAX_OPS: int = 500
+    # Archived pages are deleted for good after this many days
+    PAGE_ARCHIVE_RETENTION_DAYS: int = 30
+    PAGE_PURGE_INTERVAL_SECONDS: int = 3600
+    # Exports run as background jobs are written here and deleted after EXPORT_RETENTION_HOURS
+    EXPORT_DIR: str = "exports"
+    EXPORT_RETENTION_HOURS: int = 24
+    # Uploads wait here for their import job; Celery workers must see the same directory
+    IMPORT_DIR: str = "imports"
+    IMPORT_MAX_UPLOAD_BYTES: int = 1024 * 1024 * 1024
+    IMPORT_MAX_PAGE_BYTES: int = 5 * 1024 * 1024
+    IMPORT_BATCH_SIZE: int = 2000
+    
+    # Change feed behind GET /api/sync. Changes younger than the settle time are
+    # held back; it must exceed the time between logging a change and its commit
+    CHANGE_FEED_SETTLE_SECONDS: float = 5.0
+    CHANGE_FEED_RETENTION_DAYS: int = 30
+    SYNC_MAX_CHANGES: int = 1000
+    
+    # Rendered public pages, shared through Redis when enabled
+    PUBLIC_PAGE_CACHE_ENABLED: bool = True
+    PUBLIC_PAGE_CACHE_MAX_ENTRIES: int = 1000
+    PUBLIC_PAGE_CACHE_TTL_SECONDS: int = 60
+    # How often the cache reads the change feed for pages changed by other processes
+    PUBLIC_PAGE_CACHE_POLL_SECONDS: float = 2.0
+    PUBLIC_PAGE_CACHE_REDIS_ENABLED: bool = False
+    
+    # Collaborations this recent rank their users first in directory search
+    USER_SEARCH_RECENT_DAYS: int = 90
+    # Shorter queries and deeper pages would let a client list the whole directory
+    USER_SEARCH_MIN_QUERY_LENGTH: int = 2
+    USER_SEARCH_MAX_OFFSET: int = 100
+    
+    # Where the links in notification emails point
+    FRONTEND_URL: str = "http://localhost:3000"
+    # Email users when they are newly @mentioned on a page they can read
+    MENTION_EMAILS_ENABLED: bool = True
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
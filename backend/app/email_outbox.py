@@ -0,0 +1,169 @@
+import random
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import OutboxEmail
+from app.email_transports import PermanentEmailError, get_transport
+from app.celery_app import celery_app
+from app.metrics import metrics
+
+def enqueue_email(db: Session, to_email: str, subject: str, content: str) -> OutboxEmail:
+    """Add an email to the outbox. It is sent once the caller's transaction commits."""
+    email = OutboxEmail(to_email=to_email, subject=subject, content=content, next_attempt_at=datetime.utcnow())
+    db.add(email)
+    return email
+
+def retry_delay(attempts: int) -> float:
+    """Seconds until the next attempt, exponential with jitter."""
+    ceiling = min(settings.EMAIL_RETRY_MAX_SECONDS, settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+def claim_batch(db: Session, batch_size: int) -> List[OutboxEmail]:
+    """Mark up to `batch_size` due emails as sending.
+
+    Emails left in `sending` by a worker that died are claimed again after
+    EMAIL_CLAIM_TIMEOUT_SECONDS. On PostgreSQL concurrent workers skip each
+    other's rows instead of waiting on them.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=settings.EMAIL_CLAIM_TIMEOUT_SECONDS)
+    emails = db.query(OutboxEmail).filter(
+        or_(
+            and_(OutboxEmail.status == "pending", OutboxEmail.next_attempt_at <= now),
+            and_(OutboxEmail.status == "sending", OutboxEmail.claimed_at < stale)
+        )
+    ).order_by(OutboxEmail.next_attempt_at).limit(batch_size).with_for_update(skip_locked=True).all()
+
+    for email in emails:
+        email.status = "sending"
+        email.claimed_at = now
+    db.commit()
+    return emails
+
+def deliver_batch(db: Session, emails: List[OutboxEmail]) -> dict:
+    counts = {"sent": 0, "retry": 0, "failed": 0}
+    with get_transport() as transport:
+        for email in emails:
+            email.attempts += 1
+            try:
+                transport.send(email.to_email, email.subject, email.content)
+            except PermanentEmailError as e:
+                email.status = "failed"
+                email.last_error = str(e)
+            except Exception as e:
+                email.last_error = str(e)
+                if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+                    email.status = "failed"
+                else:
+                    email.status = "pending"
+                    email.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(email.attempts))
+            else:
+                email.status = "sent"
+                email.sent_at = datetime.utcnow()
+                email.last_error = None
+
+            outcome = "retry" if email.status == "pending" else email.status
+            counts[outcome] += 1
+            metrics.inc("emails", outcome=outcome)
+            # Commit per email so a crash mid-batch does not send the earlier ones twice
+            db.commit()
+    return counts
+
+def deliver_outbox(max_batches: int = 20) -> dict:
+    """Send due emails in batches until none are left. Safe to run in several workers."""
+    totals = {"sent": 0, "retry": 0, "failed": 0}
+    db = SessionLocal()
+    try:
+        for _ in range(max_batches):
+            emails = claim_batch(db, settings.EMAIL_BATCH_SIZE)
+            if not emails:
+                break
+            try:
+                counts = deliver_batch(db, emails)
+            except Exception as e:
+                # The transport could not be opened; that counts as an attempt for the unsent emails
+                print(f"[EmailOutbox] Delivery failed: {e}")
+                db.rollback()
+                for email in emails:
+                    if email.status == "sending":
+                        email.attempts += 1
+                        email.last_error = str(e)
+                        if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+                            email.status = "failed"
+                            metrics.inc("emails", outcome="failed")
+                        else:
+                            email.status = "pending"
+                            email.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(email.attempts))
+                db.commit()
+                break
+            for outcome, count in counts.items():
+                totals[outcome] += count
+    finally:
+        db.close()
+    return totals
+
+@celery_app.task(name="email_outbox.deliver")
+def deliver_outbox_task():
+    return deliver_outbox()
+
+class OutboxWorker:
+    """Delivers the outbox from the API process when Celery is not enabled.
+
+    It runs when woken after an email is enqueued and every
+    EMAIL_POLL_INTERVAL_SECONDS for retries that come due.
+    """
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def wake(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await run_in_threadpool(deliver_outbox)
+            except Exception as e:
+                print(f"[EmailOutbox] Delivery run failed: {e}")
+
+def request_delivery():
+    """Have pending emails delivered soon, by a Celery worker or in-process."""
+    if settings.CELERY_ENABLED:
+        try:
+            deliver_outbox_task.apply_async(retry=False)
+        except Exception as e:
+            # The periodic delivery run picks the email up later
+            print(f"[EmailOutbox] Could not queue delivery: {e}")
+    else:
+        outbox_worker.wake()
+
+# Global in-process outbox worker instance
+outbox_worker = OutboxWorker(poll_interval=settings.EMAIL_POLL_INTERVAL_SECONDS)
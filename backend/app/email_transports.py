@@ -0,0 +1,164 @@
+import os
+import smtplib
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Optional
+import httpx
+
+from app.config import settings
+
+class PermanentEmailError(Exception):
+    """The transport rejected a message in a way that retrying will not fix."""
+
+def build_message(to_email: str, subject: str, content: str, sender: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = to_email
+    message["Subject"] = subject
+    message.set_content(content)
+    return message
+
+class EmailTransport:
+    """Sends outbox emails. A transport is opened once per batch and closed after it."""
+
+    def __init__(self, sender: str):
+        self.sender = sender
+
+    def open(self):
+        pass
+
+    def send(self, to_email: str, subject: str, content: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ConsoleTransport(EmailTransport):
+    """Prints emails, reset links included, for development without any mail service.
+
+    Only used when EMAIL_TRANSPORT=console is set explicitly.
+    """
+
+    def send(self, to_email: str, subject: str, content: str):
+        print(f"[Email] To: {to_email}\n[Email] Subject: {subject}\n{content}\n")
+
+class FileTransport(EmailTransport):
+    """Writes each email as an .eml file, for tests and local inspection."""
+
+    def __init__(self, sender: str, directory: str):
+        super().__init__(sender)
+        self.directory = directory
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def send(self, to_email: str, subject: str, content: str):
+        message = build_message(to_email, subject, content, self.sender)
+        name = f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')}-{to_email.replace('@', '_at_')}.eml"
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(message.as_bytes())
+
+class SMTPTransport(EmailTransport):
+    """Sends through an SMTP server over one connection per batch, e.g. a local MailHog."""
+
+    def __init__(self, sender: str, host: str, port: int, username: Optional[str] = None,
+                 password: Optional[str] = None, starttls: bool = False):
+        super().__init__(sender)
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.connection: Optional[smtplib.SMTP] = None
+
+    def open(self):
+        self.connection = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            self.connection.starttls()
+        if self.username:
+            self.connection.login(self.username, self.password or "")
+
+    def send(self, to_email: str, subject: str, content: str):
+        try:
+            self.connection.send_message(build_message(to_email, subject, content, self.sender))
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentEmailError(str(e))
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except smtplib.SMTPException:
+                pass
+            self.connection = None
+
+class SendGridTransport(EmailTransport):
+    """Sends through the SendGrid v3 API, reusing one keep-alive connection per batch."""
+
+    API_URL = "https://api.sendgrid.com/v3/mail/send"
+
+    def __init__(self, sender: str, api_key: str):
+        super().__init__(sender)
+        self.api_key = api_key
+        self.client: Optional[httpx.Client] = None
+
+    def open(self):
+        self.client = httpx.Client(
+            timeout=httpx.Timeout(settings.HTTP_CLIENT_TIMEOUT_SECONDS, connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS),
+            headers={"Authorization": f"Bearer {self.api_key}"}
+        )
+
+    def send(self, to_email: str, subject: str, content: str):
+        resp = self.client.post(
+            self.API_URL,
+            json={
+                "personalizations": [
+                    {"to": [{"email": to_email}]}
+                ],
+                "from": {"email": self.sender},
+                "subject": subject,
+                "content": [
+                    {"type": "text/plain", "value": content}
+                ]
+            }
+        )
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise RuntimeError(f"SendGrid error {resp.status_code}: {resp.text[:200]}")
+        if resp.status_code >= 400:
+            raise PermanentEmailError(f"SendGrid rejected the email ({resp.status_code}): {resp.text[:200]}")
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+def get_transport() -> EmailTransport:
+    """The transport selected by EMAIL_TRANSPORT, or SendGrid when it has an API key."""
+    sender = settings.SENDGRID_SENDER_EMAIL or "no-reply@localhost"
+    name = settings.EMAIL_TRANSPORT or ("sendgrid" if settings.SENDGRID_API_KEY else None)
+
+    if name is None:
+        # Printing would put reset links in the logs, so that is never a fallback
+        raise ValueError("No email transport configured: set EMAIL_TRANSPORT or SENDGRID_API_KEY")
+
+    if name == "sendgrid":
+        if not settings.SENDGRID_API_KEY or not settings.SENDGRID_SENDER_EMAIL:
+            raise ValueError("SendGrid transport needs SENDGRID_API_KEY and SENDGRID_SENDER_EMAIL")
+        return SendGridTransport(sender, settings.SENDGRID_API_KEY)
+    if name == "smtp":
+        return SMTPTransport(
+            sender, settings.SMTP_HOST, settings.SMTP_PORT,
+            settings.SMTP_USERNAME, settings.SMTP_PASSWORD, settings.SMTP_STARTTLS
+        )
+    if name == "file":
+        return FileTransport(sender, settings.EMAIL_FILE_DIR)
+    if name == "console":
+        return ConsoleTransport(sender)
+    raise ValueError(f"Unknown email transport: {name}")
@@ -0,0 +1,83 @@
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional
+
+# Events that only matter live; they get a sequence number but are never replayed
+EPHEMERAL_EVENTS = {"cursor_position", "typing_start", "typing_stop"}
+
+class PageEventLog:
+    """Sequence counter and bounded ring buffer of recent events for one page."""
+
+    def __init__(self, max_events: int):
+        # The epoch changes whenever the log is recreated, so sequence numbers
+        # from a pruned log or a previous process are never mistaken as current
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.events: deque = deque(maxlen=max_events)
+        # Highest sequence number of a replayable event that fell out of the buffer
+        self.evicted_seq = 0
+        self.idle_since: Optional[float] = None
+
+    def append(self, message: dict) -> int:
+        """Stamp a message with the next sequence number and remember it."""
+        self.seq += 1
+        message["seq"] = self.seq
+
+        if message["type"] not in EPHEMERAL_EVENTS:
+            if len(self.events) == self.events.maxlen:
+                self.evicted_seq = self.events[0]["seq"]
+            self.events.append(message)
+
+        return self.seq
+
+    def events_since(self, last_seq: int) -> Optional[List[dict]]:
+        """Events a client that has seen `last_seq` missed, or None if they are gone."""
+        if last_seq > self.seq or last_seq < self.evicted_seq:
+            return None
+
+        missed = [event for event in self.events if event["seq"] > last_seq]
+
+        # Only the newest page_update matters, each one carries the full content
+        last_update = max(
+            (i for i, event in enumerate(missed) if event["type"] == "page_update"),
+            default=None
+        )
+        return [
+            event for i, event in enumerate(missed)
+            if event["type"] != "page_update" or i == last_update
+        ]
+
+class EventLogRegistry:
+    """Per-page event logs, kept for a while after a page's last user leaves."""
+
+    def __init__(self, max_events: int, idle_ttl: float):
+        self.max_events = max_events
+        self.idle_ttl = idle_ttl
+        self.logs: Dict[str, PageEventLog] = {}
+
+    def get(self, page_id: str) -> PageEventLog:
+        log = self.logs.get(page_id)
+        if log is None:
+            log = self.logs[page_id] = PageEventLog(self.max_events)
+        log.idle_since = None
+        return log
+
+    def peek(self, page_id: str) -> Optional[PageEventLog]:
+        return self.logs.get(page_id)
+
+    def release(self, page_id: str):
+        """Mark a page as having no connected users."""
+        log = self.logs.get(page_id)
+        if log is not None:
+            log.idle_since = time.monotonic()
+
+    def prune(self):
+        """Drop logs of pages that have had no users for longer than the TTL."""
+        cutoff = time.monotonic() - self.idle_ttl
+        expired = [
+            page_id for page_id, log in self.logs.items()
+            if log.idle_since is not None and log.idle_since < cutoff
+        ]
+        for page_id in expired:
+            del self.logs[page_id]
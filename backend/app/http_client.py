@@ -0,0 +1,245 @@
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+import httpx
+
+from app.config import settings
+from app.metrics import metrics
+
+# Methods that can be repeated without changing the outcome
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+class CircuitBreaker:
+    """Stop calling an upstream after consecutive failures, probe it again after a cool-down."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            # Let a single request through to see whether the upstream recovered
+            self.probing = True
+            return True
+        return False
+
+    def release(self):
+        """End a probe that got no answer either way, e.g. it was cancelled, so another can go."""
+        self.probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+class OutboundHTTP:
+    """App-lifetime HTTP client for calls to Claude and the OAuth providers.
+
+    Connections are pooled and kept alive across requests, with a cap per
+    upstream host. Failed idempotent requests are retried with jittered
+    exponential backoff, and every host has its own circuit breaker.
+    """
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.host_slots: Dict[str, asyncio.Semaphore] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def _create_client(self) -> httpx.AsyncClient:
+        try:
+            import h2  # noqa: F401
+            http2 = settings.HTTP_CLIENT_HTTP2
+        except ImportError:
+            http2 = False
+
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            timeout=httpx.Timeout(
+                settings.HTTP_CLIENT_TIMEOUT_SECONDS,
+                connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS
+            )
+        )
+
+    async def start(self):
+        if self.client is None:
+            self.client = self._create_client()
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily for code running outside the app lifespan, e.g. scripts
+        if self.client is None:
+            self.client = self._create_client()
+        return self.client
+
+    def _slot(self, host: str) -> asyncio.Semaphore:
+        slot = self.host_slots.get(host)
+        if slot is None:
+            slot = self.host_slots[host] = asyncio.Semaphore(settings.HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST)
+        return slot
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(
+                settings.HTTP_CLIENT_BREAKER_FAILURES, settings.HTTP_CLIENT_BREAKER_RESET_SECONDS
+            )
+        return breaker
+
+    def _check_breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breaker(host)
+        if not breaker.allow():
+            metrics.inc("outbound_requests", host=host, outcome="circuit_open")
+            raise CircuitOpenError(f"Circuit breaker open for {host}")
+        return breaker
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        cap = settings.HTTP_CLIENT_BACKOFF_MAX_SECONDS
+        if response is not None and response.headers.get("retry-after", "").isdigit():
+            return min(cap, float(response.headers["retry-after"]))
+        # Full jitter
+        return random.uniform(0, min(cap, settings.HTTP_CLIENT_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    def _record(self, host: str, breaker: CircuitBreaker, started: float, response: Optional[httpx.Response], error: Optional[str] = None):
+        metrics.observe("outbound_request_seconds", time.perf_counter() - started, host=host)
+        if response is not None:
+            metrics.inc("outbound_requests", host=host, outcome=f"{response.status_code // 100}xx")
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        else:
+            metrics.inc("outbound_requests", host=host, outcome=error or "error")
+            breaker.record_failure()
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        idempotent: Optional[bool] = None,
+        retries: Optional[int] = None,
+        **kwargs
+    ) -> httpx.Response:
+        """Send a request, retrying where it is safe to do so.
+
+        Connection failures are always retried, since the request never
+        reached the upstream. Other transport errors and 429/5xx responses
+        are only retried for idempotent requests.
+        """
+        method = method.upper()
+        host = httpx.URL(url).host
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        if retries is None:
+            retries = settings.HTTP_CLIENT_RETRIES
+
+        client = self._get_client()
+        attempt = 0
+        while True:
+            breaker = self._check_breaker(host)
+            started = time.perf_counter()
+            try:
+                async with self._slot(host):
+                    response = await client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                self._record(host, breaker, started, None, "connect_error")
+                if attempt >= retries:
+                    raise
+            except httpx.TransportError:
+                self._record(host, breaker, started, None, "transport_error")
+                if not idempotent or attempt >= retries:
+                    raise
+            except BaseException:
+                # Cancelled, or failed before reaching the upstream; a half-open probe must not stay taken
+                breaker.release()
+                raise
+            else:
+                self._record(host, breaker, started, response)
+                if not (idempotent and response.status_code in RETRYABLE_STATUS_CODES and attempt < retries):
+                    return response
+                await response.aclose()
+                await asyncio.sleep(self._backoff(attempt, response))
+                attempt += 1
+                continue
+
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Stream a response body. Streams are never retried."""
+        host = httpx.URL(url).host
+        breaker = self._check_breaker(host)
+        client = self._get_client()
+        started = time.perf_counter()
+
+        answered = False
+        try:
+            async with self._slot(host):
+                try:
+                    response_cm = client.stream(method, url, **kwargs)
+                    response = await response_cm.__aenter__()
+                except httpx.TransportError:
+                    answered = True
+                    self._record(host, breaker, started, None, "transport_error")
+                    raise
+                answered = True
+                # Latency up to the response headers, the body can take much longer
+                self._record(host, breaker, started, response)
+                try:
+                    yield response
+                finally:
+                    await response_cm.__aexit__(None, None, None)
+        finally:
+            if not answered:
+                # Cancelled, or failed before reaching the upstream; a half-open probe must not stay taken
+                breaker.release()
+
+    def stats(self) -> dict:
+        return {
+            host: {"state": breaker.state, "consecutive_failures": breaker.failures}
+            for host, breaker in self.breakers.items()
+        }
+
+# Global outbound HTTP client instance
+http_client = OutboundHTTP()
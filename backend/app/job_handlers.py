@@ -0,0 +1,173 @@
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Page, PageVersion
+from app.celery_app import celery_app
+from app.jobs import JobContext, job_handler
+from app.page_tree import count_subtree, duplicate_subtree, purge_archived
+from app.page_export import export_zip, safe_name
+from app.page_import import import_archive
+from app.retrieval import retrieval_index, index_pages
+from app.change_feed import record_page_changes, prune_changes
+
+@job_handler("compact_versions", public=True)
+def compact_versions(ctx: JobContext) -> dict:
+    """Delete all but the newest `keep` versions of the user's pages, or of one page."""
+    keep = int(ctx.params.get("keep", settings.PAGE_VERSIONS_KEEP))
+    if keep < 1:
+        raise ValueError("keep must be at least 1")
+
+    query = ctx.db.query(Page.id).filter(Page.owner_id == ctx.user_id)
+    if ctx.params.get("page_id"):
+        query = query.filter(Page.id == ctx.params["page_id"])
+    page_ids = [page_id for (page_id,) in query.all()]
+    if ctx.params.get("page_id") and not page_ids:
+        raise PermissionError("Only the owner can compact a page's versions")
+
+    # Only pages with more versions than we keep need any work
+    counts = dict(
+        ctx.db.query(PageVersion.page_id, func.count(PageVersion.id))
+        .filter(PageVersion.page_id.in_(page_ids))
+        .group_by(PageVersion.page_id)
+        .having(func.count(PageVersion.id) > keep)
+        .all()
+    ) if page_ids else {}
+
+    deleted = 0
+    for i, (page_id, count) in enumerate(counts.items()):
+        newest = ctx.db.query(PageVersion.version_number).filter(
+            PageVersion.page_id == page_id
+        ).order_by(PageVersion.version_number.desc()).offset(keep - 1).limit(1).scalar()
+        deleted += ctx.db.query(PageVersion).filter(
+            PageVersion.page_id == page_id,
+            PageVersion.version_number < newest
+        ).delete(synchronize_session=False)
+        # Commit page by page so progress and deletions advance together
+        ctx.db.commit()
+        ctx.set_progress((i + 1) / len(counts), f"Compacted {i + 1} of {len(counts)} pages")
+
+    return {"pages": len(counts), "deleted_versions": deleted}
+
+@job_handler("duplicate_subtree")
+def duplicate_subtree_job(ctx: JobContext) -> dict:
+    """Deep-copy a page tree that is too large to copy within the request."""
+    page_id = ctx.params["page_id"]
+
+    def progress(done: int, total: int):
+        ctx.set_progress(0.9 * done / total, f"Copied {done} of {total} pages")
+
+    id_map = duplicate_subtree(ctx.db, page_id, ctx.user_id, bool(ctx.params.get("include_versions")), progress)
+    ctx.db.commit()
+    index_pages(ctx.db, retrieval_index, list(id_map.values()))
+    return {"page_id": id_map.get(page_id), "pages_copied": len(id_map)}
+
+@job_handler("export_pages")
+def export_pages_job(ctx: JobContext) -> dict:
+    """Write a subtree export to EXPORT_DIR, for download through GET /api/jobs/{id}/download."""
+    page_id = ctx.params["page_id"]
+    export_format = ctx.params.get("format", "markdown")
+    title = ctx.db.query(Page.title).filter(Page.id == page_id).scalar()
+    total = max(1, count_subtree(ctx.db, page_id))
+    exported = 0
+
+    def progress(done: int):
+        nonlocal exported
+        exported = done
+        ctx.set_progress(done / total, f"Exported {done} of {total} pages")
+
+    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+    # Without a Celery scheduler this is where expired exports get cleaned up
+    prune_exports()
+    path = os.path.join(settings.EXPORT_DIR, f"{ctx.job_id}.zip")
+    try:
+        with open(path, "wb") as f:
+            for chunk in export_zip(ctx.db, page_id, ctx.user_id, export_format, progress):
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return {"file": path, "filename": f"{safe_name(title)}.zip", "pages": exported, "bytes": os.path.getsize(path)}
+
+def prune_exports() -> int:
+    """Delete export files older than EXPORT_RETENTION_HOURS, including ones left by interrupted jobs."""
+    if not os.path.isdir(settings.EXPORT_DIR):
+        return 0
+    cutoff = time.time() - settings.EXPORT_RETENTION_HOURS * 3600
+    deleted = 0
+    for entry in os.scandir(settings.EXPORT_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                deleted += 1
+        except FileNotFoundError:
+            # Another worker removed it first
+            pass
+    return deleted
+
+@job_handler("import_pages")
+def import_pages_job(ctx: JobContext) -> dict:
+    """Import an uploaded zip of Markdown or HTML files; the upload is removed afterwards."""
+    file_path = ctx.params["file"]
+
+    def progress(done: int, total: int):
+        ctx.set_progress(0.9 * done / max(1, total), f"Imported {done} of {total} pages")
+
+    try:
+        result = import_archive(ctx.db, file_path, ctx.user_id, ctx.params.get("parent_id"), progress)
+        # Logged last, so the changes are committed soon after they are logged
+        record_page_changes(ctx.db, result["page_ids"], ctx.user_id)
+        ctx.db.commit()
+    finally:
+        os.remove(file_path)
+    index_pages(ctx.db, retrieval_index, result["page_ids"])
+    return {"pages": result["pages"], "skipped": result["skipped"]}
+
+@job_handler("purge_archived", public=True)
+def purge_archived_job(ctx: JobContext) -> dict:
+    """Delete the user's pages archived more than `older_than_days` ago, for good."""
+    days = float(ctx.params.get("older_than_days", settings.PAGE_ARCHIVE_RETENTION_DAYS))
+    if days < 0:
+        raise ValueError("older_than_days cannot be negative")
+
+    def progress(done: int, total: int):
+        ctx.set_progress(done / total, f"Deleted {done} of {total} pages")
+
+    return purge_archived(ctx.db, datetime.utcnow() - timedelta(days=days), ctx.user_id, progress)
+
+@celery_app.task(name="pages.purge_archived")
+def purge_archived_task():
+    """Delete every page archived longer than the retention period."""
+    cutoff = datetime.utcnow() - timedelta(days=settings.PAGE_ARCHIVE_RETENTION_DAYS)
+    db = SessionLocal()
+    try:
+        reclaimed = purge_archived(db, cutoff)
+    finally:
+        db.close()
+    if reclaimed["pages"]:
+        print(f"[Purge] Deleted {reclaimed['pages']} archived pages and {sum(reclaimed.values()) - reclaimed['pages']} attached rows")
+    return reclaimed
+
+@celery_app.task(name="sync.prune_changes")
+def prune_changes_task():
+    """Delete change feed entries older than the retention period."""
+    cutoff = datetime.utcnow() - timedelta(days=settings.CHANGE_FEED_RETENTION_DAYS)
+    db = SessionLocal()
+    try:
+        deleted = prune_changes(db, cutoff)
+    finally:
+        db.close()
+    if deleted:
+        print(f"[Sync] Pruned {deleted} change feed entries")
+    return deleted
+
+@celery_app.task(name="jobs.prune_exports")
+def prune_exports_task():
+    """Delete export files older than the retention period."""
+    deleted = prune_exports()
+    if deleted:
+        print(f"[Jobs] Deleted {deleted} expired export files")
+    return deleted
@@ -0,0 +1,212 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Job
+from app.celery_app import celery_app
+from app.metrics import metrics
+
+JobHandler = Callable[["JobContext"], Optional[dict]]
+
+# Job type -> handler, filled in by @job_handler
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+# Job types users may submit directly through POST /api/jobs
+PUBLIC_JOB_TYPES = set()
+
+class JobCancelled(Exception):
+    """Raised inside a handler once cancellation of its job was requested."""
+
+def job_handler(job_type: str, public: bool = False):
+    """Register a function as the handler of a job type."""
+    def decorator(func: JobHandler) -> JobHandler:
+        JOB_HANDLERS[job_type] = func
+        if public:
+            PUBLIC_JOB_TYPES.add(job_type)
+        return func
+    return decorator
+
+class JobContext:
+    """What a handler gets: its own database session, the job parameters and progress reporting."""
+
+    def __init__(self, job_id: str, user_id: str, params: dict, db: Session):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.params = params
+        self.db = db
+        self.message: Optional[str] = None
+
+    def _holds_write_lock(self) -> bool:
+        """Whether the handler's session has written on SQLite, which allows one writer at a time."""
+        if self.db.get_bind().dialect.name != "sqlite" or not self.db.in_transaction():
+            return False
+        return self.db.connection().connection.driver_connection.in_transaction
+
+    def set_progress(self, progress: float, message: Optional[str] = None):
+        """Record progress between 0 and 1, and raise JobCancelled if the job was cancelled.
+
+        Progress is written in a separate session so it is visible while the
+        handler's own transaction is still open. On SQLite that session would
+        wait for the handler's write lock, so progress is then only checked
+        for cancellation and written with the first report after a commit.
+        """
+        if message is not None:
+            self.message = message
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == self.job_id).first()
+            if job is None:
+                raise JobCancelled()
+            if not self._holds_write_lock():
+                job.progress = max(0.0, min(1.0, progress))
+                if self.message is not None:
+                    job.message = self.message
+                db.commit()
+            if job.cancel_requested:
+                raise JobCancelled()
+        finally:
+            db.close()
+
+def submit_job(db: Session, user_id: str, job_type: str, params: dict, idempotency_key: Optional[str] = None) -> Job:
+    """Create a job and hand it to a worker.
+
+    A second submission with the same idempotency key returns the job of the
+    first one instead of starting another.
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    if idempotency_key:
+        existing = db.query(Job).filter(Job.user_id == user_id, Job.idempotency_key == idempotency_key).first()
+        if existing is not None:
+            return existing
+
+    job = Job(user_id=user_id, type=job_type, params=params, idempotency_key=idempotency_key)
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent submission with the same key won the race
+        db.rollback()
+        return db.query(Job).filter(Job.user_id == user_id, Job.idempotency_key == idempotency_key).one()
+    db.refresh(job)
+
+    metrics.inc("jobs_submitted", type=job_type)
+    dispatch_job(job.id)
+    return job
+
+def run_job(job_id: str):
+    """Run a queued job to completion. A job that is not queued any more is left alone."""
+    db = SessionLocal()
+    try:
+        # Claim the job; a duplicate delivery of the same job finds it running and stops here
+        claimed = db.query(Job).filter(Job.id == job_id, Job.status == "queued").update(
+            {"status": "running", "started_at": datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+        if not claimed:
+            return
+
+        job = db.query(Job).filter(Job.id == job_id).one()
+        handler = JOB_HANDLERS.get(job.type)
+        context = JobContext(job.id, job.user_id, dict(job.params or {}), db)
+        started = datetime.utcnow()
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job type: {job.type}")
+            if job.cancel_requested:
+                raise JobCancelled()
+            result = handler(context)
+        except JobCancelled:
+            db.rollback()
+            status, result, error = "cancelled", None, None
+        except Exception as e:
+            db.rollback()
+            print(f"[Jobs] Job {job_id} ({job.type}) failed: {e}")
+            status, result, error = "failed", None, str(e)
+        else:
+            status, error = "succeeded", None
+
+        finished = datetime.utcnow()
+        job = db.query(Job).filter(Job.id == job_id).one()
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = finished
+        if status == "succeeded":
+            job.progress = 1.0
+        # The last report may have been held back on SQLite
+        if context.message is not None:
+            job.message = context.message
+        job_type = job.type
+        db.commit()
+        metrics.inc("jobs_finished", type=job_type, status=status)
+        metrics.observe("job_duration_seconds", (finished - started).total_seconds(), type=job_type)
+    finally:
+        db.close()
+
+@celery_app.task(name="jobs.run")
+def run_job_task(job_id: str):
+    run_job(job_id)
+
+@celery_app.task(name="jobs.dispatch_queued")
+def dispatch_queued_task():
+    """Re-send jobs whose dispatch was lost, e.g. because the broker was down."""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.JOBS_REDISPATCH_AFTER_SECONDS)
+    db = SessionLocal()
+    try:
+        job_ids = [job_id for (job_id,) in db.query(Job.id).filter(Job.status == "queued", Job.created_at < cutoff).all()]
+    finally:
+        db.close()
+    for job_id in job_ids:
+        run_job_task.apply_async(args=[job_id])
+
+class InProcessExecutor:
+    """Runs jobs on a thread pool in the API process, for development and tests."""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.pool: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, job_id: str):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self.pool.submit(run_job, job_id)
+
+    def resume(self):
+        """Re-run jobs that were queued, and fail jobs that were running, when the process stopped."""
+        db = SessionLocal()
+        try:
+            interrupted = db.query(Job).filter(Job.status == "running").all()
+            for job in interrupted:
+                job.status = "failed"
+                job.error = "Interrupted by a server restart"
+                job.finished_at = datetime.utcnow()
+            db.commit()
+            queued = [job_id for (job_id,) in db.query(Job.id).filter(Job.status == "queued").all()]
+        finally:
+            db.close()
+        for job_id in queued:
+            self.submit(job_id)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+def dispatch_job(job_id: str):
+    """Hand a job to a Celery worker, or to the in-process executor."""
+    if settings.CELERY_ENABLED:
+        try:
+            run_job_task.apply_async(args=[job_id], retry=False)
+        except Exception as e:
+            # dispatch_queued_task sends it again later
+            print(f"[Jobs] Could not queue job {job_id}: {e}")
+    else:
+        job_executor.submit(job_id)
+
+# Global in-process job executor instance
+job_executor = InProcessExecutor(max_workers=settings.JOBS_INPROCESS_WORKERS)
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import asyncio
+from typing import Optional
+
+class EventLoopMonitor:
+    """Measure event loop lag as the delay of a periodic wake-up past its deadline."""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        # Exponentially weighted moving average, in seconds
+        self.avg_lag = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.avg_lag = 0.9 * self.avg_lag + 0.1 * lag
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def reset_max(self):
+        self.max_lag = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "last_ms": round(self.last_lag * 1000, 3),
+            "avg_ms": round(self.avg_lag * 1000, 3),
+            "max_ms": round(self.max_lag * 1000, 3),
+        }
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # Peak rather than current usage, reported in bytes on macOS and KiB elsewhere
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+    except ImportError:
+        return None
+
+# Global event loop monitor instance
+loop_monitor = EventLoopMonitor()
@@ -1,21 +1,51 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
+from fastapi.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 
 from app.config import settings
 from app.database import engine, Base
-from app.routers import auth, pages, users, ai, websocket
+from app.page_buffer import page_buffer
+from app.page_cache import page_cache
+from app.websocket import manager
+from app.loop_monitor import loop_monitor
+from app.metrics import metrics
+from app.http_client import http_client
+from app.retrieval import retrieval_index, load_retrieval_index
+from app.email_outbox import outbox_worker
+from app.jobs import job_executor
+from app.routers import auth, pages, users, ai, websocket, jobs, sync
 
 # Create database tables
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    Base.metadata.create_all(bind=engine)
+    await run_in_threadpool(Base.metadata.create_all, bind=engine)
+    page_buffer.replay_log()
+    await http_client.start()
+    manager.start_heartbeat()
+    loop_monitor.start()
+    if settings.PUBLIC_PAGE_CACHE_ENABLED:
+        page_cache.start()
+    if not settings.CELERY_ENABLED:
+        outbox_worker.start()
+        outbox_worker.wake()
+        await run_in_threadpool(job_executor.resume)
+    # Index existing pages in the background, requests meanwhile see a partial index
+    index_task = asyncio.create_task(run_in_threadpool(load_retrieval_index, retrieval_index))
     yield
     # Shutdown
-    pass
+    index_task.cancel()
+    await outbox_worker.stop()
+    job_executor.shutdown()
+    await loop_monitor.stop()
+    await page_cache.stop()
+    await manager.stop_heartbeat()
+    await page_buffer.close()
+    await http_client.close()
 
 # Create FastAPI app
 app = FastAPI(
@@ -40,6 +70,8 @@ app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(pages.router, prefix="/api/pages", tags=["Pages"])
 app.include_router(ai.router, prefix="/api/ai", tags=["AI"])
 app.include_router(websocket.router, prefix="/api/ws", tags=["WebSocket"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["Jobs"])
+app.include_router(sync.router, prefix="/api/sync", tags=["Sync"])
 
 @app.get("/")
 async def root():
@@ -54,10 +86,15 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def get_metrics():
+    return {**metrics.snapshot(), "circuit_breakers": http_client.stats()}
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=settings.DEBUG
+        reload=settings.DEBUG,
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE
     ) 
\ No newline at end of file
@@ -0,0 +1,78 @@
+import threading
+from collections import deque
+from typing import Dict, Tuple
+
+def _key(name: str, labels: dict) -> Tuple[str, tuple]:
+    return name, tuple(sorted(labels.items()))
+
+def _format_key(key: Tuple[str, tuple]) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+class Timing:
+    """Count, sum and recent samples of an observed value, for percentiles."""
+
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self, max_samples: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def summary(self) -> dict:
+        samples = sorted(self.samples)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 6) if self.count else 0.0,
+            "p50": round(percentile(50), 6),
+            "p95": round(percentile(95), 6),
+            "p99": round(percentile(99), 6),
+            "max": round(self.max, 6),
+        }
+
+class Metrics:
+    """In-process counters and timings, served at GET /metrics."""
+
+    def __init__(self, max_samples: int = 1024):
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        self.timings: Dict[Tuple[str, tuple], Timing] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = Timing(self.max_samples)
+            timing.observe(value)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "counters": {_format_key(key): value for key, value in sorted(self.counters.items())},
+                "timings": {_format_key(key): timing.summary() for key, timing in sorted(self.timings.items())},
+            }
+
+# Global metrics instance
+metrics = Metrics()
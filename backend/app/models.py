@@ -1,12 +1,18 @@
 import uuid
-from sqlalchemy import Column, String, Text, DateTime, Boolean, ForeignKey, Integer, JSON
-from sqlalchemy.orm import relationship, Mapped, mapped_column
-from sqlalchemy.sql import func
+from sqlalchemy import Column, String, Text, DateTime, Boolean, ForeignKey, Integer, BigInteger, JSON, Index, Float, UniqueConstraint, DDL, event
+from sqlalchemy.orm import relationship, Mapped, mapped_column, selectinload, undefer
+from sqlalchemy.sql import func, text
 from app.database import Base
 
 def generate_uuid() -> str:
     return str(uuid.uuid4())
 
+# Paths and order keys must compare byte by byte, not by the database's locale
+ByteOrderedString = String().with_variant(String(collation="C"), "postgresql")
+
+# SQLite only autoincrements an INTEGER primary key
+ChangeId = BigInteger().with_variant(Integer, "sqlite")
+
 class User(Base):
     __tablename__ = "users"
 
@@ -27,17 +33,51 @@ class User(Base):
     collaborations = relationship("PageCollaboration", back_populates="user", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="author", cascade="all, delete-orphan")
 
+def _trigram_index(name: str, column) -> Index:
+    # GIN trigram index on postgres, for prefix, substring and similarity
+    # matches; a plain expression index elsewhere, for prefix ranges
+    return Index(
+        name, func.lower(column).label(name),
+        postgresql_using="gin", postgresql_ops={name: "gin_trgm_ops"}
+    )
+
+# Directory search, see app.user_directory
+_trigram_index("ix_users_lower_username", User.username)
+_trigram_index("ix_users_lower_full_name", User.full_name)
+_trigram_index("ix_users_lower_email", User.email)
+event.listen(
+    User.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
 class Page(Base):
     __tablename__ = "pages"
+    __table_args__ = (
+        Index("ix_pages_is_archived_archived_at", "is_archived", "archived_at"),
+        Index("ix_pages_parent_id_position", "parent_id", "position"),
+        # Sidebar listings, which never show archived pages
+        Index(
+            "ix_pages_active_owner_id_parent_id_position", "owner_id", "parent_id", "position",
+            postgresql_where=text("is_archived = false"), sqlite_where=text("is_archived = 0")
+        ),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
     title: Mapped[str] = mapped_column(String, nullable=False)
-    content: Mapped[str] = mapped_column(Text, default="")
+    # Deferred, since permission checks and tree walks never read it; queries
+    # that render pages opt in with PAGE_RESPONSE_OPTIONS
+    content: Mapped[str] = mapped_column(Text, default="", deferred=True, deferred_group="content")
     icon: Mapped[str] = mapped_column(String, default="📄")
     parent_id: Mapped[str] = mapped_column(String, ForeignKey("pages.id"), nullable=True)
-    owner_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"), nullable=False)
+    owner_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"), nullable=False, index=True)
+    # Ids from the top-level ancestor down to the page itself, "/<root id>/.../<id>/"
+    path: Mapped[str] = mapped_column(ByteOrderedString, nullable=True, index=True)
+    # Fractional index key among siblings, see app.fractional_index
+    position: Mapped[str] = mapped_column(ByteOrderedString, nullable=True)
     is_public: Mapped[bool] = mapped_column(Boolean, default=False)
     is_archived: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Shared by all pages archived together; the purge job goes by it
+    archived_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=True)
     page_metadata: Mapped[dict] = mapped_column(JSON, default=dict)
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
@@ -45,13 +85,17 @@ class Page(Base):
     # Relationships
     owner = relationship("User", back_populates="pages")
     parent = relationship("Page", remote_side=[id], back_populates="children")
-    children = relationship("Page", back_populates="parent", cascade="all, delete-orphan")
+    children = relationship("Page", back_populates="parent", cascade="all, delete-orphan", order_by="Page.position")
     collaborations = relationship("PageCollaboration", back_populates="page", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="page", cascade="all, delete-orphan")
     versions = relationship("PageVersion", back_populates="page", cascade="all, delete-orphan")
 
 class PageCollaboration(Base):
     __tablename__ = "page_collaborations"
+    __table_args__ = (
+        Index("ix_page_collaborations_page_id_user_id", "page_id", "user_id"),
+        Index("ix_page_collaborations_user_id_page_id", "user_id", "page_id"),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
     page_id: Mapped[str] = mapped_column(String, ForeignKey("pages.id"), nullable=False)
@@ -65,6 +109,9 @@ class PageCollaboration(Base):
 
 class PageVersion(Base):
     __tablename__ = "page_versions"
+    __table_args__ = (
+        Index("ix_page_versions_page_id_version_number", "page_id", "version_number"),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
     page_id: Mapped[str] = mapped_column(String, ForeignKey("pages.id"), nullable=False)
@@ -78,6 +125,10 @@ class PageVersion(Base):
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        Index("ix_comments_page_id_parent_comment_id", "page_id", "parent_comment_id"),
+        Index("ix_comments_parent_comment_id", "parent_comment_id"),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
     page_id: Mapped[str] = mapped_column(String, ForeignKey("pages.id"), nullable=False)
@@ -93,6 +144,21 @@ class Comment(Base):
     parent_comment = relationship("Comment", remote_side=[id], back_populates="replies")
     replies = relationship("Comment", back_populates="parent_comment", cascade="all, delete-orphan")
 
+class PageLink(Base):
+    """A link from a page's content to another page, or a mention of a user, see app.page_links."""
+    __tablename__ = "page_links"
+    __table_args__ = (
+        # What links here, and where a user is mentioned
+        Index("ix_page_links_target_id_kind", "target_id", "kind"),
+    )
+
+    id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
+    source_page_id: Mapped[str] = mapped_column(String, ForeignKey("pages.id"), nullable=False, index=True)
+    kind: Mapped[str] = mapped_column(String, nullable=False)  # page, user
+    # A page id or a user id, depending on kind
+    target_id: Mapped[str] = mapped_column(String, nullable=False)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
+
 class UserSession(Base):
     __tablename__ = "user_sessions"
 
@@ -109,7 +175,72 @@ class PasswordResetToken(Base):
     id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
     user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"), nullable=False)
     token: Mapped[str] = mapped_column(String, unique=True, nullable=False)
-    expires_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
+    expires_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    user = relationship("User") 
+
+class OutboxEmail(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
+    to_email: Mapped[str] = mapped_column(String, nullable=False)
+    subject: Mapped[str] = mapped_column(String, nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(String, default="pending", nullable=False)  # pending, sending, sent, failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+    next_attempt_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    claimed_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=True)
+    sent_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
-    user = relationship("User") 
\ No newline at end of file
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        UniqueConstraint("user_id", "idempotency_key", name="uq_jobs_user_idempotency_key"),
+    )
+
+    id: Mapped[str] = mapped_column(String, primary_key=True, default=generate_uuid)
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"), nullable=False, index=True)
+    type: Mapped[str] = mapped_column(String, nullable=False)
+    status: Mapped[str] = mapped_column(String, default="queued", nullable=False)  # queued, running, succeeded, failed, cancelled
+    params: Mapped[dict] = mapped_column(JSON, default=dict)
+    progress: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    message: Mapped[str] = mapped_column(String, nullable=True)
+    result: Mapped[dict] = mapped_column(JSON, nullable=True)
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+    idempotency_key: Mapped[str] = mapped_column(String, nullable=True)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class PageChange(Base):
+    __tablename__ = "page_changes"
+    __table_args__ = (
+        Index("ix_page_changes_owner_id_id", "owner_id", "id"),
+        Index("ix_page_changes_page_id_id", "page_id", "id"),
+    )
+
+    # Increasing ids are the cursors of GET /api/sync
+    id: Mapped[int] = mapped_column(ChangeId, primary_key=True, autoincrement=True)
+    entity: Mapped[str] = mapped_column(String, nullable=False)  # page, comment, collaboration
+    entity_id: Mapped[str] = mapped_column(String, nullable=False)
+    # No foreign keys, the log outlives purged pages
+    page_id: Mapped[str] = mapped_column(String, nullable=False)
+    owner_id: Mapped[str] = mapped_column(String, nullable=False)
+    op: Mapped[str] = mapped_column(String, nullable=False)  # upsert, delete
+    user_id: Mapped[str] = mapped_column(String, nullable=True)  # who made the change, if anyone
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+# Query options for pages rendered as PageResponse: content for the pages
+# and the whole tree of sub-pages below them, one query per level.
+# Built after all models, as building them configures the mappers
+PAGE_RESPONSE_OPTIONS = (
+    undefer(Page.content),
+    selectinload(Page.children, recursion_depth=-1).undefer(Page.content),
+)
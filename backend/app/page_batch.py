@@ -0,0 +1,235 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Page, PageVersion, generate_uuid
+from app.page_tree import TreeError, archive_subtree, last_positions, move_subtree, next_position, page_path
+from app.fractional_index import key_between
+from app.change_feed import record_page_changes
+from app.page_links import update_page_links
+from app.schemas import BatchOp
+
+# A page that needs several permissions in one batch needs the strongest
+PERMISSION_RANK = {"read": 0, "write": 1, "admin": 2}
+
+UPDATE_FIELDS = ("title", "content", "icon", "is_public")
+TREE_FIELDS = {"title", "icon", "parent_id", "is_archived"}
+
+class BatchError(ValueError):
+    """A batch that is malformed, e.g. an unknown ref or a move that creates a cycle."""
+
+class BatchPlan:
+    """The ops of a batch merged into one set of values per page.
+
+    Ops on a page created earlier in the same batch are folded into its
+    insert, so every page is written once whatever the number of ops.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.refs: Dict[str, str] = {}
+        self.new_pages: Dict[str, dict] = {}
+        self.changes: Dict[str, dict] = {}
+        self.moves: Dict[str, Optional[str]] = {}
+        self.required: Dict[str, str] = {}
+        self.results: List[dict] = []
+        self.archive_roots: List[str] = []
+        # Filled in by apply_batch with every page an archive op reached
+        self.archived: List[str] = []
+        # and with the users newly mentioned on each page
+        self.mentions: Dict[str, Set[str]] = {}
+        # and with the parents moved pages had before
+        self.old_parents: Dict[str, Optional[str]] = {}
+
+    def require(self, page_id: str, permission: str):
+        if page_id in self.new_pages:
+            return
+        current = self.required.get(page_id)
+        if current is None or PERMISSION_RANK[permission] > PERMISSION_RANK[current]:
+            self.required[page_id] = permission
+
+    def resolve(self, page_id: Optional[str]) -> Optional[str]:
+        """Map a ref to the id of the page created for it."""
+        return self.refs.get(page_id, page_id)
+
+    def values_for(self, page_id: str) -> dict:
+        if page_id in self.new_pages:
+            return self.new_pages[page_id]
+        return self.changes.setdefault(page_id, {})
+
+    @property
+    def content_changed(self) -> Set[str]:
+        return {page_id for page_id, values in self.changes.items() if "content" in values}
+
+    @property
+    def tree_changed(self) -> Set[str]:
+        return set(self.new_pages) | {
+            page_id for page_id, values in self.changes.items() if values.keys() & TREE_FIELDS
+        }
+
+    @property
+    def reindexed(self) -> Set[str]:
+        return set(self.new_pages) | {
+            page_id for page_id, values in self.changes.items()
+            if values.keys() & {"title", "content", "is_archived"}
+        }
+
+def plan_batch(ops: List[BatchOp], user_id: str) -> BatchPlan:
+    """Validate the ops and work out what to write and which permissions that needs."""
+    plan = BatchPlan(user_id)
+    now = datetime.utcnow()
+    for i, op in enumerate(ops):
+        if op.op == "create":
+            if op.title is None:
+                raise BatchError(f"Op {i}: create needs a title")
+            if op.ref is not None and op.ref in plan.refs:
+                raise BatchError(f"Op {i}: duplicate ref {op.ref}")
+            page_id = generate_uuid()
+            parent_id = plan.resolve(op.parent_id)
+            if parent_id is not None:
+                plan.require(parent_id, "write")
+            plan.new_pages[page_id] = {
+                "id": page_id,
+                "title": op.title,
+                "content": op.content or "",
+                "icon": op.icon or "📄",
+                "parent_id": parent_id,
+                "owner_id": user_id,
+                "is_public": bool(op.is_public),
+                "is_archived": False,
+                "page_metadata": {},
+                "created_at": now,
+            }
+            if op.ref is not None:
+                plan.refs[op.ref] = page_id
+            plan.results.append({"op": op.op, "page_id": page_id})
+            continue
+
+        if op.page_id is None:
+            raise BatchError(f"Op {i}: {op.op} needs a page_id")
+        page_id = plan.resolve(op.page_id)
+        values = plan.values_for(page_id)
+
+        if op.op == "update":
+            fields = {
+                field: getattr(op, field) for field in UPDATE_FIELDS
+                if field in op.model_fields_set and getattr(op, field) is not None
+            }
+            if not fields:
+                raise BatchError(f"Op {i}: update has nothing to change")
+            values.update(fields)
+            plan.require(page_id, "write")
+        elif op.op == "move":
+            if "parent_id" not in op.model_fields_set:
+                raise BatchError(f"Op {i}: move needs a parent_id, null for the top level")
+            parent_id = plan.resolve(op.parent_id)
+            if parent_id == page_id:
+                raise BatchError(f"Op {i}: a page cannot be its own parent")
+            values["parent_id"] = parent_id
+            # Moves of new pages are folded into their insert
+            if page_id not in plan.new_pages:
+                plan.moves[page_id] = parent_id
+            plan.require(page_id, "write")
+            if parent_id is not None:
+                plan.require(parent_id, "write")
+        else:
+            # New pages are archived after their insert, together with any children
+            if page_id not in plan.new_pages:
+                values["is_archived"] = True
+            plan.archive_roots.append(page_id)
+            plan.require(page_id, "admin")
+        plan.results.append({"op": op.op, "page_id": page_id})
+
+    return plan
+
+def insertion_order(new_pages: Dict[str, dict]) -> List[dict]:
+    """New pages with every parent ahead of its children."""
+    ordered: List[dict] = []
+    placed: Set[str] = set()
+    remaining = list(new_pages.values())
+    while remaining:
+        pending = []
+        for values in remaining:
+            if values["parent_id"] in new_pages and values["parent_id"] not in placed:
+                pending.append(values)
+            else:
+                ordered.append(values)
+                placed.add(values["id"])
+        if len(pending) == len(remaining):
+            raise BatchError("The new pages are moved into a cycle")
+        remaining = pending
+    return ordered
+
+def apply_batch(db: Session, plan: BatchPlan):
+    """Write a checked plan with bulk statements, without committing."""
+    batch_size = settings.PAGE_BULK_BATCH_SIZE
+    now = datetime.utcnow()
+
+    # Keep the content being replaced as a version, as a single update does
+    content_changed = list(plan.content_changed)
+    if content_changed:
+        current = dict(db.query(Page.id, Page.content).filter(Page.id.in_(content_changed)).all())
+        last_versions = dict(
+            db.query(PageVersion.page_id, func.max(PageVersion.version_number))
+            .filter(PageVersion.page_id.in_(content_changed))
+            .group_by(PageVersion.page_id)
+            .all()
+        )
+        versions = [
+            {
+                "id": generate_uuid(),
+                "page_id": page_id,
+                "content": current[page_id],
+                "version_number": (last_versions.get(page_id) or 0) + 1,
+                "created_by": plan.user_id,
+                "created_at": now,
+            }
+            for page_id in content_changed
+            if plan.changes[page_id]["content"] != current[page_id]
+        ]
+        if versions:
+            db.execute(insert(PageVersion), versions)
+
+    new_pages = insertion_order(plan.new_pages)
+    # New pages go last under their parents, in the order they were created
+    existing_parents = {values["parent_id"] for values in new_pages if values["parent_id"] not in plan.new_pages}
+    paths = {}
+    for parent in db.query(Page.id, Page.path, Page.is_archived).filter(Page.id.in_(existing_parents - {None})).all():
+        if parent.is_archived:
+            raise BatchError(f"Page {parent.id} is archived and cannot take new pages")
+        paths[parent.id] = parent.path
+    positions = last_positions(db, plan.user_id, existing_parents)
+    for values in new_pages:
+        parent_id = values["parent_id"]
+        values["path"] = paths[values["id"]] = page_path(paths.get(parent_id), values["id"])
+        values["position"] = positions[parent_id] = key_between(positions.get(parent_id), None)
+    for start in range(0, len(new_pages), batch_size):
+        db.execute(insert(Page), new_pages[start:start + batch_size])
+
+    # Archiving cascades over subtrees, so it is a statement of its own
+    # Moves rewrite subtree paths, so they too run on their own
+    own_statements = {"is_archived", "parent_id"}
+    changes = [
+        {"id": page_id, **{field: value for field, value in values.items() if field not in own_statements}, "updated_at": now}
+        for page_id, values in plan.changes.items()
+        if values.keys() - own_statements
+    ]
+    for start in range(0, len(changes), batch_size):
+        db.execute(update(Page), changes[start:start + batch_size])
+    if plan.moves:
+        plan.old_parents = dict(db.query(Page.id, Page.parent_id).filter(Page.id.in_(list(plan.moves))).all())
+    for page_id, parent_id in plan.moves.items():
+        try:
+            move_subtree(db, page_id, parent_id, next_position(db, parent_id, plan.user_id))
+        except TreeError as e:
+            raise BatchError(f"Moving page {page_id}: {e}")
+    if plan.archive_roots:
+        plan.archived = archive_subtree(db, plan.archive_roots)
+    plan.mentions = update_page_links(db, {
+        page_id: values["content"] or ""
+        for page_id, values in [*plan.new_pages.items(), *plan.changes.items()]
+        if "content" in values
+    })
+    record_page_changes(db, [*plan.new_pages, *plan.changes, *plan.archived], plan.user_id)
@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional, Set
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.orm import undefer
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import User, Page, PageVersion
+from app.retrieval import retrieval_index
+from app.change_feed import record_page_changes
+from app.page_links import update_page_links, notify_mentions
+
+def write_page_content(page_id: str, content: str, user_id: Optional[str], create_version: bool) -> bool:
+    """Persist buffered content to a page. Returns False if the page no longer exists."""
+    db = SessionLocal()
+    try:
+        page = db.query(Page).options(undefer(Page.content)).filter(Page.id == page_id).first()
+        if page is None:
+            return False
+        if page.content == content:
+            return True
+
+        if create_version and user_id:
+            # Numbered after the newest version, older ones may have been compacted away
+            last_version = db.query(func.max(PageVersion.version_number)).filter(
+                PageVersion.page_id == page_id
+            ).scalar()
+            db.add(PageVersion(
+                page_id=page_id,
+                content=page.content,
+                version_number=(last_version or 0) + 1,
+                created_by=user_id
+            ))
+
+        page.content = content
+        setattr(page, "updated_at", datetime.utcnow())
+        record_page_changes(db, [page_id], user_id)
+        mentions = update_page_links(db, {page_id: content})
+        if mentions:
+            # Delivered by the next outbox run, this runs off the event loop
+            notify_mentions(db, mentions, db.get(User, user_id) if user_id else None)
+        db.commit()
+        retrieval_index.update_page(page.id, page.title, content, page.is_archived)
+        return True
+    finally:
+        db.close()
+
+class PageWriteBuffer:
+    """Write-behind buffer for page content edited over WebSocket.
+
+    Socket edits only replace the pending content of a page in memory, so a
+    page is written at most once per flush interval no matter how fast people
+    type. Every edit is also appended to a local log, which is replayed on
+    startup to recover edits that were buffered when the process died.
+    """
+
+    def __init__(self, flush_interval: float, log_path: Optional[str], create_versions: bool = False):
+        self.flush_interval = flush_interval
+        self.log_path = log_path
+        self.create_versions = create_versions
+        # Pending edits by page_id: {"content", "user_id", "dirty_since"}
+        self.dirty: Dict[str, dict] = {}
+        # Edits taken out of `dirty` whose DB write has not committed yet
+        self.flushing: Dict[str, dict] = {}
+        # Pages whose in-flight flush was overtaken by an HTTP update, so it must not be retried
+        self.superseded: Set[str] = set()
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.log_file = None
+        self.log_size = 0
+
+    # Append log
+
+    def _open_log(self):
+        if self.log_path and self.log_file is None:
+            self.log_file = open(self.log_path, "a", encoding="utf-8")
+            self.log_size = self.log_file.tell()
+
+    def _append_log(self, page_id: str, entry: dict):
+        if not self.log_path:
+            return
+        self._open_log()
+        line = json.dumps({"page_id": page_id, **entry}) + "\n"
+        self.log_file.write(line)
+        self.log_file.flush()
+        self.log_size += len(line)
+
+        if self.log_size > settings.PAGE_BUFFER_LOG_MAX_BYTES:
+            self._compact_log()
+
+    def _compact_log(self):
+        """Rewrite the log so it only holds edits that are not yet committed."""
+        if not self.log_path:
+            return
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+        entries = {page_id: entry for page_id, entry in self.flushing.items() if page_id not in self.superseded}
+        entries.update(self.dirty)
+        tmp_path = f"{self.log_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for page_id, entry in entries.items():
+                f.write(json.dumps({"page_id": page_id, **entry}) + "\n")
+        os.replace(tmp_path, self.log_path)
+        self._open_log()
+
+    def replay_log(self):
+        """Write edits left in the log by a previous process, then truncate it."""
+        if not self.log_path or not os.path.exists(self.log_path):
+            return
+
+        latest: Dict[str, dict] = {}
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    continue
+                page_id = record.pop("page_id")
+                if record.get("discarded"):
+                    latest.pop(page_id, None)
+                else:
+                    latest[page_id] = record
+
+        for page_id, entry in latest.items():
+            try:
+                write_page_content(page_id, entry["content"], entry.get("user_id"), self.create_versions)
+            except Exception as e:
+                print(f"[PageBuffer] Failed to replay edit for page {page_id}: {e}")
+                self.dirty[page_id] = entry
+
+        self._compact_log()
+        if latest:
+            print(f"[PageBuffer] Replayed {len(latest)} buffered page edit(s)")
+
+    # Buffering
+
+    def mark_dirty(self, page_id: str, content: str, user_id: str):
+        """Record the latest content of a page and schedule its flush."""
+        entry = {"content": content, "user_id": user_id, "dirty_since": time.time()}
+        previous = self.dirty.get(page_id)
+        if previous is not None:
+            entry["dirty_since"] = previous["dirty_since"]
+        self.dirty[page_id] = entry
+        self._append_log(page_id, entry)
+
+        if page_id not in self.timers:
+            self._schedule_flush(page_id, self.flush_interval)
+
+    def _schedule_flush(self, page_id: str, delay: float):
+        loop = asyncio.get_running_loop()
+        self.timers[page_id] = loop.call_later(
+            delay, lambda: asyncio.create_task(self.flush_page(page_id))
+        )
+
+    def pending_content(self, page_id: str) -> Optional[str]:
+        """Latest content of a page that may not have reached the database yet."""
+        entry = self.dirty.get(page_id) or self.flushing.get(page_id)
+        return entry["content"] if entry else None
+
+    async def discard(self, page_id: str):
+        """Drop buffered edits for a page, e.g. ahead of an authoritative HTTP update.
+
+        The log gets a tombstone so a replay does not bring the edits back. A
+        flush already writing the page is waited for, so the update commits
+        after it, and is not retried if it fails.
+        """
+        dropped = self.dirty.pop(page_id, None)
+        timer = self.timers.pop(page_id, None)
+        if timer is not None:
+            timer.cancel()
+        if dropped is None and page_id not in self.flushing:
+            return
+
+        self._append_log(page_id, {"discarded": True})
+        if page_id in self.flushing:
+            self.superseded.add(page_id)
+            async with self.locks.setdefault(page_id, asyncio.Lock()):
+                pass
+
+    # Flushing
+
+    async def flush_page(self, page_id: str):
+        """Write the pending content of a page to the database."""
+        timer = self.timers.pop(page_id, None)
+        if timer is not None:
+            timer.cancel()
+
+        lock = self.locks.setdefault(page_id, asyncio.Lock())
+        async with lock:
+            entry = self.dirty.pop(page_id, None)
+            if entry is None:
+                return
+
+            self.flushing[page_id] = entry
+            try:
+                await run_in_threadpool(
+                    write_page_content, page_id, entry["content"], entry["user_id"], self.create_versions
+                )
+            except Exception as e:
+                print(f"[PageBuffer] Failed to flush page {page_id}: {e}")
+                # Keep the edit unless a newer one arrived or an update replaced it, and retry later
+                if page_id not in self.superseded:
+                    self.dirty.setdefault(page_id, entry)
+                if page_id in self.dirty and page_id not in self.timers:
+                    self._schedule_flush(page_id, self.flush_interval)
+            finally:
+                self.flushing.pop(page_id, None)
+                self.superseded.discard(page_id)
+
+        if not self.dirty and not self.flushing:
+            self.locks.clear()
+            self._compact_log()
+
+    async def flush_all(self):
+        """Flush every dirty page, e.g. on shutdown."""
+        for page_id in list(self.dirty.keys()):
+            await self.flush_page(page_id)
+
+    async def close(self):
+        await self.flush_all()
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+# Global page write buffer instance
+page_buffer = PageWriteBuffer(
+    flush_interval=settings.PAGE_FLUSH_INTERVAL_SECONDS,
+    log_path=settings.PAGE_BUFFER_LOG_PATH,
+    create_versions=settings.PAGE_FLUSH_CREATE_VERSIONS
+)
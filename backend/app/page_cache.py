@@ -0,0 +1,203 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Page, PageChange, PAGE_RESPONSE_OPTIONS
+from app.metrics import metrics
+from app.change_feed import settled_cursor
+from app.schemas import PageResponse
+
+def render_public_page(page_id: str) -> Optional[bytes]:
+    """The GET /api/pages/{id} body of a public page, None for any other page."""
+    db = SessionLocal()
+    try:
+        page = db.query(Page).options(*PAGE_RESPONSE_OPTIONS).filter(Page.id == page_id).first()
+        if page is None or not page.is_public:
+            return None
+        return PageResponse.model_validate(page).model_dump_json().encode()
+    finally:
+        db.close()
+
+def page_trees(db: Session, page_ids: Iterable[str]) -> Set[str]:
+    """The pages with all their ancestors, whose rendered children they appear in."""
+    page_ids = set(page_ids)
+    if not page_ids:
+        return page_ids
+    for (path,) in db.query(Page.path).filter(Page.id.in_(page_ids)).all():
+        if path:
+            page_ids.update(path.strip("/").split("/"))
+    return page_ids
+
+def changed_page_trees(after: Optional[int]) -> Tuple[int, Set[str]]:
+    """Pages changed after a change id, with their ancestors, and the id to read from next."""
+    db = SessionLocal()
+    try:
+        settled = settled_cursor(db)
+        if after is None:
+            return settled, set()
+        # Changes that have not settled are read again next time, in case an
+        # earlier one commits in between
+        changed = db.query(PageChange.page_id).filter(PageChange.id > after, PageChange.entity == "page").distinct()
+        return max(after, settled), page_trees(db, [page_id for (page_id,) in changed.all()])
+    finally:
+        db.close()
+
+class PublicPageCache:
+    """Read-through cache of rendered public pages, in an LRU and optionally Redis.
+
+    Private pages are remembered as such, so reading them costs no extra
+    query. Concurrent misses on a page share one load. Entries are dropped
+    when this process changes a page, and within a poll interval of a change
+    anywhere else, which the change feed tells about; the TTL bounds what
+    a lost invalidation can cost.
+    """
+
+    def __init__(self, max_entries: int, ttl: int, poll_interval: float, redis_url: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        # page_id -> {"payload": rendered page or None if private, "expires_at"}
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+        # Pages invalidated while being loaded; what the load returns is already stale
+        self.stale_loads: Set[str] = set()
+        self.watch_task: Optional[asyncio.Task] = None
+        self.redis = None
+        if redis_url:
+            import redis.asyncio as redis_asyncio
+            self.redis = redis_asyncio.from_url(redis_url)
+
+    def _key(self, page_id: str) -> str:
+        return f"public_page:{page_id}"
+
+    # Storage
+
+    async def _load(self, page_id: str) -> Optional[dict]:
+        entry = self.entries.get(page_id)
+        if entry is not None:
+            if time.time() < entry["expires_at"]:
+                self.entries.move_to_end(page_id)
+                return entry
+            del self.entries[page_id]
+
+        if self.redis is not None:
+            try:
+                payload = await self.redis.get(self._key(page_id))
+            except Exception as e:
+                print(f"[PageCache] Redis read failed: {e}")
+                return None
+            if payload is not None:
+                return self._store_local(page_id, payload)
+        return None
+
+    def _store_local(self, page_id: str, payload: Optional[bytes]) -> dict:
+        entry = self.entries[page_id] = {"payload": payload, "expires_at": time.time() + self.ttl}
+        self.entries.move_to_end(page_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            metrics.inc("public_page_cache_evictions")
+        return entry
+
+    async def _store(self, page_id: str, payload: Optional[bytes]):
+        self._store_local(page_id, payload)
+        # Only public pages are shared, private ones are cheap to find out about
+        if self.redis is not None and payload is not None:
+            try:
+                await self.redis.set(self._key(page_id), payload, ex=self.ttl)
+            except Exception as e:
+                print(f"[PageCache] Redis write failed: {e}")
+
+    # Lookups
+
+    async def _fetch(self, page_id: str, load: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[bytes]:
+        future = self.inflight.get(page_id)
+        if future is not None:
+            metrics.inc("public_page_cache_requests", result="coalesced")
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The request that was loading the page went away, not this one
+                return await self._fetch(page_id, load)
+
+        metrics.inc("public_page_cache_requests", result="miss")
+        future = self.inflight[page_id] = asyncio.get_running_loop().create_future()
+        try:
+            payload = await load()
+            if page_id not in self.stale_loads:
+                await self._store(page_id, payload)
+            future.set_result(payload)
+            return payload
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no one else is waiting
+            future.exception()
+            raise
+        finally:
+            del self.inflight[page_id]
+            self.stale_loads.discard(page_id)
+
+    async def get(self, page_id: str) -> Optional[bytes]:
+        """The rendered page if it is public, None if it is private or does not exist."""
+        entry = await self._load(page_id)
+        if entry is not None:
+            metrics.inc("public_page_cache_requests", result="hit")
+            return entry["payload"]
+        return await self._fetch(page_id, lambda: run_in_threadpool(render_public_page, page_id))
+
+    async def invalidate(self, page_ids: Iterable[str]):
+        """Forget pages that changed, e.g. their content or whether they are public."""
+        keys = []
+        for page_id in page_ids:
+            self.entries.pop(page_id, None)
+            if page_id in self.inflight:
+                self.stale_loads.add(page_id)
+            keys.append(self._key(page_id))
+        if self.redis is not None and keys:
+            try:
+                await self.redis.delete(*keys)
+            except Exception as e:
+                print(f"[PageCache] Redis delete failed: {e}")
+
+    # Invalidation from other processes
+
+    async def watch_changes(self):
+        """Drop the pages the change feed reports, wherever they were changed."""
+        cursor = None
+        while True:
+            try:
+                cursor, changed = await run_in_threadpool(changed_page_trees, cursor)
+                await self.invalidate(changed)
+            except Exception as e:
+                print(f"[PageCache] Reading the change feed failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self.watch_task is None:
+            self.watch_task = asyncio.create_task(self.watch_changes())
+
+    async def stop(self):
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+            try:
+                await self.watch_task
+            except asyncio.CancelledError:
+                pass
+            self.watch_task = None
+
+# Global public page cache instance
+page_cache = PublicPageCache(
+    max_entries=settings.PUBLIC_PAGE_CACHE_MAX_ENTRIES,
+    ttl=settings.PUBLIC_PAGE_CACHE_TTL_SECONDS,
+    poll_interval=settings.PUBLIC_PAGE_CACHE_POLL_SECONDS,
+    redis_url=settings.REDIS_URL if settings.PUBLIC_PAGE_CACHE_REDIS_ENABLED else None
+)
@@ -0,0 +1,135 @@
+import io
+import re
+import json
+import zipfile
+from typing import Callable, Dict, Iterator, Optional
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Page, PageCollaboration
+from app.page_formats import html_document, html_to_markdown
+
+EXPORT_FORMATS = {"markdown": ".md", "html": ".html", "json": ".json"}
+
+UNSAFE_NAME_RE = re.compile(r'[\x00-\x1f/\\:*?"<>|]+')
+
+class ZipStreamBuffer(io.RawIOBase):
+    """Write target for ZipFile that hands out what was written so far.
+
+    It cannot seek, so ZipFile writes each entry's sizes after its data and
+    never goes back; every chunk can be sent as soon as it is drained.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.offset
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def safe_name(title: str) -> str:
+    """A page title usable as a file name in any OS."""
+    name = " ".join(UNSAFE_NAME_RE.sub(" ", title or "").split())[:80].strip(". ")
+    return name or "Untitled"
+
+def entry_name(title: str, page_id: str) -> str:
+    # The id keeps siblings with the same title apart, as in Notion exports
+    return f"{safe_name(title)} {page_id.replace('-', '')}"
+
+def render_page(row, export_format: str) -> str:
+    if export_format == "markdown":
+        heading = f"# {row.icon} {row.title}" if row.icon else f"# {row.title}"
+        body = html_to_markdown(row.content)
+        return f"{heading}\n\n{body}\n" if body else f"{heading}\n"
+    if export_format == "html":
+        return html_document(row.title, row.icon, row.content)
+    return json.dumps({
+        "id": row.id,
+        "parent_id": row.parent_id,
+        "title": row.title,
+        "icon": row.icon,
+        "position": row.position,
+        "content": row.content,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+    }, ensure_ascii=False, indent=2)
+
+def readable_subtree(db: Session, root_id: str, user_id: str):
+    """Query of the pages under `root_id` the user can read, parents before children."""
+    root_path = db.query(Page.path).filter(Page.id == root_id).scalar()
+    if root_path is None:
+        raise ValueError("Page not found")
+    shared = select(PageCollaboration.page_id).where(PageCollaboration.user_id == user_id)
+    return select(
+        Page.id, Page.parent_id, Page.title, Page.icon, Page.position, Page.content,
+        Page.created_at, Page.updated_at
+    ).where(
+        Page.path.startswith(root_path),
+        Page.is_archived == False,
+        or_(Page.owner_id == user_id, Page.is_public == True, Page.id.in_(shared))
+    ).order_by(Page.path)
+
+def export_zip(
+    db: Session,
+    root_id: str,
+    user_id: str,
+    export_format: str,
+    on_progress: Optional[Callable[[int], None]] = None
+) -> Iterator[bytes]:
+    """Yield a zip of a page subtree piece by piece.
+
+    Pages are read through a server-side cursor and each one is compressed
+    and handed out before the next is read, so memory does not grow with the
+    size of the tree beyond the directory name kept per page. A page goes in
+    a folder named like its parent, next to the parent's own file.
+    """
+    extension = EXPORT_FORMATS[export_format]
+    query = readable_subtree(db, root_id, user_id).execution_options(yield_per=settings.PAGE_BULK_BATCH_SIZE)
+    buffer = ZipStreamBuffer()
+    directories: Dict[str, str] = {}
+    exported = 0
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for row in db.execute(query):
+            if row.id == root_id:
+                directory = ""
+            elif row.parent_id in directories:
+                directory = directories[row.parent_id]
+            else:
+                # The parent is not readable, so neither is the branch below it
+                continue
+            name = entry_name(row.title, row.id)
+            directories[row.id] = f"{directory}{name}/"
+            archive.writestr(f"{directory}{name}{extension}", render_page(row, export_format))
+
+            exported += 1
+            if on_progress is not None and exported % settings.PAGE_BULK_BATCH_SIZE == 0:
+                on_progress(exported)
+            data = buffer.drain()
+            if data:
+                yield data
+    if on_progress is not None:
+        on_progress(exported)
+    yield buffer.drain()
+
+def stream_export(root_id: str, user_id: str, export_format: str) -> Iterator[bytes]:
+    """export_zip with a session of its own, for a streaming response that outlives the request's."""
+    db = SessionLocal()
+    try:
+        yield from export_zip(db, root_id, user_id, export_format)
+    finally:
+        db.close()
@@ -0,0 +1,267 @@
+import re
+import html
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+WHITESPACE_RE = re.compile(r"\s+")
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+INLINE_MARKERS = {"strong": "**", "b": "**", "em": "*", "i": "*", "s": "~~", "strike": "~~", "del": "~~"}
+
+class MarkdownWriter(HTMLParser):
+    """Turns the editor's HTML into Markdown, one block per line."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # (is_list_item, line) for each block written so far
+        self.blocks: List[Tuple[bool, str]] = []
+        self.inline: List[str] = []
+        self.lists: List[dict] = []
+        self.links: List[Optional[str]] = []
+        self.quote = 0
+        self.heading = 0
+        self.marker: Optional[str] = None
+        self.pre: Optional[List[str]] = None
+        self.pre_language = ""
+
+    def flush(self):
+        text = "".join(self.inline).strip()
+        self.inline = []
+        if not text:
+            return
+        prefix = "> " * self.quote
+        if self.marker is not None:
+            prefix += "  " * (len(self.lists) - 1) + self.marker
+            self.marker = None
+        elif self.heading:
+            prefix += "#" * self.heading + " "
+        self.blocks.append((bool(self.lists), prefix + text))
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self.pre is not None:
+            if tag == "code" and (attrs.get("class") or "").startswith("language-"):
+                self.pre_language = attrs["class"][len("language-"):]
+            return
+        if tag in HEADING_TAGS:
+            self.flush()
+            self.heading = HEADING_TAGS[tag]
+        elif tag in ("p", "div"):
+            self.flush()
+        elif tag == "blockquote":
+            self.flush()
+            self.quote += 1
+        elif tag in ("ul", "ol"):
+            self.flush()
+            self.lists.append({"ordered": tag == "ol", "number": 1, "tasks": attrs.get("data-type") == "taskList"})
+        elif tag == "li":
+            self.flush()
+            current = self.lists[-1] if self.lists else {"ordered": False, "number": 1, "tasks": False}
+            if current["ordered"]:
+                self.marker = f"{current['number']}. "
+                current["number"] += 1
+            elif current["tasks"]:
+                self.marker = "- [x] " if attrs.get("data-checked") == "true" else "- [ ] "
+            else:
+                self.marker = "- "
+        elif tag == "pre":
+            self.flush()
+            self.pre = []
+            self.pre_language = ""
+        elif tag == "hr":
+            self.flush()
+            self.blocks.append((False, "---"))
+        elif tag == "br":
+            self.inline.append("  \n")
+        elif tag == "code":
+            self.inline.append("`")
+        elif tag in INLINE_MARKERS:
+            self.inline.append(INLINE_MARKERS[tag])
+        elif tag == "a":
+            self.links.append(attrs.get("href"))
+            self.inline.append("[")
+        elif tag == "img":
+            self.inline.append(f"![{attrs.get('alt') or ''}]({attrs.get('src') or ''})")
+
+    def handle_endtag(self, tag):
+        if self.pre is not None:
+            if tag == "pre":
+                fence = "> " * self.quote + "```"
+                code = "".join(self.pre).rstrip("\n")
+                self.blocks.append((False, "\n".join([fence + self.pre_language, code, fence])))
+                self.pre = None
+            return
+        if tag in HEADING_TAGS:
+            self.flush()
+            self.heading = 0
+        elif tag in ("p", "div", "li"):
+            self.flush()
+        elif tag == "blockquote":
+            self.flush()
+            self.quote = max(0, self.quote - 1)
+        elif tag in ("ul", "ol"):
+            self.flush()
+            if self.lists:
+                self.lists.pop()
+        elif tag == "code":
+            self.inline.append("`")
+        elif tag in INLINE_MARKERS:
+            self.inline.append(INLINE_MARKERS[tag])
+        elif tag == "a":
+            href = self.links.pop() if self.links else None
+            self.inline.append(f"]({href})" if href else "]")
+
+    def handle_data(self, data):
+        if self.pre is not None:
+            self.pre.append(data)
+        else:
+            self.inline.append(WHITESPACE_RE.sub(" ", data))
+
+    def markdown(self) -> str:
+        self.close()
+        self.flush()
+        lines = []
+        previous_item = False
+        for is_item, line in self.blocks:
+            if lines:
+                lines.append("\n" if is_item and previous_item else "\n\n")
+            lines.append(line)
+            previous_item = is_item
+        return "".join(lines)
+
+def html_to_markdown(content: str) -> str:
+    writer = MarkdownWriter()
+    writer.feed(content or "")
+    return writer.markdown()
+
+def html_document(title: str, icon: Optional[str], content: str) -> str:
+    """A standalone HTML file for a page."""
+    heading = html.escape(f"{icon} {title}" if icon else title)
+    return (
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+        f"<title>{html.escape(title)}</title>\n</head>\n<body>\n"
+        f"<h1>{heading}</h1>\n{content or ''}\n</body>\n</html>\n"
+    )
+
+FENCE_RE = re.compile(r"^\s*(```|~~~)\s*([\w+-]*)")
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+LIST_ITEM_RE = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+TASK_RE = re.compile(r"^\[([ xX])\]\s+(.*)$")
+QUOTE_RE = re.compile(r"^\s*>\s?(.*)$")
+CODE_SPAN_RE = re.compile(r"`([^`]+)`")
+IMAGE_RE = re.compile(r"!\[([^\]]*)\]\(([^)\s]+)[^)]*\)")
+LINK_RE = re.compile(r"\[([^\]]+)\]\(([^)\s]+)[^)]*\)")
+STRONG_RE = re.compile(r"\*\*(.+?)\*\*|__(.+?)__")
+EMPHASIS_RE = re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])|(?<![\w_])_(?!\s)(.+?)(?<!\s)_(?![\w_])")
+STRIKE_RE = re.compile(r"~~(.+?)~~")
+STASH_RE = re.compile(r"\x00(\d+)\x00")
+
+def render_inline(text: str) -> str:
+    text = html.escape(text)
+    # Code spans are set aside so nothing inside them is formatted
+    spans: List[str] = []
+
+    def stash(match):
+        spans.append(f"<code>{match.group(1)}</code>")
+        return f"\x00{len(spans) - 1}\x00"
+
+    text = CODE_SPAN_RE.sub(stash, text)
+    text = IMAGE_RE.sub(r'<img src="\2" alt="\1">', text)
+    text = LINK_RE.sub(r'<a href="\2">\1</a>', text)
+    text = STRONG_RE.sub(lambda match: f"<strong>{match.group(1) or match.group(2)}</strong>", text)
+    text = EMPHASIS_RE.sub(lambda match: f"<em>{match.group(1) or match.group(2)}</em>", text)
+    text = STRIKE_RE.sub(r"<s>\1</s>", text)
+    return STASH_RE.sub(lambda match: spans[int(match.group(1))], text)
+
+class HTMLWriter:
+    """Turns Markdown into HTML the editor understands, block by block."""
+
+    def __init__(self):
+        self.blocks: List[str] = []
+        self.paragraph: List[str] = []
+        # [indent, closing tag, whether an item is open] per nested list
+        self.lists: List[list] = []
+
+    def close_paragraph(self):
+        if self.paragraph:
+            self.blocks.append(f"<p>{render_inline(' '.join(self.paragraph))}</p>")
+            self.paragraph = []
+
+    def close_lists(self, indent: int = -1):
+        while self.lists and self.lists[-1][0] > indent:
+            _, tag, item_open = self.lists.pop()
+            self.blocks.append(f"</li></{tag}>" if item_open else f"</{tag}>")
+
+    def list_item(self, indent: int, marker: str, text: str):
+        self.close_paragraph()
+        self.close_lists(indent)
+        task = TASK_RE.match(text)
+        tag = "ol" if marker[0].isdigit() else "ul"
+        if self.lists and self.lists[-1][0] == indent and self.lists[-1][1] != tag:
+            self.close_lists(indent - 1)
+        if not self.lists or self.lists[-1][0] < indent:
+            self.blocks.append('<ul data-type="taskList">' if task else f"<{tag}>")
+            self.lists.append([indent, tag, False])
+        elif self.lists[-1][2]:
+            self.blocks.append("</li>")
+        if task:
+            checked = "true" if task.group(1) != " " else "false"
+            self.blocks.append(f'<li data-type="taskItem" data-checked="{checked}"><p>{render_inline(task.group(2))}</p>')
+        else:
+            self.blocks.append(f"<li><p>{render_inline(text)}</p>")
+        self.lists[-1][2] = True
+
+    def feed(self, text: str):
+        lines = text.replace("\r\n", "\n").split("\n")
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            fence = FENCE_RE.match(line)
+            if fence:
+                self.close_paragraph()
+                self.close_lists()
+                code = []
+                i += 1
+                while i < len(lines) and not lines[i].strip().startswith(fence.group(1)):
+                    code.append(lines[i])
+                    i += 1
+                language = f' class="language-{fence.group(2)}"' if fence.group(2) else ""
+                self.blocks.append(f"<pre><code{language}>{html.escape(chr(10).join(code))}</code></pre>")
+            elif QUOTE_RE.match(line):
+                self.close_paragraph()
+                self.close_lists()
+                quoted = []
+                while i < len(lines) and QUOTE_RE.match(lines[i]):
+                    quoted.append(QUOTE_RE.match(lines[i]).group(1))
+                    i += 1
+                self.blocks.append(f"<blockquote>{markdown_to_html(chr(10).join(quoted))}</blockquote>")
+                continue
+            elif HEADING_RE.match(line):
+                self.close_paragraph()
+                self.close_lists()
+                heading = HEADING_RE.match(line)
+                level = len(heading.group(1))
+                self.blocks.append(f"<h{level}>{render_inline(heading.group(2))}</h{level}>")
+            elif RULE_RE.match(line):
+                self.close_paragraph()
+                self.close_lists()
+                self.blocks.append("<hr>")
+            elif LIST_ITEM_RE.match(line):
+                item = LIST_ITEM_RE.match(line)
+                self.list_item(len(item.group(1).expandtabs(4)), item.group(2), item.group(3))
+            elif not line.strip():
+                self.close_paragraph()
+            else:
+                self.close_lists()
+                self.paragraph.append(line.strip())
+            i += 1
+
+    def html(self) -> str:
+        self.close_paragraph()
+        self.close_lists()
+        return "".join(self.blocks)
+
+def markdown_to_html(text: str) -> str:
+    writer = HTMLWriter()
+    writer.feed(text or "")
+    return writer.html()
@@ -0,0 +1,163 @@
+import re
+import html
+import zipfile
+import posixpath
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Page, generate_uuid
+from app.page_formats import markdown_to_html
+from app.page_links import update_page_links
+from app.page_tree import last_positions, live_parent_path, page_path
+from app.fractional_index import key_between
+
+IMPORT_FORMATS = {".md": "markdown", ".markdown": "markdown", ".html": "html", ".htm": "html", ".txt": "text"}
+
+# Notion appends a 32 character id to every exported file and folder name
+NOTION_ID_RE = re.compile(r"\s+[0-9a-f]{32}$")
+TITLE_RE = re.compile(r"<title>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+BODY_RE = re.compile(r"<body[^>]*>(.*)</body>", re.IGNORECASE | re.DOTALL)
+HEADER_RE = re.compile(r"<header[^>]*>.*?</header>", re.IGNORECASE | re.DOTALL)
+
+def title_from_name(name: str) -> str:
+    return NOTION_ID_RE.sub("", name).strip() or "Untitled"
+
+def parse_entry(name: str, data: bytes) -> Tuple[Optional[str], str]:
+    """Title, if the file has one of its own, and editor HTML for an archive entry."""
+    text = data.decode("utf-8", errors="replace").lstrip("\ufeff")
+    import_format = IMPORT_FORMATS[posixpath.splitext(name)[1].lower()]
+    if import_format == "html":
+        title = TITLE_RE.search(text)
+        body = BODY_RE.search(text)
+        content = HEADER_RE.sub("", body.group(1) if body else text, count=1).strip()
+        return (html.unescape(title.group(1)).strip() if title else None), content
+    if import_format == "text":
+        paragraphs = [paragraph.strip() for paragraph in text.split("\n\n") if paragraph.strip()]
+        return None, "".join(f"<p>{html.escape(paragraph)}</p>" for paragraph in paragraphs)
+
+    # A leading top-level heading is the page title, as in our own exports
+    title = None
+    lines = text.split("\n", 1)
+    if lines[0].startswith("# "):
+        title = lines[0][2:].strip()
+        text = lines[1] if len(lines) > 1 else ""
+    return title, markdown_to_html(text)
+
+class PageImporter:
+    """Builds pages from archive entries and inserts them in batches.
+
+    Entries must arrive parents first. A folder without a file of its own
+    becomes an empty page named after the folder.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        owner_id: str,
+        parent_id: Optional[str],
+        folders: Set[str],
+        on_progress: Optional[Callable[[int], None]] = None
+    ):
+        self.db = db
+        self.owner_id = owner_id
+        self.folders = folders
+        self.on_progress = on_progress
+        parent_path = live_parent_path(db, parent_id)
+        # Archive path without extension -> (page id, materialized path), kept only for folders
+        self.pages: Dict[str, Tuple[Optional[str], Optional[str]]] = {"": (parent_id, parent_path)}
+        self.positions = last_positions(db, owner_id, [parent_id])
+        self.rows: List[dict] = []
+        self.page_ids: List[str] = []
+        self.now = datetime.utcnow()
+
+    def add_page(self, key: str, title: str, content: str):
+        parent_key = posixpath.dirname(key)
+        if parent_key not in self.pages:
+            self.add_page(parent_key, title_from_name(posixpath.basename(parent_key)), "")
+        parent_id, parent_path = self.pages[parent_key]
+
+        page_id = generate_uuid()
+        path = page_path(parent_path, page_id)
+        self.positions[parent_id] = key_between(self.positions.get(parent_id), None)
+        if key in self.folders:
+            self.pages[key] = (page_id, path)
+        self.page_ids.append(page_id)
+        self.rows.append({
+            "id": page_id,
+            "title": title[:500],
+            "content": content,
+            "icon": "📄",
+            "parent_id": parent_id,
+            "path": path,
+            "position": self.positions[parent_id],
+            "owner_id": self.owner_id,
+            "is_public": False,
+            "is_archived": False,
+            "page_metadata": {},
+            "created_at": self.now,
+        })
+        if len(self.rows) >= settings.IMPORT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.db.execute(insert(Page), self.rows)
+            update_page_links(self.db, {row["id"]: row["content"] for row in self.rows}, new_pages=True)
+            self.rows = []
+            if self.on_progress is not None:
+                self.on_progress(len(self.page_ids))
+
+def import_archive(
+    db: Session,
+    file_path: str,
+    owner_id: str,
+    parent_id: Optional[str] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> dict:
+    """Import a zip of Markdown, HTML or text files as pages, without committing.
+
+    Folders become sub-pages, so a Notion export keeps its hierarchy. Entries
+    are read and converted one at a time and the pages are inserted
+    IMPORT_BATCH_SIZE rows per statement, so memory holds one batch of
+    content plus an id per page.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        entries = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and posixpath.splitext(info.filename)[1].lower() in IMPORT_FORMATS
+            and not info.filename.startswith("__MACOSX/")
+        ]
+        skipped = sum(1 for info in archive.infolist() if not info.is_dir()) - len(entries)
+        # Shallower entries first, so a page's parent always exists before it
+        entries.sort(key=lambda info: (info.filename.count("/"), info.filename))
+
+        # Only pages that have sub-pages need to be remembered
+        folders: Set[str] = set()
+        for info in entries:
+            folder = posixpath.dirname(info.filename)
+            while folder and folder not in folders:
+                folders.add(folder)
+                folder = posixpath.dirname(folder)
+
+        total = len(entries)
+        importer = PageImporter(
+            db, owner_id, parent_id, folders,
+            (lambda done: on_progress(done, total)) if on_progress is not None else None
+        )
+        previous_key = None
+        for info in entries:
+            key = posixpath.splitext(info.filename)[0]
+            # Sorting puts e.g. the .html and .md copies of a page next to each other
+            if info.file_size > settings.IMPORT_MAX_PAGE_BYTES or key == previous_key:
+                skipped += 1
+                continue
+            previous_key = key
+            title, content = parse_entry(info.filename, archive.read(info))
+            importer.add_page(key, title or title_from_name(posixpath.basename(key)), content)
+        importer.flush()
+
+    return {"pages": len(importer.page_ids), "skipped": skipped, "page_ids": importer.page_ids}
@@ -0,0 +1,166 @@
+"""Index of the links between pages and the users mentioned on them.
+
+Content is parsed whenever it is saved and only the links that appeared or
+went away are written, so "what links here" and "where am I mentioned" are
+lookups instead of scans over every page. A link is an <a> to
+/workspace/<page id>; a mention is an editor mention node carrying a user
+id. Plain "@name" text is not a mention, since content is saved while it
+is typed and a half-written name would notify whoever it matches.
+"""
+import re
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import User, Page, PageCollaboration, PageLink, generate_uuid
+from app.email_outbox import enqueue_email
+
+PAGE_URL_RE = re.compile(r"/workspace/([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(?:[/?#]|$)")
+
+class LinkParser(HTMLParser):
+    """Collects the page links and mentions in the editor's HTML."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.page_ids: Set[str] = set()
+        self.user_ids: Set[str] = set()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "a":
+            link = PAGE_URL_RE.search(attrs.get("href") or "")
+            if link:
+                self.page_ids.add(link.group(1))
+        if attrs.get("data-type") == "mention" and attrs.get("data-id"):
+            self.user_ids.add(attrs["data-id"])
+
+def parse_links(content: Optional[str]) -> Tuple[Set[str], Set[str]]:
+    """Linked page ids and mentioned user ids in a page's content."""
+    parser = LinkParser()
+    parser.feed(content or "")
+    parser.close()
+    return parser.page_ids, parser.user_ids
+
+def update_page_links(db: Session, contents: Dict[str, str], new_pages: bool = False) -> Dict[str, Set[str]]:
+    """Bring the index in line with the new content of pages, without committing.
+
+    `contents` maps page ids to their content. With `new_pages` the pages are
+    known to have no links yet, which saves reading them. Returns the users
+    newly mentioned on each page.
+    """
+    if not contents:
+        return {}
+    # Pages added through the session must exist for the links to them
+    db.flush()
+    parsed = {page_id: parse_links(content) for page_id, content in contents.items()}
+
+    # Mentions of users that do not exist are left out
+    user_ids = set().union(*(ids for _, ids in parsed.values()))
+    found = {user_id for (user_id,) in db.query(User.id).filter(User.id.in_(user_ids)).all()} if user_ids else set()
+    wanted = {
+        (page_id, "page", target_id) for page_id, (page_ids, _) in parsed.items()
+        for target_id in page_ids if target_id != page_id
+    } | {
+        (page_id, "user", user_id) for page_id, (_, ids) in parsed.items()
+        for user_id in ids if user_id in found
+    }
+
+    # Two saves of a page racing can both add a link; the next save drops the copy
+    existing: Dict[tuple, List[str]] = {}
+    batch_size = settings.PAGE_BULK_BATCH_SIZE
+    page_ids = list(contents)
+    if not new_pages:
+        for start in range(0, len(page_ids), batch_size):
+            for link in db.query(PageLink.id, PageLink.source_page_id, PageLink.kind, PageLink.target_id).filter(
+                PageLink.source_page_id.in_(page_ids[start:start + batch_size])
+            ).all():
+                existing.setdefault((link.source_page_id, link.kind, link.target_id), []).append(link.id)
+
+    removed = [
+        link_id for key, link_ids in existing.items()
+        for link_id in (link_ids if key not in wanted else link_ids[1:])
+    ]
+    added = [key for key in wanted if key not in existing]
+    for start in range(0, len(removed), batch_size):
+        db.execute(delete(PageLink).where(PageLink.id.in_(removed[start:start + batch_size])))
+    now = datetime.utcnow()
+    for start in range(0, len(added), batch_size):
+        db.execute(insert(PageLink), [
+            {"id": generate_uuid(), "source_page_id": page_id, "kind": kind, "target_id": target_id, "created_at": now}
+            for page_id, kind, target_id in added[start:start + batch_size]
+        ])
+
+    mentions: Dict[str, Set[str]] = {}
+    for page_id, kind, target_id in added:
+        if kind == "user":
+            mentions.setdefault(page_id, set()).add(target_id)
+    return mentions
+
+def notify_mentions(db: Session, mentions: Dict[str, Set[str]], author: Optional[User]) -> int:
+    """Queue an email to each newly mentioned user the page is shared with, without committing.
+
+    Being able to read a public page is not enough, or anyone could send
+    mail to any user through one. Authors are not told about their own
+    mentions. Returns the number of emails queued.
+    """
+    if not settings.MENTION_EMAILS_ENABLED or not mentions:
+        return 0
+    user_ids = set().union(*mentions.values()) - {author.id if author else None}
+    if not user_ids:
+        return 0
+    pages = {page.id: page for page in db.query(Page.id, Page.title, Page.owner_id).filter(
+        Page.id.in_(list(mentions)), Page.is_archived == False
+    ).all()}
+    users = {user.id: user for user in db.query(User.id, User.email).filter(
+        User.id.in_(user_ids), User.is_active == True
+    ).all()}
+    shared = set(db.query(PageCollaboration.page_id, PageCollaboration.user_id).filter(
+        PageCollaboration.page_id.in_(list(mentions)), PageCollaboration.user_id.in_(user_ids)
+    ).all())
+
+    by = (author.full_name or author.username) if author else "Someone"
+    queued = 0
+    for page_id, mentioned in mentions.items():
+        page = pages.get(page_id)
+        if page is None:
+            continue
+        for user_id in mentioned & users.keys():
+            if not (page.owner_id == user_id or (page_id, user_id) in shared):
+                continue
+            enqueue_email(
+                db,
+                to_email=users[user_id].email,
+                subject=f"{by} mentioned you in {page.title}",
+                content=f"{by} mentioned you in \"{page.title}\": {settings.FRONTEND_URL}/workspace/{page_id}"
+            )
+            queued += 1
+    return queued
+
+def rebuild_page_links(db: Session, on_progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """Re-index every page from its content, committing per batch. Returns the pages read.
+
+    Existing links are diffed like on a save, so a rebuild can be rerun and
+    runs alongside edits. Links of pages that no longer exist are dropped.
+    """
+    db.execute(delete(PageLink).where(PageLink.source_page_id.not_in(select(Page.id))))
+    db.commit()
+    total = db.query(Page.id).count()
+    done = 0
+    last_id = ""
+    while True:
+        # Keyset pagination, so each batch is an index range scan
+        rows = db.query(Page.id, Page.content).filter(Page.id > last_id).order_by(Page.id).limit(
+            settings.PAGE_BULK_BATCH_SIZE
+        ).all()
+        if not rows:
+            break
+        update_page_links(db, {row.id: row.content for row in rows})
+        db.commit()
+        last_id = rows[-1].id
+        done += len(rows)
+        if on_progress is not None:
+            on_progress(done, total)
+    return done
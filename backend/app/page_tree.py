@@ -0,0 +1,344 @@
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set, Union
+from sqlalchemy import String, and_, delete, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Page, PageVersion, PageCollaboration, PageLink, Comment, generate_uuid
+from app.metrics import metrics
+from app.fractional_index import key_between
+from app.change_feed import record_page_changes
+from app.page_links import update_page_links
+
+# Guards the recursive queries against parent cycles in bad data
+MAX_TREE_DEPTH = 64
+
+def subtree_cte(root_id: Union[str, Iterable[str]], include_archived: bool = False):
+    """Recursive CTE of (id, depth) for a page, or several, and their descendants."""
+    roots = Page.id == root_id if isinstance(root_id, str) else Page.id.in_(root_id)
+    tree = select(Page.id, literal(0).label("depth")).where(roots).cte(name="tree", recursive=True)
+    children = select(Page.id, (tree.c.depth + 1).label("depth")).where(
+        Page.parent_id == tree.c.id,
+        tree.c.depth < MAX_TREE_DEPTH
+    )
+    if not include_archived:
+        children = children.where(Page.is_archived == False)
+    return tree.union_all(children)
+
+class TreeError(ValueError):
+    """A tree change that is not allowed, e.g. moving a page under itself."""
+
+def page_path(parent_path: Optional[str], page_id: str) -> str:
+    """Materialized path of a page under a parent with the given path, or at the top level."""
+    return f"{parent_path or '/'}{page_id}/"
+
+def sibling_scope(parent_id: Optional[str], owner_id: str):
+    """Filter for the siblings under a parent; top-level pages are ordered per owner."""
+    if parent_id is None:
+        return and_(Page.parent_id.is_(None), Page.owner_id == owner_id)
+    return Page.parent_id == parent_id
+
+def last_positions(db: Session, owner_id: str, parent_ids: Iterable[Optional[str]]) -> Dict[Optional[str], Optional[str]]:
+    """Largest order key under each of the given parents, None for no children."""
+    parent_ids = set(parent_ids)
+    nested = [parent_id for parent_id in parent_ids if parent_id is not None]
+    positions = dict(
+        db.query(Page.parent_id, func.max(Page.position))
+        .filter(Page.parent_id.in_(nested))
+        .group_by(Page.parent_id)
+        .all()
+    ) if nested else {}
+    if None in parent_ids:
+        positions[None] = db.query(func.max(Page.position)).filter(sibling_scope(None, owner_id)).scalar()
+    return positions
+
+def next_position(db: Session, parent_id: Optional[str], owner_id: str) -> str:
+    """Order key that puts a page after all its siblings."""
+    return key_between(last_positions(db, owner_id, [parent_id]).get(parent_id), None)
+
+def position_between(
+    db: Session,
+    parent_id: Optional[str],
+    owner_id: str,
+    after_id: Optional[str] = None,
+    before_id: Optional[str] = None
+) -> str:
+    """Order key for a page placed after and/or before the given siblings, or last."""
+    if after_id is None and before_id is None:
+        return next_position(db, parent_id, owner_id)
+
+    scope = sibling_scope(parent_id, owner_id)
+    neighbours = dict(db.query(Page.id, Page.position).filter(
+        Page.id.in_([page_id for page_id in (after_id, before_id) if page_id is not None]), scope
+    ).all())
+    for neighbour_id in (after_id, before_id):
+        if neighbour_id is not None and neighbour_id not in neighbours:
+            raise TreeError(f"Page {neighbour_id} is not a child of the target parent")
+    after, before = neighbours.get(after_id), neighbours.get(before_id)
+
+    # With one neighbour given, the other side is whichever sibling is next to it now
+    if before_id is None:
+        before = db.query(func.min(Page.position)).filter(scope, Page.position > after).scalar()
+    elif after_id is None:
+        after = db.query(func.max(Page.position)).filter(scope, Page.position < before).scalar()
+    if after is not None and before is not None and after >= before:
+        raise TreeError("after_id must come before before_id")
+    return key_between(after, before)
+
+def live_parent_path(db: Session, parent_id: Optional[str]) -> Optional[str]:
+    """Path of a page that pages are about to be put under.
+
+    Archived pages take no new sub-pages, since a purge deletes them with
+    their subtree.
+    """
+    if parent_id is None:
+        return None
+    parent = db.query(Page.path, Page.is_archived).filter(Page.id == parent_id).first()
+    if parent is None:
+        raise TreeError("Parent page not found")
+    if parent.is_archived:
+        raise TreeError("Pages cannot be added under an archived page")
+    return parent.path
+
+def place_new_page(db: Session, page_id: str, parent_id: Optional[str], owner_id: str) -> dict:
+    """Path and order key for a page about to be created last under `parent_id`."""
+    parent_path = live_parent_path(db, parent_id)
+    return {"path": page_path(parent_path, page_id), "position": next_position(db, parent_id, owner_id)}
+
+def move_subtree(db: Session, page_id: str, parent_id: Optional[str], position: Optional[str] = None):
+    """Re-parent a page and rewrite the paths of its subtree, without committing.
+
+    Moving a page under itself or a descendant is caught by comparing paths,
+    without loading the tree. The page, the new parent and the parent's
+    ancestors are locked first, in id order, so that two concurrent moves
+    cannot each pass the check and commit a cycle together. A reorder among
+    the same siblings writes only the page's own row.
+    """
+    wanted = {page_id} if parent_id is None else {page_id, parent_id}
+    tried: Set[str] = set()
+    rows = {}
+    while wanted - tried:
+        batch = sorted(wanted - tried)
+        tried.update(batch)
+        rows.update((row.id, row) for row in db.query(Page.id, Page.path, Page.is_archived).filter(
+            Page.id.in_(batch)
+        ).order_by(Page.id).with_for_update())
+        parent = rows.get(parent_id)
+        # A locked page cannot change path any more, so its ancestors are final
+        if parent is not None and parent.path:
+            wanted.update(parent.path.strip("/").split("/"))
+
+    page = rows.get(page_id)
+    if page is None:
+        raise TreeError("Page not found")
+    path = page.path
+    parent_path = None
+    if parent_id is not None:
+        parent = rows.get(parent_id)
+        if parent is None:
+            raise TreeError("Parent page not found")
+        if parent.is_archived:
+            raise TreeError("Pages cannot be added under an archived page")
+        parent_path = parent.path
+        if parent_path.startswith(path):
+            raise TreeError("A page cannot be moved under itself or one of its sub-pages")
+
+    values = {"parent_id": parent_id, "updated_at": datetime.utcnow()}
+    if position is not None:
+        values["position"] = position
+    db.execute(
+        update(Page).where(Page.id == page_id).values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+    new_path = page_path(parent_path, page_id)
+    if new_path != path:
+        db.execute(
+            update(Page).where(Page.path.startswith(path))
+            .values(path=literal(new_path) + func.substr(Page.path, len(path) + 1, type_=String))
+            .execution_options(synchronize_session=False)
+        )
+
+def count_subtree(db: Session, root_id: str) -> int:
+    tree = subtree_cte(root_id)
+    return db.execute(select(func.count()).select_from(tree)).scalar()
+
+def duplicate_subtree(
+    db: Session,
+    root_id: str,
+    owner_id: str,
+    include_versions: bool = False,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> Dict[str, str]:
+    """Copy a page and its descendants with bulk inserts, without committing.
+
+    Ids are remapped and parent links point at the copies. The copy of the
+    root keeps the original's parent and gets a "(Copy)" title. Returns the
+    map of original to new page ids.
+    """
+    tree = subtree_cte(root_id)
+    rows = db.execute(
+        select(
+            Page.id, Page.parent_id, Page.path, Page.position, Page.title, Page.content, Page.icon, Page.page_metadata
+        ).join(tree, Page.id == tree.c.id).order_by(tree.c.depth)
+    ).all()
+
+    # Ordered by depth, so every parent is inserted before its children
+    id_map = {row.id: generate_uuid() for row in rows}
+    paths: Dict[str, str] = {}
+    now = datetime.utcnow()
+    values: List[dict] = []
+    for row in rows:
+        is_root = row.id == root_id
+        if is_root:
+            # The copy goes last among the original's siblings
+            parent_path = row.path[:-len(row.id) - 1]
+            position = next_position(db, row.parent_id, owner_id)
+        else:
+            parent_path = paths[row.parent_id]
+            position = row.position
+        paths[row.id] = page_path(parent_path, id_map[row.id])
+        values.append({
+            "id": id_map[row.id],
+            "title": f"{row.title} (Copy)" if is_root else row.title,
+            "content": row.content,
+            "icon": row.icon,
+            "parent_id": row.parent_id if is_root else id_map[row.parent_id],
+            "path": paths[row.id],
+            "position": position,
+            "owner_id": owner_id,
+            "is_public": False,
+            "is_archived": False,
+            "page_metadata": row.page_metadata or {},
+            "created_at": now,
+        })
+
+    batch_size = settings.PAGE_BULK_BATCH_SIZE
+    for start in range(0, len(values), batch_size):
+        db.execute(insert(Page), values[start:start + batch_size])
+        if on_progress is not None:
+            on_progress(min(start + batch_size, len(values)), len(values))
+    # Copies link where the originals do, including to the originals' subtree
+    update_page_links(db, {row["id"]: row["content"] or "" for row in values}, new_pages=True)
+
+    if include_versions and id_map:
+        old_ids = list(id_map.keys())
+        for start in range(0, len(old_ids), batch_size):
+            versions = db.execute(
+                select(
+                    PageVersion.page_id, PageVersion.content, PageVersion.version_number,
+                    PageVersion.created_by, PageVersion.created_at
+                ).where(PageVersion.page_id.in_(old_ids[start:start + batch_size]))
+            ).all()
+            if versions:
+                db.execute(insert(PageVersion), [
+                    {
+                        "id": generate_uuid(),
+                        "page_id": id_map[version.page_id],
+                        "content": version.content,
+                        "version_number": version.version_number,
+                        "created_by": version.created_by,
+                        "created_at": version.created_at,
+                    }
+                    for version in versions
+                ])
+
+    record_page_changes(db, id_map.values(), owner_id)
+    return id_map
+
+def archive_subtree(db: Session, root_id: Union[str, List[str]]) -> List[str]:
+    """Archive pages with all their descendants in one statement, without committing.
+
+    Pages archived together share `archived_at`, which is how a restore finds
+    them again. Descendants that were archived before keep their own time.
+    Returns the ids of the pages archived.
+    """
+    now = datetime.utcnow()
+    tree = subtree_cte(root_id)
+    return list(db.execute(
+        update(Page)
+        .where(Page.id.in_(select(tree.c.id)), Page.is_archived == False)
+        .values(is_archived=True, archived_at=now, updated_at=now)
+        .returning(Page.id)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+
+def restore_subtree(db: Session, root_id: str) -> List[str]:
+    """Undo the archive of a page and everything archived along with it, without committing."""
+    archived_at = db.query(Page.archived_at).filter(Page.id == root_id, Page.is_archived == True).scalar()
+    if archived_at is None:
+        return []
+    tree = subtree_cte(root_id, include_archived=True)
+    return list(db.execute(
+        update(Page)
+        .where(Page.id.in_(select(tree.c.id)), Page.is_archived == True, Page.archived_at == archived_at)
+        .values(is_archived=False, archived_at=None, updated_at=datetime.utcnow())
+        .returning(Page.id)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+
+def purge_archived(
+    db: Session,
+    cutoff: datetime,
+    owner_id: Optional[str] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> Dict[str, int]:
+    """Hard-delete pages archived before `cutoff` and everything attached to them.
+
+    Only archived pages are deleted, and with `owner_id` only that user's. A
+    page that is left under a deleted one, e.g. a live page someone else
+    keeps under it, moves to the top level of its owner's pages first.
+    Deletes run deepest pages first in batches of PAGE_BULK_BATCH_SIZE, each
+    in its own transaction, so no statement holds locks for long and a page
+    is never deleted before its children. Returns the rows deleted per table.
+    """
+    expired = [Page.is_archived == True, Page.archived_at < cutoff]
+    if owner_id is not None:
+        expired.append(Page.owner_id == owner_id)
+    tree = select(Page.id, literal(0).label("depth")).where(*expired).cte(name="tree", recursive=True)
+    tree = tree.union_all(
+        select(Page.id, (tree.c.depth + 1).label("depth")).where(
+            Page.parent_id == tree.c.id, tree.c.depth < MAX_TREE_DEPTH, *expired
+        )
+    )
+    # Nested expired pages are reached from each expired ancestor; the largest depth is the true one
+    depth = func.max(tree.c.depth)
+    page_ids = list(db.execute(
+        select(tree.c.id).group_by(tree.c.id).order_by(depth.desc())
+    ).scalars())
+
+    batch_size = settings.PAGE_BULK_BATCH_SIZE
+    purged = set(page_ids)
+    survivors = []
+    for start in range(0, len(page_ids), batch_size):
+        survivors.extend(db.query(Page.id, Page.owner_id).filter(
+            Page.parent_id.in_(page_ids[start:start + batch_size])
+        ).all())
+    survivors = [page for page in survivors if page.id not in purged]
+    for page in survivors:
+        move_subtree(db, page.id, None, next_position(db, None, page.owner_id))
+    if survivors:
+        record_page_changes(db, [page.id for page in survivors], None)
+        db.commit()
+
+    reclaimed = {"pages": 0, "page_versions": 0, "comments": 0, "page_collaborations": 0, "page_links": 0}
+    for start in range(0, len(page_ids), batch_size):
+        batch = page_ids[start:start + batch_size]
+        record_page_changes(db, batch, None, "delete")
+        deleted = {
+            "page_versions": db.execute(delete(PageVersion).where(PageVersion.page_id.in_(batch))).rowcount,
+            "comments": db.execute(delete(Comment).where(Comment.page_id.in_(batch))).rowcount,
+            "page_collaborations": db.execute(
+                delete(PageCollaboration).where(PageCollaboration.page_id.in_(batch))
+            ).rowcount,
+            "page_links": db.execute(delete(PageLink).where(PageLink.source_page_id.in_(batch))).rowcount,
+            "pages": db.execute(delete(Page).where(Page.id.in_(batch))).rowcount,
+        }
+        db.commit()
+        for table, count in deleted.items():
+            reclaimed[table] += count
+            metrics.inc("purged_rows", count, table=table)
+        if on_progress is not None:
+            on_progress(start + len(batch), len(page_ids))
+
+    return reclaimed
@@ -0,0 +1,91 @@
+import time
+from typing import Dict, List, Optional
+from fastapi import WebSocket
+
+class Connection:
+    """State kept for each open socket."""
+
+    __slots__ = ("websocket", "user_id", "username", "codec", "pages", "workspace", "last_seen")
+
+    def __init__(self, websocket: WebSocket, user_id: str, username: str, codec):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.username = username
+        # Wire format negotiated for this socket, see app.ws_protocol
+        self.codec = codec
+        # page_id -> whether this user may write to the page
+        self.pages: Dict[str, bool] = {}
+        self.workspace = False
+        self.last_seen = time.monotonic()
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+class PresenceEntry:
+    __slots__ = ("username", "tabs")
+
+    def __init__(self, username: str):
+        self.username = username
+        self.tabs = 0
+
+class PresenceTracker:
+    """Users present on each page, counted once however many tabs they have open."""
+
+    def __init__(self):
+        self.page_users: Dict[str, Dict[str, PresenceEntry]] = {}
+        # Present users per username on each page, for lookups by name
+        self.page_usernames: Dict[str, Dict[str, int]] = {}
+        # Serialized user lists, rebuilt only when a page's presence changes
+        self.snapshots: Dict[str, List[dict]] = {}
+
+    def join(self, page_id: str, user_id: str, username: str) -> bool:
+        """Add a tab of a user to a page. Returns True if the user was not present yet."""
+        users = self.page_users.setdefault(page_id, {})
+        entry = users.get(user_id)
+        first_tab = entry is None
+        if first_tab:
+            entry = users[user_id] = PresenceEntry(username)
+            usernames = self.page_usernames.setdefault(page_id, {})
+            usernames[username] = usernames.get(username, 0) + 1
+            self.snapshots.pop(page_id, None)
+        entry.tabs += 1
+        return first_tab
+
+    def leave(self, page_id: str, user_id: str) -> bool:
+        """Remove a tab of a user from a page. Returns True if it was their last one."""
+        users = self.page_users.get(page_id)
+        entry = users.get(user_id) if users else None
+        if entry is None:
+            return False
+
+        entry.tabs -= 1
+        if entry.tabs > 0:
+            return False
+
+        del users[user_id]
+        usernames = self.page_usernames[page_id]
+        usernames[entry.username] -= 1
+        if not usernames[entry.username]:
+            del usernames[entry.username]
+        if not users:
+            del self.page_users[page_id]
+            del self.page_usernames[page_id]
+        self.snapshots.pop(page_id, None)
+        return True
+
+    def users(self, page_id: str) -> List[dict]:
+        snapshot = self.snapshots.get(page_id)
+        if snapshot is None:
+            users = self.page_users.get(page_id)
+            if not users:
+                return []
+            snapshot = self.snapshots[page_id] = [
+                {"user_id": user_id, "username": entry.username}
+                for user_id, entry in users.items()
+            ]
+        return snapshot
+
+    def is_present(self, page_id: str, user_id: Optional[str] = None, username: Optional[str] = None) -> bool:
+        if user_id is not None:
+            return user_id in self.page_users.get(page_id, ())
+        return username in self.page_usernames.get(page_id, ())
@@ -0,0 +1,372 @@
+import re
+import html
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Page, PageCollaboration
+
+TAG_RE = re.compile(r"<[^>]+>")
+BLOCK_END_RE = re.compile(r"</(?:p|h[1-6]|li|blockquote|pre|div|tr)>|<br\s*/?>", re.IGNORECASE)
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i if in into is it its of on or so that the their
+there these this to was we were what when which who will with you your
+""".split())
+
+def html_to_paragraphs(content: str) -> List[str]:
+    """Split editor HTML into plain-text blocks."""
+    blocks = BLOCK_END_RE.split(content or "")
+    paragraphs = []
+    for block in blocks:
+        text = html.unescape(TAG_RE.sub(" ", block))
+        text = " ".join(text.split())
+        if text:
+            paragraphs.append(text)
+    return paragraphs
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS and len(word) > 1]
+
+def estimate_tokens(text: str) -> int:
+    """Rough model token count, about four characters per token."""
+    return max(1, len(text) // 4)
+
+def chunk_paragraphs(paragraphs: List[str], chunk_words: int) -> List[str]:
+    """Merge paragraphs into chunks of about `chunk_words` words, splitting long ones."""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for paragraph in paragraphs:
+        words = paragraph.split()
+        while len(words) > chunk_words:
+            if current:
+                chunks.append(" ".join(current))
+                current, size = [], 0
+            chunks.append(" ".join(words[:chunk_words]))
+            words = words[chunk_words:]
+        if size + len(words) > chunk_words and current:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(" ".join(words))
+        size += len(words)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+class Chunk:
+    """A passage of a page with its term ids and counts, stored at `row` of the index."""
+
+    __slots__ = ("page_id", "position", "text", "term_ids", "counts", "length", "row")
+
+    def __init__(self, page_id: str, position: int, text: str, term_ids: np.ndarray, counts: np.ndarray, length: int):
+        self.page_id = page_id
+        self.position = position
+        self.text = text
+        self.term_ids = term_ids
+        self.counts = counts
+        self.length = length
+        self.row = -1
+
+class RetrievalIndex:
+    """BM25 index over page chunks, held in NumPy arrays.
+
+    Pages are chunked and tokenized when they are saved, and only the
+    postings of their terms change. Document frequencies and chunk lengths
+    are kept as running totals, so BM25 weights are worked out at query time
+    for the query's terms and nothing is rebuilt.
+    """
+
+    def __init__(self, chunk_words: int, k1: float = 1.2, b: float = 0.75):
+        self.chunk_words = chunk_words
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.vocab: Dict[str, int] = {}
+        self.terms: Dict[int, str] = {}
+        self.next_term_id = 0
+        self.pages: Dict[str, List[Chunk]] = {}
+        self.titles: Dict[str, str] = {}
+        # Chunks by row, with their lengths and page slots; rows of removed chunks are reused
+        self.rows: List[Optional[Chunk]] = []
+        self.free_rows: List[int] = []
+        self.row_lengths = np.zeros(0, dtype=np.float32)
+        self.row_pages = np.zeros(0, dtype=np.int32)
+        self.chunk_count = 0
+        self.total_length = 0
+        # Page slots to add up scores per page; slots of removed pages are reused
+        self.page_slots: Dict[str, int] = {}
+        self.slot_pages: List[Optional[str]] = []
+        self.free_slots: List[int] = []
+        # Term id -> {row: count}; the number of rows is the term's document frequency
+        self.term_rows: Dict[int, Dict[int, float]] = {}
+        # The same postings as arrays, made on the first query after the term changed
+        self.term_arrays: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    # Maintenance
+
+    def _term_ids(self, tokens: Iterable[str], add: bool) -> Tuple[np.ndarray, np.ndarray]:
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                if not add:
+                    continue
+                term_id = self.vocab[token] = self.next_term_id
+                self.terms[term_id] = token
+                self.next_term_id += 1
+            counts[term_id] = counts.get(term_id, 0) + 1
+        return (
+            np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)),
+            np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        )
+
+    def _add_chunk(self, chunk: Chunk, slot: int):
+        if self.free_rows:
+            row = self.free_rows.pop()
+            self.rows[row] = chunk
+        else:
+            row = len(self.rows)
+            self.rows.append(chunk)
+            if row >= len(self.row_lengths):
+                capacity = max(64, 2 * len(self.row_lengths))
+                self.row_lengths = np.resize(self.row_lengths, capacity)
+                self.row_pages = np.resize(self.row_pages, capacity)
+        chunk.row = row
+        self.row_lengths[row] = chunk.length
+        self.row_pages[row] = slot
+        self.chunk_count += 1
+        self.total_length += chunk.length
+        for term_id, count in zip(chunk.term_ids.tolist(), chunk.counts.tolist()):
+            self.term_rows.setdefault(term_id, {})[row] = count
+            self.term_arrays.pop(term_id, None)
+
+    def _remove_chunk(self, chunk: Chunk):
+        for term_id in chunk.term_ids.tolist():
+            postings = self.term_rows[term_id]
+            del postings[chunk.row]
+            self.term_arrays.pop(term_id, None)
+            if not postings:
+                # No chunk has the term any more
+                del self.term_rows[term_id]
+                del self.vocab[self.terms.pop(term_id)]
+        self.rows[chunk.row] = None
+        self.free_rows.append(chunk.row)
+        self.chunk_count -= 1
+        self.total_length -= chunk.length
+
+    def index_page(self, page_id: str, title: str, content: str):
+        """(Re)index a page after it was created or saved."""
+        texts = chunk_paragraphs(html_to_paragraphs(content), self.chunk_words)
+        with self.lock:
+            chunks = []
+            for position, text in enumerate(texts):
+                # The title is part of every chunk so short passages still match on it
+                tokens = tokenize(f"{title} {text}")
+                term_ids, counts = self._term_ids(tokens, add=True)
+                chunks.append(Chunk(page_id, position, text, term_ids, counts, len(tokens)))
+            if not chunks and title:
+                tokens = tokenize(title)
+                term_ids, counts = self._term_ids(tokens, add=True)
+                chunks.append(Chunk(page_id, 0, "", term_ids, counts, len(tokens)))
+
+            slot = self.page_slots.get(page_id)
+            if slot is None:
+                slot = self.free_slots.pop() if self.free_slots else len(self.slot_pages)
+                if slot == len(self.slot_pages):
+                    self.slot_pages.append(page_id)
+                else:
+                    self.slot_pages[slot] = page_id
+                self.page_slots[page_id] = slot
+            # New chunks go in first, so terms they share with the old ones are never pruned
+            for chunk in chunks:
+                self._add_chunk(chunk, slot)
+            for chunk in self.pages.get(page_id) or []:
+                self._remove_chunk(chunk)
+            self.pages[page_id] = chunks
+            self.titles[page_id] = title
+
+    def update_page(self, page_id: str, title: str, content: str, archived: bool = False):
+        """Index a saved page, or drop it once it is archived."""
+        if archived:
+            self.remove_page(page_id)
+        else:
+            self.index_page(page_id, title, content)
+
+    def remove_page(self, page_id: str):
+        with self.lock:
+            chunks = self.pages.pop(page_id, None)
+            if chunks is None:
+                return
+            for chunk in chunks:
+                self._remove_chunk(chunk)
+            self.titles.pop(page_id, None)
+            slot = self.page_slots.pop(page_id)
+            self.slot_pages[slot] = None
+            self.free_slots.append(slot)
+
+    # Queries
+
+    def _idf(self, df):
+        n = max(self.chunk_count, 1)
+        return np.log1p((n - df + 0.5) / (df + 0.5))
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self.term_arrays.get(term_id)
+        if arrays is None:
+            postings = self.term_rows[term_id]
+            arrays = self.term_arrays[term_id] = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            )
+        return arrays
+
+    def _score(self, term_ids: np.ndarray, term_weights: np.ndarray) -> np.ndarray:
+        scores = np.zeros(len(self.rows), dtype=np.float32)
+        avg_length = self.total_length / self.chunk_count if self.chunk_count else 1.0
+        for term_id, weight in zip(term_ids.tolist(), term_weights.tolist()):
+            rows, counts = self._postings(term_id)
+            norm = self.k1 * (1 - self.b + self.b * self.row_lengths[rows] / max(avg_length, 1.0))
+            idf = self._idf(len(rows))
+            scores[rows] += (weight * idf * counts * (self.k1 + 1) / (counts + norm)).astype(np.float32)
+        return scores
+
+    def _allowed_rows(self, allowed: Optional[Set[str]]) -> Optional[np.ndarray]:
+        if allowed is None:
+            return None
+        mask = np.zeros(len(self.rows), dtype=bool)
+        rows = [chunk.row for page_id in allowed for chunk in self.pages.get(page_id) or []]
+        mask[rows] = True
+        return mask
+
+    def search(self, query: str, allowed: Optional[Set[str]] = None, limit: int = 10) -> List[Tuple[float, Chunk]]:
+        """Best matching chunks for a query, restricted to `allowed` page ids."""
+        with self.lock:
+            term_ids, counts = self._term_ids(tokenize(query), add=False)
+            if not len(term_ids) or not self.chunk_count:
+                return []
+            scores = self._score(term_ids, np.ones_like(counts))
+            mask = self._allowed_rows(allowed)
+            if mask is not None:
+                scores[~mask] = 0
+            return self._top(scores, limit)
+
+    def _top(self, scores: np.ndarray, limit: int) -> List[Tuple[float, Chunk]]:
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(float(scores[row]), self.rows[row]) for row in candidates]
+
+    def _page_profile(self, page_id: str, max_terms: int = 32) -> Tuple[np.ndarray, np.ndarray]:
+        """The page's most distinctive terms, weighted by TF-IDF."""
+        chunks = self.pages.get(page_id) or []
+        if not chunks:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        term_ids, inverse = np.unique(np.concatenate([chunk.term_ids for chunk in chunks]), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate([chunk.counts for chunk in chunks]))
+        df = np.array([len(self.term_rows[term_id]) for term_id in term_ids.tolist()], dtype=np.float32)
+        tfidf = (totals * self._idf(df)).astype(np.float32)
+        top = np.flatnonzero(tfidf > 0)
+        if len(top) > max_terms:
+            top = top[np.argpartition(-tfidf[top], max_terms - 1)[:max_terms]]
+        return term_ids[top].astype(np.int32), tfidf[top] / max(float(tfidf[top].max()), 1e-6)
+
+    def related_pages(self, page_id: str, allowed: Optional[Set[str]] = None, limit: int = 5) -> List[Tuple[str, float]]:
+        """Pages whose best chunk matches this page's distinctive terms, best first."""
+        with self.lock:
+            term_ids, term_weights = self._page_profile(page_id)
+            if not len(term_ids):
+                return []
+            scores = self._score(term_ids, term_weights)
+            mask = self._allowed_rows(allowed)
+            if mask is not None:
+                scores[~mask] = 0
+
+            # Free rows score 0, so whatever slot they still point at is unaffected
+            page_scores = np.zeros(len(self.slot_pages), dtype=np.float32)
+            np.maximum.at(page_scores, self.row_pages[:len(self.rows)], scores)
+            page_scores[self.page_slots[page_id]] = 0
+
+            ranked = np.flatnonzero(page_scores > 0)
+            ranked = ranked[np.argsort(-page_scores[ranked], kind="stable")][:limit]
+            return [(self.slot_pages[i], float(page_scores[i])) for i in ranked]
+
+    def assemble_context(
+        self,
+        page_id: str,
+        query: str,
+        allowed: Optional[Set[str]] = None,
+        token_budget: int = 1500,
+        related_limit: int = 3
+    ) -> str:
+        """Pick the passages most relevant to `query` from a page and its related pages.
+
+        Chunks of the page itself come first, in document order when they all
+        fit. Chunks of related pages fill whatever budget is left.
+        """
+        own_chunks = list(self.pages.get(page_id) or [])
+        if sum(estimate_tokens(chunk.text) for chunk in own_chunks) <= token_budget:
+            selected = own_chunks
+        else:
+            ranked = [chunk for _, chunk in self.search(query, {page_id}, limit=len(own_chunks))]
+            # Passages that do not match the query follow in document order
+            ranked += [chunk for chunk in own_chunks if chunk not in ranked]
+            selected, used = [], 0
+            for chunk in ranked:
+                cost = estimate_tokens(chunk.text)
+                if used + cost <= token_budget:
+                    selected.append(chunk)
+                    used += cost
+            selected.sort(key=lambda chunk: chunk.position)
+
+        parts = [chunk.text for chunk in selected if chunk.text]
+        used = sum(estimate_tokens(chunk.text) for chunk in selected)
+
+        for related_id, _ in self.related_pages(page_id, allowed, related_limit):
+            for _, chunk in self.search(query + " " + self.titles.get(page_id, ""), {related_id}, limit=2):
+                cost = estimate_tokens(chunk.text)
+                if chunk.text and used + cost <= token_budget:
+                    parts.append(f"From \"{self.titles.get(related_id, '')}\":\n{chunk.text}")
+                    used += cost
+        return "\n\n".join(parts)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "pages": len(self.pages),
+                "chunks": self.chunk_count,
+                "terms": len(self.vocab),
+            }
+
+def load_retrieval_index(index: "RetrievalIndex"):
+    """Index every page that is not archived, e.g. at startup."""
+    db = SessionLocal()
+    try:
+        rows = db.query(Page.id, Page.title, Page.content).filter(Page.is_archived == False).yield_per(500)
+        for page_id, title, content in rows:
+            index.index_page(page_id, title, content)
+    finally:
+        db.close()
+
+def index_pages(db: Session, index: "RetrievalIndex", page_ids: List[str]):
+    """Index pages created or changed in bulk, e.g. by a subtree copy or a batch."""
+    for start in range(0, len(page_ids), 500):
+        rows = db.query(Page.id, Page.title, Page.content, Page.is_archived).filter(
+            Page.id.in_(page_ids[start:start + 500])
+        ).all()
+        for page_id, title, content, is_archived in rows:
+            index.update_page(page_id, title, content, is_archived)
+
+def accessible_page_ids(db: Session, user_id: str) -> Set[str]:
+    """Pages a user owns or collaborates on, the scope for related pages."""
+    owned = db.query(Page.id).filter(Page.owner_id == user_id)
+    shared = db.query(PageCollaboration.page_id).filter(PageCollaboration.user_id == user_id)
+    return {page_id for (page_id,) in owned.union(shared).all()}
+
+# Global retrieval index instance
+retrieval_index = RetrievalIndex(chunk_words=settings.RETRIEVAL_CHUNK_WORDS)
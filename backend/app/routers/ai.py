@@ -1,16 +1,144 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from typing import AsyncIterator, Optional, Tuple
 import httpx
+import asyncio
+import json
+import time
 import os
 
 from app.database import get_db
-from app.auth import get_current_active_user
+from app.auth import get_current_active_user, check_page_permission
 from app.models import User
 from app.schemas import AIRequest, AIResponse
 from app.config import settings
+from app.ai_cache import ai_cache, cache_key
+from app.metrics import metrics
+from app.http_client import http_client
+from app.ai_scheduler import ai_scheduler, SchedulerRejected
+from app.retrieval import retrieval_index, accessible_page_ids
 
 router = APIRouter()
 
+MOCK_RESPONSES = {
+    "improve": "Here's an improved version of your text with better clarity and structure.",
+    "continue": "Continuing from where you left off, here are some additional thoughts...",
+    "summarize": "Summary: This text discusses the main points concisely.",
+    "expand": "Let me expand on this topic with more details and examples...",
+    "simplify": "Here's a simplified version that's easier to understand...",
+    "formal": "Here's a more formal version of your text...",
+    "casual": "Here's a more casual, friendly version...",
+    "bullets": "Here are the key points in bullet format:\n• Point 1\n• Point 2\n• Point 3",
+}
+
+def mock_response(request: AIRequest) -> str:
+    if request.command == "custom":
+        return f"Here's a response to your custom request: {request.prompt}"
+    return MOCK_RESPONSES.get(request.command, "Processing your request...")
+
+def claude_headers() -> dict:
+    return {
+        "Content-Type": "application/json",
+        "x-api-key": settings.CLAUDE_API_KEY,
+        "anthropic-version": "2023-06-01"
+    }
+
+def claude_payload(request: AIRequest, stream: bool = False) -> dict:
+    payload = {
+        "model": settings.CLAUDE_MODEL,
+        "max_tokens": 1024,
+        "messages": [{
+            "role": "user",
+            "content": f"{request.command}: {request.prompt}\n\nContext: {request.context or ''}"
+        }]
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+async def request_completion(request: AIRequest) -> AIResponse:
+    """Send an AI request upstream to Claude."""
+    try:
+        # Real Claude API integration
+        response = await http_client.post(
+            settings.CLAUDE_API_URL,
+            headers=claude_headers(),
+            json=claude_payload(request),
+            timeout=30.0
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            content = data["content"][0]["text"]
+            
+            return AIResponse(
+                success=True,
+                result=content,
+                usage=data.get("usage", {})
+            )
+        else:
+            return AIResponse(
+                success=False,
+                result="",
+                error=f"Claude API error: {response.status_code}"
+            )
+    
+    except Exception as e:
+        return AIResponse(
+            success=False,
+            result="",
+            error=f"Failed to process AI request: {str(e)}"
+        )
+
+async def with_page_context(request: AIRequest, user: User, db: Session) -> AIRequest:
+    """Replace the client's context with passages from the request's page and related pages.
+    
+    The client context and the prompt decide which passages are most relevant
+    when the page does not fit in the token budget.
+    """
+    if not request.page_id:
+        return request
+    
+    check_page_permission(request.page_id, user, db, "read")
+    allowed = accessible_page_ids(db, user.id)
+    context = await run_in_threadpool(
+        retrieval_index.assemble_context,
+        request.page_id,
+        f"{request.prompt} {request.context or ''}",
+        allowed,
+        settings.AI_CONTEXT_TOKEN_BUDGET,
+        settings.AI_CONTEXT_RELATED_PAGES
+    )
+    return request.model_copy(update={"context": context or request.context})
+
+BUSY_ERROR = "AI service is busy, please try again in a moment"
+
+def admit(user: User):
+    """Reject the request with 429 if the user is over budget or has too much queued."""
+    try:
+        ai_scheduler.check_admission(user.id)
+    except SchedulerRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
+
+async def scheduled_completion(request: AIRequest, user_id: str) -> AIResponse:
+    """Send an AI request upstream once the scheduler grants it a slot."""
+    priority = ai_scheduler.priority_for(request.command)
+    try:
+        async with ai_scheduler.slot(user_id, priority, settings.AI_QUEUE_TIMEOUT_SECONDS):
+            response = await request_completion(request)
+    except asyncio.TimeoutError:
+        metrics.inc("ai_scheduler_rejected", reason="timeout")
+        return AIResponse(success=False, result="", error=BUSY_ERROR)
+    
+    if response.success:
+        ai_scheduler.charge(user_id, response.usage)
+    return response
+
 @router.post("/claude", response_model=AIResponse)
 async def claude_ai(
     request: AIRequest,
@@ -21,66 +149,176 @@ async def claude_ai(
     
     if not settings.CLAUDE_API_KEY:
         # Return mock response if no API key
-        mock_responses = {
-            "improve": "Here's an improved version of your text with better clarity and structure.",
-            "continue": "Continuing from where you left off, here are some additional thoughts...",
-            "summarize": "Summary: This text discusses the main points concisely.",
-            "expand": "Let me expand on this topic with more details and examples...",
-            "simplify": "Here's a simplified version that's easier to understand...",
-            "formal": "Here's a more formal version of your text...",
-            "casual": "Here's a more casual, friendly version...",
-            "bullets": "Here are the key points in bullet format:\n• Point 1\n• Point 2\n• Point 3",
-            "custom": f"Here's a response to your custom request: {request.prompt}"
-        }
-        
-        response = mock_responses.get(request.command, "Processing your request...")
-        
         return AIResponse(
             success=True,
-            result=response,
+            result=mock_response(request),
             usage={"tokens": 100}
         )
     
+    admit(current_user)
+    request = await with_page_context(request, current_user, db)
+    
+    ttl = ai_cache.ttl_for(request.command) if settings.AI_CACHE_ENABLED else 0
+    if not ttl:
+        metrics.inc("ai_cache_requests", result="bypass")
+        return await scheduled_completion(request, current_user.id)
+    
+    # Identical requests (same command, prompt and context) share one result
+    failed: Optional[AIResponse] = None
+    
+    async def fetch() -> Optional[dict]:
+        nonlocal failed
+        response = await scheduled_completion(request, current_user.id)
+        if not response.success:
+            failed = response
+            return None
+        return {"result": response.result, "usage": response.usage}
+    
+    key = cache_key(settings.CLAUDE_MODEL, request.command, request.prompt, request.context)
+    value, cached = await ai_cache.get_or_fetch(key, ttl, fetch)
+    if value is None:
+        return failed or AIResponse(success=False, result="", error="Failed to process AI request")
+    
+    return AIResponse(success=True, result=value["result"], usage=value["usage"], cached=cached)
+
+@router.get("/cache/stats")
+async def ai_cache_stats(current_user: User = Depends(get_current_active_user)):
+    """AI result cache size and hit/miss counts."""
+    return ai_cache.stats()
+
+@router.get("/queue")
+async def ai_queue(current_user: User = Depends(get_current_active_user)):
+    """Upstream slots in use, queue lengths, and the user's queue positions and token budget."""
+    return ai_scheduler.stats(current_user.id)
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def iter_upstream_events(response: httpx.Response) -> AsyncIterator[Tuple[str, dict]]:
+    """Parse the upstream Server-Sent Events stream into (event, data) pairs."""
+    event = "message"
+    data_lines = []
+    async for line in response.aiter_lines():
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+        elif not line and data_lines:
+            try:
+                yield event, json.loads("\n".join(data_lines))
+            except json.JSONDecodeError:
+                pass
+            event = "message"
+            data_lines = []
+
+async def wait_for_slot(ticket) -> AsyncIterator[str]:
+    """Wait for a scheduler slot, yielding a `queued` event whenever the position changes."""
+    deadline = time.perf_counter() + settings.AI_QUEUE_TIMEOUT_SECONDS
+    position = None
+    while not ticket.granted:
+        current = ai_scheduler.position(ticket)
+        if current != position:
+            position = current
+            yield sse_event("queued", {"position": position})
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        try:
+            await ai_scheduler.wait(ticket, min(1.0, remaining))
+        except asyncio.TimeoutError:
+            pass
+
+async def stream_completion(request: AIRequest, user_id: str) -> AsyncIterator[str]:
+    """Proxy an upstream completion as SSE `delta` events, ending with `done` or `error`.
+    
+    While the request waits for an upstream slot, `queued` events report its
+    position. When the client disconnects the response task is cancelled,
+    which closes the upstream connection and stops generation there.
+    """
+    started = time.perf_counter()
+    first_token = True
+    usage = {}
+    ticket = None
     try:
-        # Real Claude API integration
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.anthropic.com/v1/messages",
-                headers={
-                    "Content-Type": "application/json",
-                    "x-api-key": settings.CLAUDE_API_KEY,
-                    "anthropic-version": "2023-06-01"
-                },
-                json={
-                    "model": "claude-3-opus-20240229",
-                    "max_tokens": 1024,
-                    "messages": [{
-                        "role": "user",
-                        "content": f"{request.command}: {request.prompt}\n\nContext: {request.context or ''}"
-                    }]
-                },
-                timeout=30.0
-            )
+        if not settings.CLAUDE_API_KEY:
+            # Stream the mock response word by word if no API key
+            for word in mock_response(request).split(" "):
+                if first_token:
+                    metrics.observe("ai_time_to_first_token_seconds", time.perf_counter() - started, mode="mock")
+                    first_token = False
+                yield sse_event("delta", {"text": word + " "})
+                await asyncio.sleep(0.02)
+            yield sse_event("done", {"usage": {"tokens": 100}})
+            return
+        
+        ticket = ai_scheduler.enqueue(user_id, ai_scheduler.priority_for(request.command, stream=True))
+        async for event in wait_for_slot(ticket):
+            yield event
+        
+        async with http_client.stream(
+            "POST",
+            settings.CLAUDE_API_URL,
+            headers=claude_headers(),
+            json=claude_payload(request, stream=True),
+            timeout=httpx.Timeout(30.0, read=60.0)
+        ) as response:
+            if response.status_code != 200:
+                metrics.inc("ai_stream_requests", result="upstream_error")
+                yield sse_event("error", {"error": f"Claude API error: {response.status_code}"})
+                return
             
-            if response.status_code == 200:
-                data = response.json()
-                content = data["content"][0]["text"]
-                
-                return AIResponse(
-                    success=True,
-                    result=content,
-                    usage=data.get("usage", {})
-                )
-            else:
-                return AIResponse(
-                    success=False,
-                    result="",
-                    error=f"Claude API error: {response.status_code}"
-                )
-                
+            async for event, data in iter_upstream_events(response):
+                if event == "content_block_delta":
+                    text = data.get("delta", {}).get("text")
+                    if not text:
+                        continue
+                    if first_token:
+                        metrics.observe("ai_time_to_first_token_seconds", time.perf_counter() - started, mode="upstream")
+                        first_token = False
+                    yield sse_event("delta", {"text": text})
+                elif event == "message_start":
+                    usage.update(data.get("message", {}).get("usage", {}))
+                elif event == "message_delta":
+                    usage.update(data.get("usage", {}))
+                elif event == "error":
+                    metrics.inc("ai_stream_requests", result="upstream_error")
+                    yield sse_event("error", {"error": data.get("error", {}).get("message", "Claude API error")})
+                    return
+                elif event == "message_stop":
+                    break
+        
+        metrics.inc("ai_stream_requests", result="completed")
+        metrics.observe("ai_stream_duration_seconds", time.perf_counter() - started)
+        yield sse_event("done", {"usage": usage})
+    
+    except asyncio.CancelledError:
+        metrics.inc("ai_stream_requests", result="cancelled")
+        raise
+    except asyncio.TimeoutError:
+        metrics.inc("ai_scheduler_rejected", reason="timeout")
+        yield sse_event("error", {"error": BUSY_ERROR})
     except Exception as e:
-        return AIResponse(
-            success=False,
-            result="",
-            error=f"Failed to process AI request: {str(e)}"
-        ) 
\ No newline at end of file
+        metrics.inc("ai_stream_requests", result="failed")
+        yield sse_event("error", {"error": f"Failed to process AI request: {str(e)}"})
+    finally:
+        if ticket is not None:
+            ai_scheduler.release(ticket)
+            # Tokens generated before a disconnect are still billed upstream
+            ai_scheduler.charge(user_id, usage)
+
+@router.post("/claude/stream")
+async def claude_ai_stream(
+    request: AIRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Generate content using Claude AI, streamed token by token as Server-Sent Events."""
+    if settings.CLAUDE_API_KEY:
+        admit(current_user)
+        request = await with_page_context(request, current_user, db)
+    
+    return StreamingResponse(
+        stream_completion(request, current_user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
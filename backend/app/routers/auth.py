@@ -2,51 +2,21 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import timedelta, datetime
-import httpx
 import secrets
 from sqlalchemy.sql import func
 from sqlalchemy import inspect
 from dateutil.parser import parse as parse_datetime
-import os
-import requests
 
 from app.database import get_db
 from app.auth import authenticate_user, create_access_token, get_current_active_user, get_password_hash
 from app.models import User, PasswordResetToken
 from app.schemas import UserCreate, UserResponse, Token, LoginRequest, PasswordResetRequest, PasswordReset
 from app.config import settings
+from app.http_client import http_client
+from app.email_outbox import enqueue_email, request_delivery
 
 router = APIRouter()
 
-def send_email(to_email: str, subject: str, content: str):
-    api_key = os.getenv("SENDGRID_API_KEY")
-    sender = os.getenv("SENDGRID_SENDER_EMAIL")
-    if not api_key or not sender:
-        print("[SendGrid] Missing API key or sender email.")
-        return
-    data = {
-        "personalizations": [
-            {"to": [{"email": to_email}]}
-        ],
-        "from": {"email": sender},
-        "subject": subject,
-        "content": [
-            {"type": "text/plain", "value": content}
-        ]
-    }
-    resp = requests.post(
-        "https://api.sendgrid.com/v3/mail/send",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        },
-        json=data
-    )
-    if resp.status_code >= 400:
-        print(f"[SendGrid] Failed to send email: {resp.text}")
-    else:
-        print(f"[SendGrid] Email sent to {to_email}")
-
 @router.post("/register", response_model=UserResponse)
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """Register a new user."""
@@ -141,35 +111,35 @@ async def oauth_google(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Missing code")
 
     # Exchange code for tokens
-    async with httpx.AsyncClient() as client:
-        token_resp = await client.post(
-            "https://oauth2.googleapis.com/token",
-            data={
-                "client_id": settings.GOOGLE_CLIENT_ID,
-                "client_secret": settings.GOOGLE_CLIENT_SECRET,
-                "code": code,
-                "grant_type": "authorization_code",
-                "redirect_uri": data.get("redirect_uri"),
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-        )
-        token_json = token_resp.json()
-        access_token = token_json.get("access_token")
-        id_token = token_json.get("id_token")
-        if not access_token:
-            raise HTTPException(status_code=400, detail="Failed to get access token from Google")
+    client = http_client
+    token_resp = await client.post(
+        "https://oauth2.googleapis.com/token",
+        data={
+            "client_id": settings.GOOGLE_CLIENT_ID,
+            "client_secret": settings.GOOGLE_CLIENT_SECRET,
+            "code": code,
+            "grant_type": "authorization_code",
+            "redirect_uri": data.get("redirect_uri"),
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    token_json = token_resp.json()
+    access_token = token_json.get("access_token")
+    id_token = token_json.get("id_token")
+    if not access_token:
+        raise HTTPException(status_code=400, detail="Failed to get access token from Google")
 
-        # Get user info
-        userinfo_resp = await client.get(
-            "https://www.googleapis.com/oauth2/v2/userinfo",
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
-        userinfo = userinfo_resp.json()
-        email = userinfo.get("email")
-        sub = userinfo.get("id")
-        name = userinfo.get("name")
-        if not email or not sub:
-            raise HTTPException(status_code=400, detail="Failed to get user info from Google")
+    # Get user info
+    userinfo_resp = await client.get(
+        "https://www.googleapis.com/oauth2/v2/userinfo",
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    userinfo = userinfo_resp.json()
+    email = userinfo.get("email")
+    sub = userinfo.get("id")
+    name = userinfo.get("name")
+    if not email or not sub:
+        raise HTTPException(status_code=400, detail="Failed to get user info from Google")
 
     # Find or create user
     user = db.query(User).filter_by(provider="google", provider_id=sub).first()
@@ -207,45 +177,45 @@ async def oauth_github(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Missing code")
 
     # Exchange code for access token
-    async with httpx.AsyncClient() as client:
-        token_resp = await client.post(
-            "https://github.com/login/oauth/access_token",
-            data={
-                "client_id": settings.GITHUB_CLIENT_ID,
-                "client_secret": settings.GITHUB_CLIENT_SECRET,
-                "code": code,
-                "redirect_uri": data.get("redirect_uri"),
-            },
-            headers={"Accept": "application/json"},
-        )
-        token_json = token_resp.json()
-        access_token = token_json.get("access_token")
-        if not access_token:
-            raise HTTPException(status_code=400, detail="Failed to get access token from GitHub")
+    client = http_client
+    token_resp = await client.post(
+        "https://github.com/login/oauth/access_token",
+        data={
+            "client_id": settings.GITHUB_CLIENT_ID,
+            "client_secret": settings.GITHUB_CLIENT_SECRET,
+            "code": code,
+            "redirect_uri": data.get("redirect_uri"),
+        },
+        headers={"Accept": "application/json"},
+    )
+    token_json = token_resp.json()
+    access_token = token_json.get("access_token")
+    if not access_token:
+        raise HTTPException(status_code=400, detail="Failed to get access token from GitHub")
 
-        # Get user info
-        userinfo_resp = await client.get(
-            "https://api.github.com/user",
+    # Get user info
+    userinfo_resp = await client.get(
+        "https://api.github.com/user",
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    userinfo = userinfo_resp.json()
+    github_id = str(userinfo.get("id"))
+    email = userinfo.get("email")
+    name = userinfo.get("name") or userinfo.get("login")
+    if not github_id:
+        raise HTTPException(status_code=400, detail="Failed to get user info from GitHub")
+    # GitHub may not return email if it's private, fetch from /emails
+    if not email:
+        emails_resp = await client.get(
+            "https://api.github.com/user/emails",
             headers={"Authorization": f"Bearer {access_token}"}
         )
-        userinfo = userinfo_resp.json()
-        github_id = str(userinfo.get("id"))
-        email = userinfo.get("email")
-        name = userinfo.get("name") or userinfo.get("login")
-        if not github_id:
-            raise HTTPException(status_code=400, detail="Failed to get user info from GitHub")
-        # GitHub may not return email if it's private, fetch from /emails
-        if not email:
-            emails_resp = await client.get(
-                "https://api.github.com/user/emails",
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            emails = emails_resp.json()
-            if isinstance(emails, list):
-                primary = next((e for e in emails if e.get("primary")), None)
-                email = primary["email"] if primary else emails[0]["email"] if emails else None
-        if not email:
-            raise HTTPException(status_code=400, detail="Failed to get email from GitHub")
+        emails = emails_resp.json()
+        if isinstance(emails, list):
+            primary = next((e for e in emails if e.get("primary")), None)
+            email = primary["email"] if primary else emails[0]["email"] if emails else None
+    if not email:
+        raise HTTPException(status_code=400, detail="Failed to get email from GitHub")
 
     # Find or create user
     user = db.query(User).filter_by(provider="github", provider_id=github_id).first()
@@ -286,14 +256,16 @@ async def password_reset_request(data: PasswordResetRequest, db: Session = Depen
     expires_at = datetime.utcnow() + timedelta(hours=1)
     reset_token = PasswordResetToken(user_id=user.id, token=token, expires_at=expires_at)
     db.add(reset_token)
-    db.commit()
-    # Send email with reset link
+    # Queue the email with reset link in the same transaction as the token
     reset_link = f"http://localhost:3000/reset-password?token={token}"
-    send_email(
+    enqueue_email(
+        db,
         to_email=user.email,
         subject="Password Reset for Notion Clone",
         content=f"Click the following link to reset your password: {reset_link}\nIf you did not request this, you can ignore this email."
     )
+    db.commit()
+    request_delivery()
     return {"message": "If that email exists, a reset link has been sent."}
 
 @router.post("/password-reset/reset")
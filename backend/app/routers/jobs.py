@@ -0,0 +1,124 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime
+
+from app.database import get_db
+from app.auth import get_current_active_user
+from app.models import User, Job
+from app.schemas import JobCreate, JobResponse
+from app.jobs import PUBLIC_JOB_TYPES, submit_job
+import app.job_handlers  # noqa: F401  registers the job handlers
+
+router = APIRouter()
+
+def get_user_job(job_id: str, user: User, db: Session) -> Job:
+    job = db.query(Job).filter(Job.id == job_id, Job.user_id == user.id).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+@router.post("/", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_job(
+    job_data: JobCreate,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Start a background job. Retries with the same Idempotency-Key return the original job."""
+    if job_data.type not in PUBLIC_JOB_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown job type: {job_data.type}"
+        )
+    
+    return await run_in_threadpool(
+        submit_job, db, current_user.id, job_data.type, job_data.params, idempotency_key
+    )
+
+@router.get("/", response_model=List[JobResponse])
+async def get_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the user's most recent jobs."""
+    return db.query(Job).filter(Job.user_id == current_user.id).order_by(
+        Job.created_at.desc()
+    ).limit(limit).all()
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get a job's status and progress."""
+    return get_user_job(job_id, current_user, db)
+
+@router.get("/{job_id}/result")
+async def get_job_result(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the result of a finished job."""
+    job = get_user_job(job_id, current_user, db)
+    if job.status in ("queued", "running"):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Job has not finished yet"
+        )
+    if job.status != "succeeded":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=job.error or f"Job {job.status}"
+        )
+    return job.result or {}
+
+@router.get("/{job_id}/download")
+async def download_job_file(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Download the file a finished job produced, e.g. an export."""
+    job = get_user_job(job_id, current_user, db)
+    path = (job.result or {}).get("file") if job.status == "succeeded" else None
+    if not path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="This job has no file to download"
+        )
+    if not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="The file is no longer available"
+        )
+    return FileResponse(path, filename=job.result.get("filename"))
+
+@router.post("/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Cancel a job. A running job stops at its next progress update."""
+    job = get_user_job(job_id, current_user, db)
+    if job.status not in ("queued", "running"):
+        return job
+    
+    # A queued job is cancelled right away unless a worker claims it first
+    db.query(Job).filter(Job.id == job_id, Job.status == "queued").update(
+        {"status": "cancelled", "finished_at": datetime.utcnow()}, synchronize_session=False
+    )
+    db.query(Job).filter(Job.id == job_id).update({"cancel_requested": True}, synchronize_session=False)
+    db.commit()
+    db.refresh(job)
+    return job
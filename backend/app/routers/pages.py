@@ -1,20 +1,109 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+import os
+import zipfile
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from urllib.parse import quote
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy import func, or_
+from typing import Dict, List, Optional, Set
 from datetime import datetime
 
 from app.database import get_db
-from app.auth import get_current_active_user, check_page_permission
-from app.models import User, Page, PageCollaboration, PageVersion, Comment
+from app.config import settings
+from app.auth import get_current_active_user, get_token_username, check_page_permission, check_page_permissions
+from app.models import User, Page, PageCollaboration, PageVersion, PageLink, Comment, PAGE_RESPONSE_OPTIONS, generate_uuid
 from app.schemas import (
     PageCreate, PageUpdate, PageResponse, 
     CollaborationCreate, CollaborationResponse,
-    CommentCreate, CommentResponse, SearchRequest, SearchResponse
+    CommentCreate, CommentResponse, SearchRequest, SearchResponse,
+    PresenceResponse, RelatedPageResponse, BacklinkResponse, DeepDuplicateResponse, JobResponse,
+    BatchRequest, BatchResponse, PageMove
 )
 from app.websocket import manager
+from app.page_buffer import page_buffer
+from app.retrieval import retrieval_index, accessible_page_ids, index_pages
+from app.page_tree import (
+    TreeError, count_subtree, duplicate_subtree, archive_subtree, restore_subtree,
+    live_parent_path, move_subtree, place_new_page, position_between
+)
+from app.jobs import submit_job
+from app.page_batch import BatchError, plan_batch, apply_batch
+from app.page_export import EXPORT_FORMATS, safe_name, stream_export
+from app.change_feed import record_change, record_page_changes
+from app.page_cache import page_cache, page_trees
+from app.page_links import update_page_links, notify_mentions
+from app.email_outbox import request_delivery
 
 router = APIRouter()
 
+def set_subtree_archived(page: Page, archived: bool, db: Session) -> List[str]:
+    """Archive or restore a page with its subtree, returning the ids of the pages changed."""
+    if archived == page.is_archived:
+        return []
+    if archived:
+        return archive_subtree(db, page.id)
+    if page.parent_id is not None and db.query(Page.is_archived).filter(Page.id == page.parent_id).scalar():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Restore the parent page first"
+        )
+    return restore_subtree(db, page.id)
+
+async def reindex_archived(db: Session, page_ids: List[str], archived: bool):
+    if archived:
+        for page_id in page_ids:
+            retrieval_index.remove_page(page_id)
+    else:
+        await run_in_threadpool(index_pages, db, retrieval_index, page_ids)
+
+async def invalidate_cached_pages(db: Session, page_ids, subtree: Optional[List[str]] = None):
+    """Drop changed pages from the public page cache, with the ancestors that render them as children."""
+    if settings.PUBLIC_PAGE_CACHE_ENABLED:
+        stale = await run_in_threadpool(page_trees, db, [page_id for page_id in page_ids if page_id is not None])
+        await page_cache.invalidate(stale | set(subtree or []))
+
+def tree_audiences(
+    db: Session,
+    pages: List[Page],
+    old_parent_ids: Optional[Dict[str, Optional[str]]] = None
+) -> Dict[str, Set[str]]:
+    """Users whose workspace tree shows each page: owners and collaborators of it and of its parent.
+
+    `old_parent_ids` adds the parents pages were moved away from.
+    """
+    related = {
+        page.id: {page.id, page.parent_id, (old_parent_ids or {}).get(page.id)} - {None}
+        for page in pages
+    }
+    page_ids = list(set().union(*related.values()))
+    members: Dict[str, Set[str]] = {}
+    owners = db.query(Page.id, Page.owner_id).filter(Page.id.in_(page_ids))
+    shared = db.query(PageCollaboration.page_id, PageCollaboration.user_id).filter(PageCollaboration.page_id.in_(page_ids))
+    for page_id, user_id in owners.union(shared).all():
+        members.setdefault(page_id, set()).add(user_id)
+    return {
+        page_id: set().union(*(members.get(related_id, set()) for related_id in related_ids))
+        for page_id, related_ids in related.items()
+    }
+
+def tree_audience(db: Session, page: Page, old_parent_id: Optional[str] = None) -> Set[str]:
+    return tree_audiences(db, [page], {page.id: old_parent_id})[page.id]
+
+def load_active_user(username: str, db: Session) -> User:
+    """The user behind a token checked by get_token_username."""
+    user = db.query(User).filter(User.username == username).first()
+    if user is None or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials"
+        )
+    return user
+
+def load_page(db: Session, page_id: str) -> Optional[Page]:
+    """A page with the content and sub-pages PageResponse renders."""
+    return db.query(Page).options(*PAGE_RESPONSE_OPTIONS).filter(Page.id == page_id).first()
+
 @router.post("/", response_model=PageResponse)
 async def create_page(
     page_data: PageCreate,
@@ -22,14 +111,33 @@ async def create_page(
     db: Session = Depends(get_db)
 ):
     """Create a new page."""
+    page_id = generate_uuid()
+    try:
+        placement = place_new_page(db, page_id, page_data.parent_id, current_user.id)
+    except TreeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    
     db_page = Page(
         **page_data.dict(),
+        **placement,
+        id=page_id,
         owner_id=current_user.id
     )
     
     db.add(db_page)
+    record_page_changes(db, [page_id], current_user.id)
+    mentions = update_page_links(db, {page_id: db_page.content or ""}, new_pages=True)
+    emails = notify_mentions(db, mentions, current_user)
     db.commit()
-    db.refresh(db_page)
+    db_page = load_page(db, page_id)
+    if emails:
+        request_delivery()
+    
+    await run_in_threadpool(retrieval_index.update_page, db_page.id, db_page.title, db_page.content)
+    await manager.broadcast_tree_change([current_user.id, *tree_audience(db, db_page)], "created", db_page)
     
     return db_page
 
@@ -51,20 +159,29 @@ async def get_pages(
     if not include_archived:
         query = query.filter(Page.is_archived == False)
     
-    pages = query.all()
+    pages = query.options(*PAGE_RESPONSE_OPTIONS).order_by(Page.position, Page.created_at).all()
     return pages
 
 @router.get("/{page_id}", response_model=PageResponse)
 async def get_page(
     page_id: str,
-    current_user: User = Depends(get_current_active_user),
+    username: str = Depends(get_token_username),
     db: Session = Depends(get_db)
 ):
     """Get a specific page."""
+    # Deleted and deactivated users are turned away even from cached pages
+    current_user = load_active_user(username, db)
+    # Public pages anyone may read are served rendered from the cache,
+    # without loading the page
+    if settings.PUBLIC_PAGE_CACHE_ENABLED:
+        payload = await page_cache.get(page_id)
+        if payload is not None:
+            return Response(content=payload, media_type="application/json")
+    
     # Check permissions
     check_page_permission(page_id, current_user, db, "read")
     
-    page = db.query(Page).filter(Page.id == page_id).first()
+    page = load_page(db, page_id)
     if not page:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -91,29 +208,71 @@ async def update_page(
             detail="Page not found"
         )
     
+    # This update supersedes any edits still buffered from WebSocket
+    if page_data.content is not None:
+        await page_buffer.discard(page_id)
+    
     # Create version before updating
     if page_data.content is not None and page_data.content != page.content:
+        last_version = db.query(func.max(PageVersion.version_number)).filter(
+            PageVersion.page_id == page_id
+        ).scalar()
         version = PageVersion(
             page_id=page_id,
             content=page.content,
-            version_number=len(page.versions) + 1,
+            version_number=(last_version or 0) + 1,
             created_by=current_user.id
         )
         db.add(version)
     
     # Update page
     update_data = page_data.dict(exclude_unset=True)
+    archived = update_data.get("is_archived")
+    old_parent_id = page.parent_id
     for field, value in update_data.items():
-        setattr(page, field, value)
+        if field not in ("is_archived", "parent_id"):
+            setattr(page, field, value)
     
     setattr(page, "updated_at", datetime.utcnow())
+    # A new parent is a move to the end of its children, with the same checks as /move
+    if "parent_id" in update_data and update_data["parent_id"] != page.parent_id:
+        parent_id = update_data["parent_id"]
+        if parent_id is not None:
+            check_page_permission(parent_id, current_user, db, "write")
+        try:
+            move_subtree(db, page_id, parent_id, position_between(db, parent_id, page.owner_id))
+        except TreeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    # Archiving and restoring apply to the whole subtree
+    subtree = set_subtree_archived(page, archived, db) if archived is not None else []
+    record_page_changes(db, [page_id, *subtree], current_user.id)
+    emails = 0
+    if "content" in update_data:
+        mentions = update_page_links(db, {page_id: page.content or ""})
+        emails = notify_mentions(db, mentions, current_user)
     db.commit()
-    db.refresh(page)
+    page = load_page(db, page_id)
+    if emails:
+        request_delivery()
+    # Covers visibility changes too, and the old parent of a moved page
+    await invalidate_cached_pages(db, [page_id, old_parent_id], subtree)
+    
+    if update_data.keys() & {"title", "content"}:
+        await run_in_threadpool(retrieval_index.update_page, page.id, page.title, page.content, page.is_archived)
+    if subtree:
+        await reindex_archived(db, subtree, archived)
     
     # Broadcast update via WebSocket
     await manager.broadcast_page_update(
         page_id, page.content, current_user.id, current_user.username
     )
+    if update_data.keys() & {"title", "icon", "parent_id", "is_archived"}:
+        await manager.broadcast_tree_change(
+            [current_user.id, *tree_audience(db, page, old_parent_id)], "updated", page
+        )
     
     return page
 
@@ -134,12 +293,207 @@ async def delete_page(
             detail="Page not found"
         )
     
-    # Archive instead of delete
-    page.is_archived = True
-    setattr(page, "updated_at", datetime.utcnow())
+    # Archive instead of delete, sub-pages included; the purge job deletes it later
+    archived = set_subtree_archived(page, True, db)
+    record_page_changes(db, archived, current_user.id)
+    db.commit()
+    db.refresh(page)
+    await invalidate_cached_pages(db, [page_id], archived)
+    
+    await reindex_archived(db, archived, True)
+    await manager.broadcast_tree_change([current_user.id, *tree_audience(db, page)], "archived", page)
+    
+    return {"message": "Page archived successfully", "archived_pages": len(archived)}
+
+@router.post("/{page_id}/move", response_model=PageResponse)
+async def move_page(
+    page_id: str,
+    move: PageMove,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Move a page, with its sub-pages, under a parent and between two of its children.
+    
+    Without after_id and before_id the page goes last. Reordering among the
+    same siblings only rewrites the page's own order key.
+    """
+    # Check permissions
+    check_page_permission(page_id, current_user, db, "write")
+    if move.parent_id is not None:
+        check_page_permission(move.parent_id, current_user, db, "write")
+    
+    page = db.query(Page).filter(Page.id == page_id).first()
+    if not page:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Page not found"
+        )
+    
+    old_parent_id = page.parent_id
+    try:
+        position = position_between(db, move.parent_id, page.owner_id, move.after_id, move.before_id)
+        move_subtree(db, page_id, move.parent_id, position)
+    except TreeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    record_page_changes(db, [page_id], current_user.id)
+    db.commit()
+    page = load_page(db, page_id)
+    await invalidate_cached_pages(db, [page_id, old_parent_id])
+    
+    await manager.broadcast_tree_change([current_user.id, *tree_audience(db, page, old_parent_id)], "moved", page)
+    
+    return page
+
+@router.post("/{page_id}/restore", response_model=PageResponse)
+async def restore_page(
+    page_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Restore an archived page with the sub-pages archived along with it."""
+    # Check permissions
+    check_page_permission(page_id, current_user, db, "admin")
+    
+    page = db.query(Page).filter(Page.id == page_id).first()
+    if not page:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Page not found"
+        )
+    if not page.is_archived:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Page is not archived"
+        )
+    
+    restored = set_subtree_archived(page, False, db)
+    record_page_changes(db, restored, current_user.id)
     db.commit()
+    page = load_page(db, page_id)
+    await invalidate_cached_pages(db, [page_id], restored)
     
-    return {"message": "Page archived successfully"}
+    await reindex_archived(db, restored, False)
+    await manager.broadcast_tree_change([current_user.id, *tree_audience(db, page)], "restored", page)
+    
+    return page
+
+@router.post("/batch", response_model=BatchResponse)
+async def batch_pages(
+    batch: BatchRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Apply create, update, move and archive ops to many pages in one transaction.
+    
+    Either every op is applied or none is. Each affected page is written and
+    broadcast once, however many ops touch it.
+    """
+    if len(batch.ops) > settings.PAGE_BATCH_MAX_OPS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch can have at most {settings.PAGE_BATCH_MAX_OPS} ops"
+        )
+    
+    try:
+        plan = plan_batch(batch.ops, current_user.id)
+    except BatchError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    check_page_permissions(plan.required, current_user, db)
+    
+    # These updates supersede any edits still buffered from WebSocket
+    for page_id in plan.content_changed:
+        await page_buffer.discard(page_id)
+    
+    try:
+        await run_in_threadpool(apply_batch, db, plan)
+    except BatchError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    emails = notify_mentions(db, plan.mentions, current_user)
+    db.commit()
+    if emails:
+        request_delivery()
+    await invalidate_cached_pages(db, [*plan.new_pages, *plan.changes], plan.archived)
+    
+    await run_in_threadpool(index_pages, db, retrieval_index, list(plan.reindexed))
+    await reindex_archived(db, plan.archived, True)
+    
+    for page_id in plan.content_changed:
+        await manager.broadcast_page_update(
+            page_id, plan.changes[page_id]["content"], current_user.id, current_user.username
+        )
+    tree_changed = list(plan.tree_changed)
+    if tree_changed:
+        pages = db.query(Page).filter(Page.id.in_(tree_changed)).all()
+        audiences = tree_audiences(db, pages, plan.old_parents)
+        for page in pages:
+            if page.id in plan.new_pages:
+                action = "created"
+            elif page.id in plan.archive_roots:
+                action = "archived"
+            else:
+                action = "updated"
+            await manager.broadcast_tree_change([current_user.id, *audiences[page.id]], action, page)
+    
+    return BatchResponse(results=plan.results, created=plan.refs)
+
+@router.post("/import", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def import_pages(
+    file: UploadFile = File(...),
+    parent_id: Optional[str] = Query(None),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Import a zip of Markdown or HTML files, e.g. a Notion export, as pages.
+    
+    Folders become sub-pages. The import runs as a job; poll it for progress.
+    """
+    if parent_id is not None:
+        check_page_permission(parent_id, current_user, db, "write")
+        try:
+            live_parent_path(db, parent_id)
+        except TreeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    
+    # Spool the upload to disk in chunks so it never sits in memory
+    os.makedirs(settings.IMPORT_DIR, exist_ok=True)
+    path = os.path.join(settings.IMPORT_DIR, f"{generate_uuid()}.zip")
+    size = 0
+    with open(path, "wb") as f:
+        while chunk := await file.read(1024 * 1024):
+            size += len(chunk)
+            if size > settings.IMPORT_MAX_UPLOAD_BYTES:
+                break
+            await run_in_threadpool(f.write, chunk)
+    
+    if size > settings.IMPORT_MAX_UPLOAD_BYTES:
+        os.remove(path)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Upload is too large"
+        )
+    if not zipfile.is_zipfile(path):
+        os.remove(path)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload is not a zip file"
+        )
+    
+    return await run_in_threadpool(
+        submit_job, db, current_user.id, "import_pages", {"file": path, "parent_id": parent_id}
+    )
 
 @router.post("/{page_id}/duplicate", response_model=PageResponse)
 async def duplicate_page(
@@ -151,7 +505,7 @@ async def duplicate_page(
     # Check permissions
     check_page_permission(page_id, current_user, db, "read")
     
-    original_page = db.query(Page).filter(Page.id == page_id).first()
+    original_page = db.query(Page).options(undefer(Page.content)).filter(Page.id == page_id).first()
     if not original_page:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -159,21 +513,180 @@ async def duplicate_page(
         )
     
     # Create duplicate
+    new_page_id = generate_uuid()
+    try:
+        placement = place_new_page(db, new_page_id, original_page.parent_id, current_user.id)
+    except TreeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     new_page = Page(
+        id=new_page_id,
         title=f"{original_page.title} (Copy)",
         content=original_page.content,
         icon=original_page.icon,
         parent_id=original_page.parent_id,
         owner_id=current_user.id,
-        is_public=False
+        is_public=False,
+        **placement
     )
     
     db.add(new_page)
+    record_page_changes(db, [new_page_id], current_user.id)
+    update_page_links(db, {new_page_id: new_page.content or ""}, new_pages=True)
     db.commit()
-    db.refresh(new_page)
+    new_page = load_page(db, new_page_id)
+    
+    await run_in_threadpool(retrieval_index.update_page, new_page.id, new_page.title, new_page.content)
+    await manager.broadcast_tree_change([current_user.id, *tree_audience(db, new_page)], "created", new_page)
     
     return new_page
 
+@router.post("/{page_id}/duplicate/deep", response_model=DeepDuplicateResponse, status_code=status.HTTP_201_CREATED)
+async def deep_duplicate_page(
+    page_id: str,
+    response: Response,
+    include_versions: bool = False,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Duplicate a page with all its sub-pages.
+    
+    Large trees are copied by a background job; the response then carries
+    the job to poll instead of the new page.
+    """
+    # Check permissions
+    check_page_permission(page_id, current_user, db, "read")
+    
+    size = await run_in_threadpool(count_subtree, db, page_id)
+    if size > settings.PAGE_DUPLICATE_INLINE_LIMIT:
+        job = await run_in_threadpool(
+            submit_job, db, current_user.id, "duplicate_subtree",
+            {"page_id": page_id, "include_versions": include_versions}
+        )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return DeepDuplicateResponse(job=JobResponse.model_validate(job))
+    
+    id_map = await run_in_threadpool(duplicate_subtree, db, page_id, current_user.id, include_versions)
+    db.commit()
+    
+    new_page = load_page(db, id_map[page_id])
+    await run_in_threadpool(index_pages, db, retrieval_index, list(id_map.values()))
+    await manager.broadcast_tree_change([current_user.id, *tree_audience(db, new_page)], "created", new_page)
+    
+    return DeepDuplicateResponse(page=PageResponse.model_validate(new_page), pages_copied=len(id_map))
+
+@router.get("/{page_id}/export")
+async def export_page(
+    page_id: str,
+    response: Response,
+    format: str = Query("markdown"),
+    background: bool = False,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Download a page and its sub-pages as a zip of Markdown, HTML or JSON files.
+    
+    The zip is streamed while the pages are read. With background=true a job
+    writes it instead, to fetch from GET /api/jobs/{id}/download when done.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown export format: {format}"
+        )
+    
+    # Check permissions
+    check_page_permission(page_id, current_user, db, "read")
+    
+    page = db.query(Page).filter(Page.id == page_id).first()
+    if not page:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Page not found"
+        )
+    
+    if background:
+        job = await run_in_threadpool(
+            submit_job, db, current_user.id, "export_pages", {"page_id": page_id, "format": format}
+        )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return JobResponse.model_validate(job)
+    
+    filename = quote(f"{safe_name(page.title)}.zip")
+    return StreamingResponse(
+        stream_export(page_id, current_user.id, format),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"}
+    )
+
+@router.get("/{page_id}/presence", response_model=PresenceResponse)
+async def get_page_presence(
+    page_id: str,
+    username: str = Depends(get_token_username),
+    db: Session = Depends(get_db)
+):
+    """Get the users currently on a page."""
+    # Users who are on the page themselves are served from memory alone,
+    # everybody else goes through the regular permission check
+    if not manager.presence.is_present(page_id, username=username):
+        current_user = load_active_user(username, db)
+        check_page_permission(page_id, current_user, db, "read")
+    
+    return PresenceResponse(page_id=page_id, users=manager.get_page_users(page_id))
+
+@router.get("/{page_id}/related", response_model=List[RelatedPageResponse])
+async def get_related_pages(
+    page_id: str,
+    limit: int = Query(5, ge=1, le=50),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the user's pages most similar in content to this page."""
+    # Check permissions
+    check_page_permission(page_id, current_user, db, "read")
+    
+    allowed = accessible_page_ids(db, current_user.id)
+    related = await run_in_threadpool(retrieval_index.related_pages, page_id, allowed, limit)
+    if not related:
+        return []
+    
+    pages = {
+        page.id: page
+        for page in db.query(Page).filter(Page.id.in_([related_id for related_id, _ in related])).all()
+    }
+    return [
+        RelatedPageResponse(id=page.id, title=page.title, icon=page.icon, score=round(score, 4))
+        for related_id, score in related
+        if (page := pages.get(related_id)) is not None and not page.is_archived
+    ]
+
+@router.get("/{page_id}/backlinks", response_model=List[BacklinkResponse])
+async def get_backlinks(
+    page_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the pages that link to this page, among those the user can read."""
+    # Check permissions
+    check_page_permission(page_id, current_user, db, "read")
+    
+    shared = db.query(PageCollaboration.page_id).filter(PageCollaboration.user_id == current_user.id)
+    pages = db.query(Page.id, Page.title, Page.icon, Page.updated_at).filter(
+        Page.id.in_(
+            db.query(PageLink.source_page_id).filter(PageLink.target_id == page_id, PageLink.kind == "page")
+        ),
+        Page.is_archived == False,
+        or_(Page.owner_id == current_user.id, Page.is_public == True, Page.id.in_(shared))
+    ).order_by(Page.title, Page.id).offset(offset).limit(limit).all()
+    return [
+        BacklinkResponse(id=page.id, title=page.title, icon=page.icon, updated_at=page.updated_at)
+        for page in pages
+    ]
+
 @router.post("/{page_id}/collaborate", response_model=CollaborationResponse)
 async def add_collaborator(
     page_id: str,
@@ -213,6 +726,8 @@ async def add_collaborator(
     )
     
     db.add(collaboration)
+    db.flush()
+    record_change(db, "collaboration", collaboration.id, page_id, current_user.id)
     db.commit()
     db.refresh(collaboration)
     
@@ -253,6 +768,8 @@ async def add_comment(
     )
     
     db.add(comment)
+    db.flush()
+    record_change(db, "comment", comment.id, page_id, current_user.id)
     db.commit()
     db.refresh(comment)
     
@@ -295,7 +812,7 @@ async def search_pages(
     if not search_data.include_public:
         query = query.filter(Page.is_public == False)
     
-    pages = query.limit(search_data.limit).all()
+    pages = query.options(*PAGE_RESPONSE_OPTIONS).limit(search_data.limit).all()
     total = query.count()
     
     page_responses = [PageResponse.model_validate(page) for page in pages]
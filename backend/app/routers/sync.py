@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from app.database import get_db
+from app.config import settings
+from app.auth import get_current_active_user
+from app.models import User
+from app.schemas import SyncResponse
+from app.change_feed import changes_since
+
+router = APIRouter()
+
+@router.get("", response_model=SyncResponse)
+async def sync(
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(500, ge=1, le=settings.SYNC_MAX_CHANGES),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Changes to the user's pages, their comments and collaborators since a cursor.
+    
+    Each changed row is sent once in its current state. Call again with the
+    returned cursor, right away while has_more is set. Changes show up a few
+    seconds after they are made; live updates come over the WebSocket.
+    """
+    return await run_in_threadpool(changes_since, db, current_user.id, since, limit)
@@ -1,22 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
 
+from app.config import settings
 from app.database import get_db
 from app.auth import get_current_active_user, get_password_hash
 from app.models import User
-from app.schemas import UserUpdate, UserResponse
+from app.schemas import UserUpdate, UserResponse, UserSearchResult, UserSearchResponse
+from app.user_directory import search_users as search_directory
 
 router = APIRouter()
 
-@router.get("/", response_model=List[UserResponse])
-async def get_users(
+@router.get("/search", response_model=UserSearchResponse)
+async def search_users(
+    q: str = Query("", max_length=100),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=settings.USER_SEARCH_MAX_OFFSET),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get all users (for collaboration purposes)."""
-    users = db.query(User).filter(User.is_active == True).all()
-    return users
+    """Find users to share a page with.
+    
+    Matches usernames and full names by prefix or fuzzily, and emails by
+    prefix. Recent collaborators come first; without a query they are all
+    that is returned. Queries need USER_SEARCH_MIN_QUERY_LENGTH characters
+    and results go USER_SEARCH_MAX_OFFSET deep, so the directory cannot be
+    paged through.
+    """
+    if 0 < len(q.strip()) < settings.USER_SEARCH_MIN_QUERY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Search for at least {settings.USER_SEARCH_MIN_QUERY_LENGTH} characters"
+        )
+    
+    rows, has_more = await run_in_threadpool(search_directory, db, current_user.id, q, limit, offset)
+    return UserSearchResponse(
+        users=[
+            UserSearchResult(
+                id=row.id, username=row.username, full_name=row.full_name,
+                recent_collaborator=row.last_shared is not None
+            )
+            for row in rows
+        ],
+        has_more=has_more
+    )
 
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(
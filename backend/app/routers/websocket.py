@@ -1,13 +1,51 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
-from app.websocket import websocket_endpoint
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, Query, HTTPException, status
+from typing import Optional
+from app.auth import get_current_active_user
+from app.config import settings
+from app.models import User
+from app.loop_monitor import loop_monitor, current_rss_bytes
+from app.websocket import manager, websocket_endpoint, multiplexed_websocket_endpoint
 
 router = APIRouter()
 
+@router.get("/stats")
+async def websocket_stats(reset: bool = False, current_user: User = Depends(get_current_active_user)):
+    """Connection counts, process memory and event loop lag (debug only, signed in, used by scripts/ws_load.py)."""
+    if not settings.DEBUG:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    
+    stats = {
+        **manager.stats(),
+        "rss_bytes": current_rss_bytes(),
+        "event_loop_lag": loop_monitor.stats()
+    }
+    if reset:
+        loop_monitor.reset_max()
+    return stats
+
+@router.websocket("/")
+async def multiplexed_websocket_route(
+    websocket: WebSocket,
+    token: str = Query(...),
+    protocol: Optional[str] = Query(None)
+):
+    """Single WebSocket for all of a user's page and workspace subscriptions."""
+    await multiplexed_websocket_endpoint(websocket, token, protocol)
+
 @router.websocket("/{page_id}")
 async def websocket_route(
     websocket: WebSocket,
     page_id: str,
-    token: str = Query(...)
+    token: str = Query(...),
+    last_seq: Optional[int] = Query(None),
+    epoch: Optional[str] = Query(None),
+    protocol: Optional[str] = Query(None)
 ):
-    """WebSocket endpoint for real-time collaboration."""
-    await websocket_endpoint(websocket, page_id, token) 
\ No newline at end of file
+    """WebSocket endpoint for real-time collaboration.
+
+    Reconnecting clients pass the `epoch` and highest `seq` they have seen to
+    receive only the events they missed. Clients choose JSON text or
+    MessagePack binary frames with the `notion.json.v1`/`notion.msgpack.v1`
+    subprotocols or the `protocol` query parameter.
+    """
+    await websocket_endpoint(websocket, page_id, token, last_seq, epoch, protocol) 
\ No newline at end of file
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, List, Dict, Literal
 from datetime import datetime
 
 # User schemas
@@ -27,6 +27,17 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class UserSearchResult(BaseModel):
+    id: str
+    username: str
+    full_name: Optional[str] = None
+    # Shared pages with the searching user, either way, recently
+    recent_collaborator: bool
+
+class UserSearchResponse(BaseModel):
+    users: List[UserSearchResult]
+    has_more: bool
+
 # Authentication schemas
 class Token(BaseModel):
     access_token: str
@@ -62,8 +73,11 @@ class PageUpdate(BaseModel):
 class PageResponse(PageBase):
     id: str
     owner_id: str
+    position: Optional[str] = None
     is_archived: bool
-    metadata: dict
+    archived_at: Optional[datetime] = None
+    # On the model it is page_metadata, `metadata` is SQLAlchemy's table registry
+    metadata: dict = Field(default_factory=dict, validation_alias="page_metadata")
     created_at: datetime
     updated_at: Optional[datetime] = None
     owner: UserResponse
@@ -73,6 +87,36 @@ class PageResponse(PageBase):
     class Config:
         from_attributes = True
 
+class PageMove(BaseModel):
+    # New parent, null for the top level
+    parent_id: Optional[str] = None
+    # Siblings under the new parent to place the page between
+    after_id: Optional[str] = None
+    before_id: Optional[str] = None
+
+class BatchOp(BaseModel):
+    op: Literal["create", "update", "move", "archive"]
+    # Page to change; may name the ref of a page created earlier in the batch
+    page_id: Optional[str] = None
+    # Name for a created page, so later ops can refer to it before it has an id
+    ref: Optional[str] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+    icon: Optional[str] = None
+    parent_id: Optional[str] = None
+    is_public: Optional[bool] = None
+
+class BatchRequest(BaseModel):
+    ops: List[BatchOp]
+
+class BatchOpResult(BaseModel):
+    op: str
+    page_id: str
+
+class BatchResponse(BaseModel):
+    results: List[BatchOpResult]
+    created: Dict[str, str] = {}
+
 # Collaboration schemas
 class CollaborationCreate(BaseModel):
     user_id: str
@@ -115,9 +159,13 @@ class CommentResponse(CommentBase):
 # Real-time schemas
 class WebSocketMessage(BaseModel):
     type: str  # page_update, comment_added, user_joined, etc.
-    data: dict
+    data: dict = {}
     user_id: Optional[str] = None
     page_id: Optional[str] = None
+    # Multiplexed subscriptions
+    channel: Optional[str] = None
+    last_seq: Optional[int] = None
+    epoch: Optional[str] = None
 
 class PageUpdateMessage(BaseModel):
     page_id: str
@@ -132,6 +180,26 @@ class CommentMessage(BaseModel):
     author_id: str
     timestamp: datetime
 
+class PresenceUser(BaseModel):
+    user_id: str
+    username: str
+
+class PresenceResponse(BaseModel):
+    page_id: str
+    users: List[PresenceUser]
+
+class RelatedPageResponse(BaseModel):
+    id: str
+    title: str
+    icon: str
+    score: float
+
+class BacklinkResponse(BaseModel):
+    id: str
+    title: str
+    icon: str
+    updated_at: Optional[datetime] = None
+
 # AI schemas
 class AIRequest(BaseModel):
     prompt: str
@@ -144,6 +212,7 @@ class AIResponse(BaseModel):
     result: str
     usage: Optional[dict] = None
     error: Optional[str] = None
+    cached: bool = False
 
 # Search schemas
 class SearchRequest(BaseModel):
@@ -162,4 +231,80 @@ class PasswordResetRequest(BaseModel):
 
 class PasswordReset(BaseModel):
     token: str
-    new_password: str 
\ No newline at end of file
+    new_password: str 
+
+# Job schemas
+class JobCreate(BaseModel):
+    type: str
+    params: dict = {}
+
+class JobResponse(BaseModel):
+    id: str
+    type: str
+    status: str
+    params: dict
+    progress: float
+    message: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class DeepDuplicateResponse(BaseModel):
+    page: Optional[PageResponse] = None
+    pages_copied: int = 0
+    job: Optional[JobResponse] = None
+
+# Sync schemas
+class SyncPage(BaseModel):
+    id: str
+    parent_id: Optional[str] = None
+    owner_id: str
+    title: str
+    icon: Optional[str] = None
+    content: Optional[str] = None
+    position: Optional[str] = None
+    is_public: bool
+    is_archived: bool
+    archived_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class SyncComment(BaseModel):
+    id: str
+    page_id: str
+    author_id: str
+    content: str
+    parent_comment_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class SyncCollaboration(BaseModel):
+    id: str
+    page_id: str
+    user_id: str
+    permission: str
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class SyncResponse(BaseModel):
+    # Pass back as `since` on the next call
+    cursor: int
+    # The cursor is unknown or expired: reload, then sync from `cursor`
+    reset: bool = False
+    has_more: bool = False
+    pages: List[SyncPage] = []
+    deleted_pages: List[str] = []
+    comments: List[SyncComment] = []
+    collaborations: List[SyncCollaboration] = []
@@ -0,0 +1,79 @@
+"""Finding the users to share a page with.
+
+A query matches usernames, full names and email addresses by prefix, and
+usernames and full names fuzzily as well. People the user recently shared
+pages with, either way, come first. On postgres trigram indexes serve
+every kind of match; elsewhere expression indexes serve the prefixes and
+the fuzzy part falls back to substrings, which read the whole table.
+"""
+from datetime import datetime, timedelta
+from typing import List, Tuple
+from sqlalchemy import and_, case, func, literal, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import User, Page, PageCollaboration
+
+def recent_collaborators(user_id: str):
+    """Subquery of the users a user recently shared pages with or got pages shared by, and when last."""
+    since = datetime.utcnow() - timedelta(days=settings.USER_SEARCH_RECENT_DAYS)
+    shared_with = select(
+        PageCollaboration.user_id.label("user_id"), PageCollaboration.created_at.label("shared_at")
+    ).join(Page, Page.id == PageCollaboration.page_id).where(
+        Page.owner_id == user_id, PageCollaboration.created_at >= since
+    )
+    shared_by = select(Page.owner_id, PageCollaboration.created_at).join(
+        Page, Page.id == PageCollaboration.page_id
+    ).where(PageCollaboration.user_id == user_id, PageCollaboration.created_at >= since)
+    shares = union_all(shared_with, shared_by).subquery()
+    return select(
+        shares.c.user_id, func.max(shares.c.shared_at).label("last_shared")
+    ).group_by(shares.c.user_id).subquery()
+
+def _prefix(column, query: str, postgresql: bool):
+    lowered = func.lower(column)
+    if postgresql:
+        return lowered.startswith(query, autoescape=True)
+    # SQLite only uses an expression index for comparisons, never for LIKE
+    return and_(lowered >= query, lowered < query + "\U0010ffff")
+
+def search_users(db: Session, user_id: str, query: str, limit: int, offset: int = 0) -> Tuple[List, bool]:
+    """Active users other than `user_id` matching `query`, best first, and whether there are more.
+
+    Rows carry id, username, full_name and last_shared, set for recent
+    collaborators. Without a query only recent collaborators are returned.
+    Email addresses only match by prefix, so that a domain does not list
+    everyone at it.
+    """
+    query = query.strip().lower()
+    postgresql = db.get_bind().dialect.name == "postgresql"
+    recent = recent_collaborators(user_id)
+    statement = select(User.id, User.username, User.full_name, recent.c.last_shared).outerjoin(
+        recent, recent.c.user_id == User.id
+    ).where(User.is_active == True, User.id != user_id)
+
+    if query:
+        username, full_name = func.lower(User.username), func.lower(User.full_name)
+        prefixes = [_prefix(column, query, postgresql) for column in (User.username, User.full_name, User.email)]
+        if postgresql:
+            # Word similarity scores how well the query matches part of a value,
+            # e.g. a last name, with typos
+            fuzzy = [literal(query).op("<%")(username), literal(query).op("<%")(full_name)]
+            similarity = func.greatest(
+                func.word_similarity(query, username), func.word_similarity(query, func.coalesce(full_name, ""))
+            )
+        else:
+            fuzzy = [username.contains(query, autoescape=True), full_name.contains(query, autoescape=True)]
+            similarity = literal(0)
+        statement = statement.where(or_(*prefixes, *fuzzy))
+        match_rank = case(
+            (username == query, 0), (prefixes[0], 1), (prefixes[1], 2), (prefixes[2], 3), else_=4
+        )
+    else:
+        statement = statement.where(recent.c.last_shared.isnot(None))
+        match_rank = similarity = literal(0)
+
+    rows = db.execute(statement.order_by(
+        recent.c.last_shared.is_(None), match_rank, similarity.desc(), recent.c.last_shared.desc(), User.username
+    ).offset(offset).limit(limit + 1)).all()
+    return rows[:limit], len(rows) > limit
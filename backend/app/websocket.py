@@ -1,93 +1,154 @@
-import json
+import time
 import asyncio
 from typing import Dict, Set, Optional
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import WebSocket, WebSocketDisconnect, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import undefer
 from app.schemas import WebSocketMessage, PageUpdateMessage, CommentMessage
+from app.database import SessionLocal
+from app.auth import verify_token, check_page_permission
+from app.models import User, Page
+from app.config import settings
+from app.page_buffer import page_buffer
+from app.event_log import EventLogRegistry
+from app.presence import Connection, PresenceTracker
+from app.ws_protocol import JSON_CODEC, negotiate_codec, parse_message
 
 class ConnectionManager:
     def __init__(self):
-        # Store active connections by page_id
+        # Routing tables: sockets subscribed to each page, and sockets of each user
         self.page_connections: Dict[str, Set[WebSocket]] = {}
-        # Store user info for each connection
-        self.connection_users: Dict[WebSocket, dict] = {}
+        self.user_connections: Dict[str, Set[WebSocket]] = {}
+        # Store user info and subscriptions for each connection
+        self.connection_users: Dict[WebSocket, Connection] = {}
+        self.presence = PresenceTracker()
+        # Sequence numbers and recent events by page_id, for reconnect resume
+        self.event_logs = EventLogRegistry(
+            settings.WS_EVENT_BUFFER_SIZE, settings.WS_EVENT_BUFFER_TTL_SECONDS
+        )
+        self.heartbeat_task: Optional[asyncio.Task] = None
     
-    async def connect(self, websocket: WebSocket, page_id: str, user_id: str, username: str):
-        """Connect a user to a page's WebSocket."""
-        await websocket.accept()
+    async def accept(self, websocket: WebSocket, user_id: str, username: str, protocol: Optional[str] = None):
+        """Accept an authenticated connection that is not subscribed to anything yet."""
+        codec, subprotocol = negotiate_codec(websocket.scope.get("subprotocols", []), protocol)
+        await websocket.accept(subprotocol=subprotocol)
         
-        if page_id not in self.page_connections:
-            self.page_connections[page_id] = set()
+        self.connection_users[websocket] = Connection(websocket, user_id, username, codec)
+        self.user_connections.setdefault(user_id, set()).add(websocket)
+    
+    async def subscribe(self, websocket: WebSocket, page_id: str, can_write: bool):
+        """Subscribe a connection to a page's events."""
+        connection = self.connection_users[websocket]
+        if page_id in connection.pages:
+            connection.pages[page_id] = can_write
+            return
         
-        self.page_connections[page_id].add(websocket)
-        self.connection_users[websocket] = {
-            "user_id": user_id,
-            "username": username,
-            "page_id": page_id
-        }
+        self.event_logs.prune()
+        self.event_logs.get(page_id)
         
-        # Notify others that user joined
-        await self.broadcast_to_page(
-            page_id,
-            {
-                "type": "user_joined",
-                "data": {
-                    "user_id": user_id,
-                    "username": username,
-                    "message": f"{username} joined the page"
-                }
-            },
-            exclude_websocket=websocket
-        )
+        self.page_connections.setdefault(page_id, set()).add(websocket)
+        connection.pages[page_id] = can_write
+        
+        # Notify others that user joined, unless they already have the page open elsewhere
+        if self.presence.join(page_id, connection.user_id, connection.username):
+            await self.broadcast_to_page(
+                page_id,
+                {
+                    "type": "user_joined",
+                    "data": {
+                        "user_id": connection.user_id,
+                        "username": connection.username,
+                        "message": f"{connection.username} joined the page"
+                    }
+                },
+                exclude_websocket=websocket
+            )
     
-    def disconnect(self, websocket: WebSocket):
-        """Disconnect a user from WebSocket."""
-        user_info = self.connection_users.get(websocket)
-        if user_info:
-            page_id = user_info["page_id"]
-            username = user_info["username"]
-            
-            # Remove from page connections
-            if page_id in self.page_connections:
-                self.page_connections[page_id].discard(websocket)
-                if not self.page_connections[page_id]:
-                    del self.page_connections[page_id]
-            
-            # Remove user info
-            del self.connection_users[websocket]
-            
-            # Notify others that user left
+    def unsubscribe(self, websocket: WebSocket, page_id: str):
+        """Unsubscribe a connection from a page's events."""
+        connection = self.connection_users.get(websocket)
+        if not connection or page_id not in connection.pages:
+            return
+        del connection.pages[page_id]
+        
+        if page_id in self.page_connections:
+            self.page_connections[page_id].discard(websocket)
+            if not self.page_connections[page_id]:
+                del self.page_connections[page_id]
+                self.event_logs.release(page_id)
+                # Last user left, persist their edits right away
+                asyncio.create_task(page_buffer.flush_page(page_id))
+        
+        # Notify others that user left, once their last tab on the page is gone
+        if self.presence.leave(page_id, connection.user_id):
             asyncio.create_task(self.broadcast_to_page(
                 page_id,
                 {
                     "type": "user_left",
                     "data": {
-                        "username": username,
-                        "message": f"{username} left the page"
+                        "user_id": connection.user_id,
+                        "username": connection.username,
+                        "message": f"{connection.username} left the page"
                     }
                 }
             ))
     
+    async def connect(self, websocket: WebSocket, page_id: str, user_id: str, username: str, can_write: bool = True):
+        """Connect a user to a single page's WebSocket."""
+        await self.accept(websocket, user_id, username)
+        await self.subscribe(websocket, page_id, can_write)
+    
+    def disconnect(self, websocket: WebSocket):
+        """Disconnect a user from WebSocket."""
+        connection = self.connection_users.get(websocket)
+        if connection:
+            for page_id in list(connection.pages):
+                self.unsubscribe(websocket, page_id)
+            
+            user_id = connection.user_id
+            if user_id in self.user_connections:
+                self.user_connections[user_id].discard(websocket)
+                if not self.user_connections[user_id]:
+                    del self.user_connections[user_id]
+            
+            # Remove user info
+            del self.connection_users[websocket]
+    
+    async def _send(self, websocket: WebSocket, codec, payload):
+        if codec.binary:
+            await websocket.send_bytes(payload)
+        else:
+            await websocket.send_text(payload)
+    
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send a message to a specific user."""
+        connection = self.connection_users.get(websocket)
+        codec = connection.codec if connection else JSON_CODEC
         try:
-            await websocket.send_text(json.dumps(message))
+            await self._send(websocket, codec, codec.encode(message))
         except:
             # Connection might be closed
             pass
     
-    async def broadcast_to_page(self, page_id: str, message: dict, exclude_websocket: Optional[WebSocket] = None):
-        """Broadcast a message to all users on a specific page."""
-        if page_id not in self.page_connections:
-            return
-        
+    async def _send_to_all(self, websockets, message: dict, exclude_websocket: Optional[WebSocket] = None):
         disconnected_websockets = set()
+        # Encode once per protocol in use rather than once per recipient
+        payloads = {}
         
-        for websocket in self.page_connections[page_id]:
+        for websocket in list(websockets):
             if websocket == exclude_websocket:
                 continue
+            connection = self.connection_users.get(websocket)
+            if connection is None:
+                continue
+            
+            codec = connection.codec
+            payload = payloads.get(codec.name)
+            if payload is None:
+                payload = payloads[codec.name] = codec.encode(message)
             
             try:
-                await websocket.send_text(json.dumps(message))
+                await self._send(websocket, codec, payload)
             except:
                 # Mark for removal if connection is broken
                 disconnected_websockets.add(websocket)
@@ -96,6 +157,48 @@ class ConnectionManager:
         for websocket in disconnected_websockets:
             self.disconnect(websocket)
     
+    async def broadcast_to_page(self, page_id: str, message: dict, exclude_websocket: Optional[WebSocket] = None):
+        """Broadcast a message to all users on a specific page."""
+        # Multiplexed clients route messages by page
+        message.setdefault("page_id", page_id)
+        
+        # Sequence the event, also while nobody is connected so that clients
+        # reconnecting shortly after can still replay it
+        event_log = self.event_logs.peek(page_id)
+        if event_log is not None:
+            event_log.append(message)
+        
+        if page_id not in self.page_connections:
+            return
+        
+        await self._send_to_all(self.page_connections[page_id], message, exclude_websocket)
+    
+    async def broadcast_to_user(self, user_id: str, message: dict):
+        """Broadcast a message on a user's workspace channel."""
+        websockets = [
+            websocket for websocket in self.user_connections.get(user_id, ())
+            if self.connection_users[websocket].workspace
+        ]
+        if websockets:
+            await self._send_to_all(websockets, message)
+    
+    async def broadcast_tree_change(self, user_ids, action: str, page: Page):
+        """Tell the workspaces of the given users that the page tree changed."""
+        message = {
+            "type": "tree_changed",
+            "data": {
+                "action": action,
+                "page_id": page.id,
+                "parent_id": page.parent_id,
+                "position": page.position,
+                "title": page.title,
+                "icon": page.icon,
+                "is_archived": page.is_archived
+            }
+        }
+        for user_id in set(user_ids):
+            await self.broadcast_to_user(user_id, message)
+    
     async def broadcast_page_update(self, page_id: str, content: str, user_id: str, username: str):
         """Broadcast a page content update."""
         message = {
@@ -140,87 +243,330 @@ class ConnectionManager:
     
     def get_page_users(self, page_id: str) -> list:
         """Get list of users currently on a page."""
-        if page_id not in self.page_connections:
-            return []
-        
-        users = []
-        for websocket in self.page_connections[page_id]:
-            user_info = self.connection_users.get(websocket)
-            if user_info and user_info["page_id"] == page_id:
-                users.append({
-                    "user_id": user_info["user_id"],
-                    "username": user_info["username"]
-                })
-        
-        return users
+        return self.presence.users(page_id)
+    
+    def stats(self) -> dict:
+        """Connection and routing table counts."""
+        codecs: Dict[str, int] = {}
+        for connection in self.connection_users.values():
+            codecs[connection.codec.name] = codecs.get(connection.codec.name, 0) + 1
+        return {
+            "connections": len(self.connection_users),
+            "users": len(self.user_connections),
+            "pages": len(self.page_connections),
+            "subscriptions": sum(len(websockets) for websockets in self.page_connections.values()),
+            "codecs": codecs,
+            "event_logs": len(self.event_logs.logs),
+            "dirty_pages": len(page_buffer.dirty)
+        }
+    
+    def touch(self, websocket: WebSocket):
+        """Record that a connection is alive."""
+        connection = self.connection_users.get(websocket)
+        if connection:
+            connection.touch()
+    
+    async def heartbeat(self):
+        """Ping every connection and evict the ones that stopped answering."""
+        while True:
+            await asyncio.sleep(settings.WS_HEARTBEAT_INTERVAL_SECONDS)
+            
+            # A timeout of 0 disables eviction, e.g. for clients that never answer pings
+            stale = []
+            if settings.WS_IDLE_TIMEOUT_SECONDS:
+                idle_cutoff = time.monotonic() - settings.WS_IDLE_TIMEOUT_SECONDS
+                stale = [
+                    connection for connection in self.connection_users.values()
+                    if connection.last_seen < idle_cutoff
+                ]
+            for connection in stale:
+                self.disconnect(connection.websocket)
+                try:
+                    await connection.websocket.close(code=status.WS_1001_GOING_AWAY)
+                except:
+                    pass
+            
+            await self._send_to_all(list(self.connection_users), {"type": "ping"})
+    
+    def start_heartbeat(self):
+        if self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.create_task(self.heartbeat())
+    
+    async def stop_heartbeat(self):
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            try:
+                await self.heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self.heartbeat_task = None
 
 # Global connection manager instance
 manager = ConnectionManager()
 
-async def websocket_endpoint(websocket: WebSocket, page_id: str, token: str):
-    """WebSocket endpoint for real-time collaboration."""
-    # TODO: Validate token and get user info
-    # For now, using mock user info
-    user_id = "mock_user_id"
-    username = "mock_username"
+def authenticate_socket_user(token: str) -> Optional[dict]:
+    """Resolve the active user behind a socket token."""
+    token_data = verify_token(token)
+    if token_data is None:
+        return None
     
+    db = SessionLocal()
     try:
-        await manager.connect(websocket, page_id, user_id, username)
+        user = db.query(User).filter(User.username == token_data.username).first()
+        if user is None or not user.is_active:
+            return None
+        return {"user_id": user.id, "username": user.username}
+    finally:
+        db.close()
+
+def get_page_access(user_id: str, page_id: str) -> Optional[bool]:
+    """None if the user cannot see the page, otherwise whether they may write to it."""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None:
+            return None
+        for permission in ("write", "read"):
+            try:
+                check_page_permission(page_id, user, db, permission)
+            except HTTPException:
+                continue
+            return permission == "write"
+        return None
+    finally:
+        db.close()
+
+def load_page_snapshot(page_id: str) -> Optional[dict]:
+    """Load the compact state of a page sent to clients that cannot replay events."""
+    db = SessionLocal()
+    try:
+        page = db.query(Page).options(undefer(Page.content)).filter(Page.id == page_id).first()
+        if page is None:
+            return None
+        return {
+            "id": page.id,
+            "title": page.title,
+            "icon": page.icon,
+            "content": page.content,
+            "is_archived": page.is_archived,
+            "updated_at": page.updated_at.isoformat() if page.updated_at else None
+        }
+    finally:
+        db.close()
+
+async def send_resume_state(websocket: WebSocket, page_id: str, last_seq: Optional[int], epoch: Optional[str]):
+    """Bring a (re)connecting client up to date with replayed events or a snapshot."""
+    event_log = manager.event_logs.get(page_id)
+    
+    if last_seq is not None and epoch == event_log.epoch:
+        events = event_log.events_since(last_seq)
+        if events is not None:
+            await manager.send_personal_message({
+                "type": "replay",
+                "page_id": page_id,
+                "data": {"epoch": event_log.epoch, "seq": event_log.seq, "events": events}
+            }, websocket)
+            return
+    
+    snapshot = await run_in_threadpool(load_page_snapshot, page_id)
+    if snapshot is None:
+        return
+    # No awaits from here on: the buffered content and the sequence number
+    # are read together, so the snapshot reflects exactly the events up to `seq`
+    pending_content = page_buffer.pending_content(page_id)
+    if pending_content is not None:
+        snapshot["content"] = pending_content
+    
+    await manager.send_personal_message({
+        "type": "snapshot",
+        "page_id": page_id,
+        "data": {"epoch": event_log.epoch, "seq": event_log.seq, "page": snapshot}
+    }, websocket)
+
+async def join_page(websocket: WebSocket, page_id: str, can_write: bool, last_seq: Optional[int], epoch: Optional[str]):
+    """Subscribe a connection to a page and bring it up to date."""
+    await manager.subscribe(websocket, page_id, can_write)
+    
+    # Send current page users to the new subscriber
+    users = manager.get_page_users(page_id)
+    await manager.send_personal_message({
+        "type": "page_users",
+        "page_id": page_id,
+        "data": {"users": users}
+    }, websocket)
+    
+    # Replay what a reconnecting client missed, or send the current state
+    await send_resume_state(websocket, page_id, last_seq, epoch)
+
+async def receive_message(websocket: WebSocket) -> Optional[WebSocketMessage]:
+    """Receive the next text or binary frame, None if it is malformed."""
+    frame = await websocket.receive()
+    if frame["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(frame.get("code", status.WS_1000_NORMAL_CLOSURE))
+    
+    manager.touch(websocket)
+    data = frame.get("text")
+    if data is None:
+        data = frame.get("bytes")
+    return parse_message(manager.connection_users[websocket].codec, data)
+
+async def handle_page_message(websocket: WebSocket, page_id: str, message: WebSocketMessage):
+    """Handle a page-scoped message from a subscribed connection."""
+    connection = manager.connection_users[websocket]
+    user_id = connection.user_id
+    username = connection.username
+    
+    # Handle different message types
+    if message.type == "page_update":
+        content = message.data.get("content")
+        if not connection.pages[page_id] or not isinstance(content, str):
+            return
+        # Buffer the edit, it is written to the page on the next flush
+        page_buffer.mark_dirty(page_id, content, user_id)
+        await manager.broadcast_page_update(
+            page_id,
+            content,
+            user_id,
+            username
+        )
+    
+    elif message.type == "cursor_position":
+        position = message.data.get("position")
+        if not isinstance(position, dict):
+            return
+        await manager.broadcast_cursor_position(
+            page_id,
+            user_id,
+            username,
+            position
+        )
+    
+    elif message.type == "typing_start":
+        await manager.broadcast_to_page(page_id, {
+            "type": "typing_start",
+            "data": {
+                "user_id": user_id,
+                "username": username
+            }
+        }, exclude_websocket=websocket)
+    
+    elif message.type == "typing_stop":
+        await manager.broadcast_to_page(page_id, {
+            "type": "typing_stop",
+            "data": {
+                "user_id": user_id,
+                "username": username
+            }
+        }, exclude_websocket=websocket)
+
+async def handle_heartbeat_message(websocket: WebSocket, message: WebSocketMessage) -> bool:
+    """Answer application-level pings. Returns True if the message was a heartbeat."""
+    if message.type == "ping":
+        await manager.send_personal_message({"type": "pong"}, websocket)
+        return True
+    return message.type == "pong"
+
+async def send_error(websocket: WebSocket, message: str, page_id: Optional[str] = None):
+    await manager.send_personal_message({
+        "type": "error",
+        "page_id": page_id,
+        "data": {"message": message}
+    }, websocket)
+
+async def websocket_endpoint(
+    websocket: WebSocket,
+    page_id: str,
+    token: str,
+    last_seq: Optional[int] = None,
+    epoch: Optional[str] = None,
+    protocol: Optional[str] = None
+):
+    """WebSocket endpoint for real-time collaboration on a single page."""
+    user_info = await run_in_threadpool(authenticate_socket_user, token)
+    can_write = None
+    if user_info is not None:
+        can_write = await run_in_threadpool(get_page_access, user_info["user_id"], page_id)
+    if can_write is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    try:
+        await manager.accept(websocket, user_info["user_id"], user_info["username"], protocol)
+        await join_page(websocket, page_id, can_write, last_seq, epoch)
         
-        # Send current page users to the new connection
-        users = manager.get_page_users(page_id)
-        await manager.send_personal_message({
-            "type": "page_users",
-            "data": {"users": users}
-        }, websocket)
+        # Listen for messages
+        while True:
+            message = await receive_message(websocket)
+            if message is None:
+                # Malformed message, ignore
+                continue
+            if await handle_heartbeat_message(websocket, message):
+                continue
+            await handle_page_message(websocket, page_id, message)
+    
+    except WebSocketDisconnect:
+        manager.disconnect(websocket)
+    except Exception as e:
+        print(f"WebSocket error: {e}")
+        manager.disconnect(websocket)
+
+async def multiplexed_websocket_endpoint(websocket: WebSocket, token: str, protocol: Optional[str] = None):
+    """WebSocket endpoint carrying any number of page and workspace subscriptions.
+    
+    Clients send `subscribe`/`unsubscribe` messages with a `page_id` (plus
+    optional `last_seq` and `epoch` to resume) or `"channel": "workspace"` for
+    page tree changes. Page-scoped messages in both directions carry `page_id`.
+    """
+    user_info = await run_in_threadpool(authenticate_socket_user, token)
+    if user_info is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    try:
+        await manager.accept(websocket, user_info["user_id"], user_info["username"], protocol)
+        connection = manager.connection_users[websocket]
         
         # Listen for messages
         while True:
-            try:
-                data = await websocket.receive_text()
-                message = json.loads(data)
-                
-                # Handle different message types
-                if message["type"] == "page_update":
-                    await manager.broadcast_page_update(
-                        page_id,
-                        message["data"]["content"],
-                        user_id,
-                        username
-                    )
-                
-                elif message["type"] == "cursor_position":
-                    await manager.broadcast_cursor_position(
-                        page_id,
-                        user_id,
-                        username,
-                        message["data"]["position"]
-                    )
-                
-                elif message["type"] == "typing_start":
-                    await manager.broadcast_to_page(page_id, {
-                        "type": "typing_start",
-                        "data": {
-                            "user_id": user_id,
-                            "username": username
-                        }
-                    }, exclude_websocket=websocket)
-                
-                elif message["type"] == "typing_stop":
-                    await manager.broadcast_to_page(page_id, {
-                        "type": "typing_stop",
-                        "data": {
-                            "user_id": user_id,
-                            "username": username
-                        }
-                    }, exclude_websocket=websocket)
-                
-            except json.JSONDecodeError:
-                # Invalid JSON, ignore
+            message = await receive_message(websocket)
+            if message is None:
+                # Malformed message, ignore
+                continue
+            
+            if await handle_heartbeat_message(websocket, message):
                 continue
-                
+            
+            message_type = message.type
+            page_id = message.page_id
+            
+            if message_type == "subscribe" and message.channel == "workspace":
+                connection.workspace = True
+                await manager.send_personal_message({"type": "subscribed", "data": {"channel": "workspace"}}, websocket)
+            
+            elif message_type == "unsubscribe" and message.channel == "workspace":
+                connection.workspace = False
+            
+            elif message_type == "subscribe" and page_id:
+                if page_id not in connection.pages and len(connection.pages) >= settings.WS_MAX_SUBSCRIPTIONS:
+                    await send_error(websocket, "Too many subscriptions", page_id)
+                    continue
+                can_write = await run_in_threadpool(get_page_access, user_info["user_id"], page_id)
+                if can_write is None:
+                    await send_error(websocket, "Insufficient permissions", page_id)
+                    continue
+                await join_page(websocket, page_id, can_write, message.last_seq, message.epoch)
+            
+            elif message_type == "unsubscribe" and page_id:
+                manager.unsubscribe(websocket, page_id)
+            
+            elif page_id in connection.pages:
+                await handle_page_message(websocket, page_id, message)
+            
+            else:
+                await send_error(websocket, "Not subscribed to page", page_id)
+    
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
         print(f"WebSocket error: {e}")
-        manager.disconnect(websocket) 
\ No newline at end of file
+        manager.disconnect(websocket)
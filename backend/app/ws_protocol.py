@@ -0,0 +1,69 @@
+import json
+from typing import Dict, List, Optional, Union
+from pydantic import ValidationError
+
+from app.schemas import WebSocketMessage
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, clients then get JSON
+    msgpack = None
+
+class JSONCodec:
+    name = "json"
+    binary = False
+
+    def encode(self, message: dict) -> str:
+        return json.dumps(message, separators=(",", ":"))
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        return json.loads(data)
+
+class MsgPackCodec:
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        if isinstance(data, str):
+            data = data.encode()
+        return msgpack.unpackb(data, raw=False)
+
+JSON_CODEC = JSONCodec()
+
+CODECS: Dict[str, object] = {"json": JSON_CODEC}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgPackCodec()
+
+# Sec-WebSocket-Protocol values clients may offer, by codec name
+SUBPROTOCOLS = {
+    "notion.json.v1": "json",
+    "notion.msgpack.v1": "msgpack",
+}
+
+def negotiate_codec(offered_subprotocols: List[str], requested: Optional[str] = None):
+    """Pick a codec from the offered subprotocols, falling back to the `protocol` query parameter.
+
+    Returns the codec and the subprotocol to accept the connection with, if any.
+    """
+    for subprotocol in offered_subprotocols:
+        codec = CODECS.get(SUBPROTOCOLS.get(subprotocol))
+        if codec is not None:
+            return codec, subprotocol
+
+    return CODECS.get(requested, JSON_CODEC), None
+
+def parse_message(codec, data: Union[str, bytes]) -> Optional[WebSocketMessage]:
+    """Decode and validate a client frame, None if it is malformed."""
+    try:
+        raw = codec.decode(data)
+    except Exception:
+        # Invalid JSON or MessagePack
+        return None
+
+    try:
+        return WebSocketMessage.model_validate(raw)
+    except ValidationError:
+        return None
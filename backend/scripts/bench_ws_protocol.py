@@ -0,0 +1,113 @@
+"""Compare WebSocket wire formats: bytes per message and encode/decode CPU time.
+
+Usage (from the backend directory):
+
+    python -m scripts.bench_ws_protocol [--iterations 20000]
+
+Sizes are reported raw and after permessage-deflate style compression
+(raw DEFLATE, fresh context per message, i.e. without context takeover).
+"""
+import argparse
+import random
+import string
+import time
+import zlib
+
+from app.ws_protocol import CODECS, parse_message
+
+def sample_messages() -> dict:
+    rng = random.Random(42)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(500)]
+
+    def text(n_words: int) -> str:
+        paragraphs = []
+        for _ in range(max(1, n_words // 60)):
+            paragraphs.append("<p>" + " ".join(rng.choices(words, k=60)) + "</p>")
+        return "".join(paragraphs)
+
+    page_id = "0b6f8c2e-5d1a-4a57-9a0e-2f3c1d9e7b44"
+    user_id = "7c1e2a90-3b4d-4f6e-8a1b-9c0d2e3f4a5b"
+    return {
+        "cursor_position": {
+            "type": "cursor_position",
+            "page_id": page_id,
+            "seq": 1842,
+            "data": {
+                "user_id": user_id,
+                "username": "ada",
+                "position": {"from": 1204, "to": 1204, "line": 37, "column": 12},
+                "timestamp": "81234.562118"
+            }
+        },
+        "typing_start": {
+            "type": "typing_start",
+            "page_id": page_id,
+            "seq": 1843,
+            "data": {"user_id": user_id, "username": "ada"}
+        },
+        "page_update_2kb": {
+            "type": "page_update",
+            "page_id": page_id,
+            "seq": 1844,
+            "data": {
+                "page_id": page_id,
+                "content": text(300),
+                "user_id": user_id,
+                "username": "ada",
+                "timestamp": "81234.901774"
+            }
+        },
+        "page_update_50kb": {
+            "type": "page_update",
+            "page_id": page_id,
+            "seq": 1845,
+            "data": {
+                "page_id": page_id,
+                "content": text(7500),
+                "user_id": user_id,
+                "username": "ada",
+                "timestamp": "81235.004210"
+            }
+        },
+    }
+
+def deflated_size(payload) -> int:
+    if isinstance(payload, str):
+        payload = payload.encode()
+    compressor = zlib.compressobj(wbits=-15)
+    return len(compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+def time_per_call(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    if "msgpack" not in CODECS:
+        print("msgpack is not installed, only JSON is benchmarked\n")
+
+    header = f"{'message':<18} {'codec':<8} {'bytes':>8} {'deflate':>8} {'encode us':>10} {'decode us':>10} {'parse us':>10}"
+    print(header)
+    print("-" * len(header))
+
+    for name, message in sample_messages().items():
+        # Fewer iterations for large payloads so every row takes similar time
+        iterations = max(200, args.iterations // max(1, len(str(message)) // 512))
+        for codec in CODECS.values():
+            payload = codec.encode(message)
+            size = len(payload.encode() if isinstance(payload, str) else payload)
+            encode_us = time_per_call(lambda: codec.encode(message), iterations)
+            decode_us = time_per_call(lambda: codec.decode(payload), iterations)
+            parse_us = time_per_call(lambda: parse_message(codec, payload), iterations)
+            print(
+                f"{name:<18} {codec.name:<8} {size:>8} {deflated_size(payload):>8} "
+                f"{encode_us:>10.2f} {decode_us:>10.2f} {parse_us:>10.2f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Check that a half-open circuit breaker recovers from probes that get no answer.
+
+Usage (from the backend directory, no network needed):
+
+    python -m scripts.check_circuit_breaker
+
+Runs the outbound HTTP client against an in-process mock upstream. For each
+way a probe can end without a response (cancelled while waiting for a
+connection slot, cancelled in flight, cancelled while streaming, or failing
+with an error other than a transport error) it opens the host's breaker,
+lets the cool-down pass, ends the probe that way and checks that the next
+request goes through. Exits with status 1 if one does not.
+"""
+import sys
+import asyncio
+import argparse
+import time
+
+import httpx
+
+from app.http_client import OutboundHTTP, CircuitOpenError
+
+URL = "http://upstream.test/ping"
+HOST = "upstream.test"
+
+class MockUpstream:
+    """Answers 200 at once, or hangs or raises for the next request when told to."""
+
+    def __init__(self):
+        self.mode = "ok"
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        mode, self.mode = self.mode, "ok"
+        if mode == "hang":
+            await asyncio.Event().wait()
+        if mode == "error":
+            raise ValueError("broken response")
+        return httpx.Response(200, text="pong")
+
+def half_open(client: OutboundHTTP):
+    breaker = client._breaker(HOST)
+    breaker.failures = breaker.failure_threshold
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout
+
+async def cancel_in_flight(client: OutboundHTTP, upstream: MockUpstream):
+    upstream.mode = "hang"
+    task = asyncio.create_task(client.get(URL, retries=0))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+async def cancel_waiting_for_slot(client: OutboundHTTP, upstream: MockUpstream):
+    slot = client._slot(HOST)
+    held = 0
+    while not slot.locked():
+        await slot.acquire()
+        held += 1
+    task = asyncio.create_task(client.get(URL, retries=0))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    for _ in range(held):
+        slot.release()
+
+async def cancel_stream(client: OutboundHTTP, upstream: MockUpstream):
+    upstream.mode = "hang"
+
+    async def read():
+        async with client.stream("GET", URL) as response:
+            await response.aread()
+
+    task = asyncio.create_task(read())
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+async def other_error(client: OutboundHTTP, upstream: MockUpstream):
+    upstream.mode = "error"
+    try:
+        await client.get(URL, retries=0)
+    except (ValueError, CircuitOpenError):
+        pass
+
+CASES = [
+    ("cancelled in flight", cancel_in_flight),
+    ("cancelled waiting for a slot", cancel_waiting_for_slot),
+    ("cancelled stream", cancel_stream),
+    ("non-transport error", other_error),
+]
+
+async def run() -> bool:
+    upstream = MockUpstream()
+    client = OutboundHTTP()
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    ok = True
+    try:
+        for name, end_probe in CASES:
+            half_open(client)
+            await end_probe(client, upstream)
+            try:
+                response = await client.get(URL, retries=0)
+                result = "ok" if response.status_code == 200 else f"status {response.status_code}"
+            except CircuitOpenError:
+                result = "circuit stuck open"
+            ok &= result == "ok"
+            print(f"{result:20} {name}")
+    finally:
+        await client.close()
+    return ok
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    sys.exit(0 if asyncio.run(run()) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Check that the hot queries of the API use indexes rather than full table scans.
+
+Usage (from the backend directory, against a scratch database):
+
+    DATABASE_URL=postgresql://localhost/notion_plans python -m scripts.check_query_plans [--pages 200000]
+
+Creates the tables if needed, seeds users, page trees, collaborations,
+comments and versions until `pages` holds at least `--pages` rows, then runs
+EXPLAIN for each query and exits with status 1 if any plan reads a whole
+table. Works on PostgreSQL and SQLite.
+"""
+import sys
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, or_, select, text
+
+from app.database import engine, Base, SessionLocal
+from app.models import (
+    User, Page, PageCollaboration, PageVersion, Comment, PasswordResetToken, PageChange, PageLink, Job, generate_uuid
+)
+from app.fractional_index import keys_after
+
+PAGES_PER_USER = 200
+# SQLite only uses an index for LIKE 'prefix%' with case_sensitive_like on,
+# PostgreSQL does with the C collation the column has there
+POSTGRESQL_ONLY = {"subtree by path"}
+BATCH_SIZE = 5000
+
+def seed(db, target_pages: int):
+    """Add users with page trees until there are `target_pages` pages."""
+    existing = db.query(func.count(Page.id)).scalar()
+    if existing >= target_pages:
+        return
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    users = (target_pages - existing) // PAGES_PER_USER + 1
+    print(f"Seeding {users} users with {PAGES_PER_USER} pages each...")
+    user_ids = [generate_uuid() for _ in range(users)]
+    db.execute(insert(User), [
+        {
+            "id": user_id, "email": f"{user_id}@example.com", "username": f"user_{user_id[:13]}",
+            "hashed_password": "x", "is_active": True, "is_verified": True, "created_at": now
+        }
+        for user_id in user_ids
+    ])
+
+    pages, collaborations, comments, versions, changes, links = [], [], [], [], [], []
+
+    def flush(force: bool = False):
+        for model, rows in ((Page, pages), (PageCollaboration, collaborations), (Comment, comments),
+                            (PageVersion, versions), (PageChange, changes), (PageLink, links)):
+            if rows and (force or len(rows) >= BATCH_SIZE):
+                db.execute(insert(model), rows)
+                rows.clear()
+
+    for user_id in user_ids:
+        # A few top-level pages, the rest nested up to a handful of levels
+        tree = []
+        for i in range(PAGES_PER_USER):
+            parent = rng.choice(tree) if tree and i >= 10 else None
+            page_id = generate_uuid()
+            path = f"{parent['path'] if parent else '/'}{page_id}/"
+            archived = rng.random() < 0.05
+            page = {
+                "id": page_id, "title": f"Page {i}", "content": "<p>" + "lorem ipsum " * 40 + "</p>",
+                "icon": "📄", "parent_id": parent["id"] if parent else None, "owner_id": user_id,
+                "path": path, "is_public": rng.random() < 0.1, "is_archived": archived,
+                "archived_at": now if archived else None, "page_metadata": {}, "created_at": now
+            }
+            tree.append(page)
+            pages.append(page)
+            versions.extend(
+                {"id": generate_uuid(), "page_id": page_id, "content": "", "version_number": n + 1,
+                 "created_by": user_id, "created_at": now}
+                for n in range(rng.randint(0, 3))
+            )
+            if rng.random() < 0.3:
+                comment_id = generate_uuid()
+                comments.append({"id": comment_id, "page_id": page_id, "author_id": user_id, "content": "Nice",
+                                 "parent_comment_id": None, "created_at": now})
+                comments.append({"id": generate_uuid(), "page_id": page_id, "author_id": user_id, "content": "Thanks",
+                                 "parent_comment_id": comment_id, "created_at": now})
+            if rng.random() < 0.1:
+                collaborations.append({"id": generate_uuid(), "page_id": page_id, "user_id": rng.choice(user_ids),
+                                       "permission": "write", "created_at": now})
+            changes.append({"entity": "page", "entity_id": page_id, "page_id": page_id, "owner_id": user_id,
+                            "op": "upsert", "user_id": user_id, "created_at": now})
+            if parent:
+                links.append({"id": generate_uuid(), "source_page_id": page_id, "kind": "page",
+                              "target_id": parent["id"], "created_at": now})
+        # Siblings in creation order, as the app places them
+        by_parent = {}
+        for page in tree:
+            by_parent.setdefault(page["parent_id"], []).append(page)
+        for siblings in by_parent.values():
+            for page, position in zip(siblings, keys_after(None, len(siblings))):
+                page["position"] = position
+        flush()
+
+    db.execute(insert(PasswordResetToken), [
+        {"id": generate_uuid(), "user_id": user_id, "token": generate_uuid(),
+         "expires_at": now + timedelta(hours=rng.randint(-500, 1)), "created_at": now}
+        for user_id in user_ids
+    ])
+    db.execute(insert(Job), [
+        {"id": generate_uuid(), "user_id": user_id, "type": "compact_versions", "status": "succeeded",
+         "params": {}, "progress": 1.0, "cancel_requested": False, "created_at": now}
+        for user_id in user_ids for _ in range(5)
+    ])
+    flush(force=True)
+    db.commit()
+
+def hot_queries(db) -> dict:
+    """The queries behind the busiest endpoints, for a sampled user and page."""
+    page = db.query(Page.id, Page.owner_id, Page.parent_id, Page.path).filter(
+        Page.parent_id.isnot(None)
+    ).order_by(Page.id).offset(1000).first()
+    comment_id = db.query(Comment.id).filter(Comment.parent_comment_id.is_(None)).order_by(Comment.id).first()[0]
+    shared = select(PageCollaboration.page_id).where(PageCollaboration.user_id == page.owner_id)
+    last_change = db.query(func.max(PageChange.id)).scalar()
+    return {
+        "get_pages (top level)": select(Page).where(
+            Page.owner_id == page.owner_id, Page.parent_id.is_(None), Page.is_archived == False
+        ).order_by(Page.position, Page.created_at),
+        "get_pages (children)": select(Page).where(
+            Page.owner_id == page.owner_id, Page.parent_id == page.parent_id, Page.is_archived == False
+        ).order_by(Page.position, Page.created_at),
+        "page children relationship": select(Page).where(Page.parent_id == page.parent_id).order_by(Page.position),
+        "check_page_permission": select(PageCollaboration).where(
+            PageCollaboration.page_id == page.id, PageCollaboration.user_id == page.owner_id
+        ),
+        "accessible pages": select(Page.id).where(Page.owner_id == page.owner_id).union(shared),
+        "search_pages": select(Page).where(Page.owner_id == page.owner_id, Page.title.ilike("%page 1%")).limit(20),
+        "subtree by path": select(Page.id).where(Page.path.startswith(page.path)).order_by(Page.path),
+        "get_comments": select(Comment).where(Comment.page_id == page.id, Comment.parent_comment_id.is_(None)),
+        "comment replies": select(Comment).where(Comment.parent_comment_id == comment_id),
+        "collaborators": select(PageCollaboration).where(PageCollaboration.page_id == page.id),
+        "latest version": select(func.max(PageVersion.version_number)).where(PageVersion.page_id == page.id),
+        "expired reset tokens": select(PasswordResetToken.id).where(PasswordResetToken.expires_at < datetime.utcnow()),
+        "backlinks": select(Page.id).where(
+            Page.id.in_(select(PageLink.source_page_id).where(PageLink.target_id == page.parent_id, PageLink.kind == "page")),
+            Page.is_archived == False
+        ),
+        "get_jobs": select(Job).where(Job.user_id == page.owner_id).order_by(Job.created_at.desc()).limit(20),
+        "sync": select(PageChange).where(
+            PageChange.id > last_change - 100,
+            or_(PageChange.owner_id == page.owner_id, PageChange.page_id.in_(shared))
+        ).order_by(PageChange.id).limit(500),
+    }
+
+def full_scans(db, statement) -> list:
+    """The tables a statement's plan reads in full."""
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    if engine.dialect.name == "postgresql":
+        plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+        scans = []
+
+        def walk(node):
+            if node["Node Type"] == "Seq Scan":
+                scans.append(node["Relation Name"])
+            for child in node.get("Plans", []):
+                walk(child)
+
+        walk(plan[0]["Plan"])
+        return scans
+    # SQLite says SCAN for full table and full index scans, SEARCH for index lookups
+    rows = db.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    return [
+        row[-1].split()[1] for row in rows
+        if row[-1].startswith("SCAN ") and not row[-1].startswith(("SCAN CONSTANT", "SCAN SUBQUERY"))
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200000, help="pages to seed up to")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        seed(db, args.pages)
+        db.execute(text("ANALYZE"))
+        db.commit()
+
+        failed = 0
+        for name, statement in hot_queries(db).items():
+            if name in POSTGRESQL_ONLY and engine.dialect.name != "postgresql":
+                print(f"{name:32} skipped, PostgreSQL only")
+                continue
+            scans = full_scans(db, statement)
+            status = "FULL SCAN of " + ", ".join(scans) if scans else "ok"
+            print(f"{name:32} {status}")
+            failed += bool(scans)
+    finally:
+        db.close()
+
+    if failed:
+        print(f"{failed} queries read whole tables")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Local stand-in for the Claude Messages API, for trying AI features without a key.
+
+Usage (from the backend directory):
+
+    python -m scripts.mock_claude --port 9000 --first-token-delay 0.5 --token-delay 0.05
+
+then start the API with
+
+    CLAUDE_API_KEY=test CLAUDE_API_URL=http://127.0.0.1:9000/v1/messages uvicorn app.main:app
+
+Both plain and `"stream": true` requests are supported. Streams that the
+caller abandons are reported, which shows that client cancellation reaches
+the upstream. With `--max-concurrent N` requests beyond N in flight get a
+429, like the real API under rate limiting, and `/stats` reports the peak
+concurrency seen, which shows whether the AI scheduler keeps within its cap.
+"""
+import argparse
+import asyncio
+import json
+from contextlib import contextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock Claude API")
+options = argparse.Namespace(first_token_delay=0.3, token_delay=0.03, tokens=60, status=200, max_concurrent=0)
+counters = {"requests": 0, "rate_limited": 0, "streams_completed": 0, "streams_cancelled": 0, "in_flight": 0, "peak_in_flight": 0}
+
+def reply_words(prompt: str) -> list:
+    words = f"Mock reply to: {prompt[:80]}".split()
+    filler = "lorem ipsum dolor sit amet consectetur adipiscing elit".split()
+    while len(words) < options.tokens:
+        words.extend(filler)
+    return words[:options.tokens]
+
+@contextmanager
+def in_flight():
+    counters["in_flight"] += 1
+    counters["peak_in_flight"] = max(counters["peak_in_flight"], counters["in_flight"])
+    try:
+        yield
+    finally:
+        counters["in_flight"] -= 1
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    counters["requests"] += 1
+    body = await request.json()
+    if options.status != 200:
+        return JSONResponse({"type": "error", "error": {"message": "mock failure"}}, status_code=options.status)
+    if options.max_concurrent and counters["in_flight"] >= options.max_concurrent:
+        counters["rate_limited"] += 1
+        return JSONResponse({"type": "error", "error": {"type": "rate_limit_error", "message": "mock rate limit"}}, status_code=429)
+
+    prompt = body["messages"][-1]["content"]
+    words = reply_words(prompt)
+    usage = {"input_tokens": len(prompt.split()), "output_tokens": len(words)}
+
+    if not body.get("stream"):
+        with in_flight():
+            await asyncio.sleep(options.first_token_delay + options.token_delay * len(words))
+        return {
+            "id": "msg_mock",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": " ".join(words)}],
+            "usage": usage,
+        }
+
+    async def generate():
+        sent = 0
+        try:
+            with in_flight():
+                yield sse("message_start", {"type": "message_start", "message": {
+                    "id": "msg_mock", "usage": {"input_tokens": usage["input_tokens"], "output_tokens": 0}
+                }})
+                await asyncio.sleep(options.first_token_delay)
+                for word in words:
+                    yield sse("content_block_delta", {
+                        "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word + " "}
+                    })
+                    sent += 1
+                    await asyncio.sleep(options.token_delay)
+                yield sse("message_delta", {"type": "message_delta", "usage": {"output_tokens": sent}})
+                yield sse("message_stop", {"type": "message_stop"})
+                counters["streams_completed"] += 1
+        except asyncio.CancelledError:
+            counters["streams_cancelled"] += 1
+            print(f"[mock] stream cancelled by caller after {sent}/{len(words)} tokens")
+            raise
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def stats():
+    return counters
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--first-token-delay", type=float, default=options.first_token_delay)
+    parser.add_argument("--token-delay", type=float, default=options.token_delay)
+    parser.add_argument("--tokens", type=int, default=options.tokens)
+    parser.add_argument("--status", type=int, default=options.status, help="Answer every request with this status")
+    parser.add_argument("--max-concurrent", type=int, default=options.max_concurrent, help="Answer 429 beyond this many requests in flight")
+    args = parser.parse_args()
+    for name in ("first_token_delay", "token_delay", "tokens", "status", "max_concurrent"):
+        setattr(options, name, getattr(args, name))
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Rebuild the page link and mention index from page content.
+
+Usage (from the backend directory):
+
+    python -m scripts.rebuild_page_links
+
+Fills the index for pages saved before it existed, or repairs it. Pages are
+read in batches and only differences are written, so the command can be
+rerun and run while the API serves edits. Nobody is notified of mentions
+it finds.
+"""
+import argparse
+import time
+
+from app.database import SessionLocal
+from app.page_links import rebuild_page_links
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    started = time.time()
+    last_report = [0.0]
+
+    def report(done: int, total: int):
+        if time.time() - last_report[0] >= 5 or done == total:
+            last_report[0] = time.time()
+            print(f"{done}/{total} pages")
+
+    db = SessionLocal()
+    try:
+        pages = rebuild_page_links(db, report)
+    finally:
+        db.close()
+    print(f"Indexed links of {pages} pages in {time.time() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
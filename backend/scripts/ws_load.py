@@ -0,0 +1,379 @@
+"""Load test the collaboration WebSocket with many simulated editors.
+
+Usage (from the backend directory):
+
+    # Start a throwaway server on SQLite and run against it
+    python -m scripts.ws_load --spawn-server --clients 2000 --pages 100 --duration 60
+
+    # Or target a server that is already running with DEBUG=true
+    python -m scripts.ws_load --url http://127.0.0.1:8000 --clients 500
+
+Every client holds one socket on /api/ws/{page_id} and sends a random mix of
+page_update, cursor_position and typing events. page_update and
+cursor_position messages carry a probe id, which receivers use to measure
+fan-out latency and to count messages that never arrived. Server memory per
+connection and event loop lag come from GET /api/ws/stats.
+
+Thousands of sockets from one process need a raised open file limit
+(`ulimit -n 65536`).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+from app.loop_monitor import EventLoopMonitor
+
+PROBE_RE = re.compile(r"<!--probe:(\d+)-->")
+SUBPROTOCOLS = {"json": "notion.json.v1", "msgpack": "notion.msgpack.v1"}
+
+class LoadStats:
+    def __init__(self):
+        self.sent: Counter = Counter()
+        self.received: Counter = Counter()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.connect_times: List[float] = []
+        self.connect_failures = 0
+        self.disconnects = 0
+        # probe id -> (message type, sent at, receivers expected)
+        self.probes: Dict[int, tuple] = {}
+        self.probe_deliveries: Counter = Counter()
+        self.next_probe = 0
+
+    def new_probe(self, message_type: str, expected: int) -> int:
+        self.next_probe += 1
+        self.probes[self.next_probe] = (message_type, time.perf_counter(), expected)
+        return self.next_probe
+
+    def delivered(self, probe_id: int):
+        probe = self.probes.get(probe_id)
+        if probe is None:
+            return
+        message_type, sent_at, _ = probe
+        self.latencies[message_type].append(time.perf_counter() - sent_at)
+        self.probe_deliveries[probe_id] += 1
+
+    def dropped(self) -> Dict[str, int]:
+        dropped: Counter = Counter()
+        for probe_id, (message_type, _, expected) in self.probes.items():
+            dropped[message_type] += max(0, expected - self.probe_deliveries[probe_id])
+        return dict(dropped)
+
+class Codec:
+    def __init__(self, name: str):
+        self.name = name
+        if name == "msgpack":
+            import msgpack
+            self.encode = lambda message: msgpack.packb(message, use_bin_type=True)
+            self.decode = lambda data: msgpack.unpackb(data, raw=False)
+        else:
+            self.encode = lambda message: json.dumps(message, separators=(",", ":"))
+            self.decode = json.loads
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[index]
+
+# Server and fixtures
+
+def spawn_server(port: int, db_path: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "ENVIRONMENT": "development",
+        "DEBUG": "true",
+        # Nothing to recover from a throwaway database
+        "PAGE_BUFFER_LOG_PATH": "",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning", "--ws", "websockets"],
+        env=env,
+    )
+
+async def wait_for_server(http: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await http.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("Server did not become healthy")
+
+async def seed(http: httpx.AsyncClient, n_users: int, n_pages: int, editors_per_page: int):
+    """Create users and pages through the API. Returns the tokens of each page's editors."""
+    run_id = uuid.uuid4().hex[:8]
+    password = "load-test-password"
+    users = []
+    for i in range(n_users):
+        username = f"load_{run_id}_{i}"
+        resp = await http.post("/api/auth/register", json={
+            "email": f"{username}@example.com", "username": username, "password": password
+        })
+        resp.raise_for_status()
+        resp = await http.post("/api/auth/login", json={"username": username, "password": password})
+        resp.raise_for_status()
+        body = resp.json()
+        users.append((body["user"]["id"], body["access_token"]))
+
+    page_editors: Dict[str, List[str]] = {}
+    for p in range(n_pages):
+        owner_index = p % n_users
+        owner_id, owner_token = users[owner_index]
+        headers = {"Authorization": f"Bearer {owner_token}"}
+        resp = await http.post("/api/pages/", headers=headers, json={
+            "title": f"Load test page {p}", "content": "<p>Load test</p>"
+        })
+        resp.raise_for_status()
+        page_id = resp.json()["id"]
+
+        editors = [owner_token]
+        for k in range(1, min(editors_per_page, n_users)):
+            user_id, token = users[(owner_index + k) % n_users]
+            resp = await http.post(f"/api/pages/{page_id}/collaborate", headers=headers, json={
+                "user_id": user_id, "permission": "write"
+            })
+            resp.raise_for_status()
+            editors.append(token)
+        page_editors[page_id] = editors
+
+    return page_editors
+
+# Clients
+
+async def receive_loop(ws, codec: Codec, stats: LoadStats):
+    try:
+        async for frame in ws:
+            message = codec.decode(frame)
+            message_type = message.get("type")
+            stats.received[message_type] += 1
+
+            if message_type == "ping":
+                await ws.send(codec.encode({"type": "pong"}))
+            elif message_type == "cursor_position":
+                probe_id = message["data"].get("position", {}).get("probe")
+                if probe_id is not None:
+                    stats.delivered(probe_id)
+            elif message_type == "page_update":
+                match = PROBE_RE.search(message["data"].get("content", ""))
+                if match:
+                    stats.delivered(int(match.group(1)))
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        stats.disconnects += 1
+
+async def send_loop(ws, page_id: str, codec: Codec, stats: LoadStats, args, mix, page_clients: Counter,
+                    rng: random.Random, stop: asyncio.Event):
+    kinds, weights = zip(*mix.items())
+    content = "<p>" + "lorem ipsum dolor sit amet " * (args.content_bytes // 27 + 1) + "</p>"
+
+    while not stop.is_set():
+        await asyncio.sleep(rng.expovariate(args.rate))
+        if stop.is_set():
+            break
+        kind = rng.choices(kinds, weights)[0]
+        receivers = page_clients[page_id]
+
+        if kind == "page_update":
+            probe_id = stats.new_probe(kind, receivers)
+            message = {"type": "page_update", "data": {"content": f"{content}<!--probe:{probe_id}-->"}}
+        elif kind == "cursor_position":
+            probe_id = stats.new_probe(kind, receivers)
+            offset = rng.randint(0, args.content_bytes)
+            message = {"type": "cursor_position", "data": {"position": {"from": offset, "to": offset, "probe": probe_id}}}
+        else:
+            kind = rng.choice(["typing_start", "typing_stop"])
+            message = {"type": kind, "data": {}}
+
+        try:
+            await ws.send(codec.encode(message))
+        except websockets.ConnectionClosed:
+            return
+        stats.sent[kind] += 1
+
+async def connect_client(ws_base: str, page_id: str, token: str, codec: Codec, stats: LoadStats,
+                         page_clients: Counter, semaphore: asyncio.Semaphore, tasks: list):
+    uri = f"{ws_base}/api/ws/{page_id}?token={token}"
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            ws = await websockets.connect(
+                uri, subprotocols=[SUBPROTOCOLS[codec.name]], max_size=None, open_timeout=30
+            )
+        except Exception:
+            stats.connect_failures += 1
+            return None
+        stats.connect_times.append(time.perf_counter() - start)
+    page_clients[page_id] += 1
+    # Read right away, unread frames would push back on the server's broadcasts
+    tasks.append(asyncio.create_task(receive_loop(ws, codec, stats)))
+    return ws
+
+# Reporting
+
+def format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}"
+
+def report(stats: LoadStats, args, elapsed: float, server_before: Optional[dict], server_loaded: Optional[dict],
+           server_after: Optional[dict], client_lag: EventLoopMonitor):
+    connected = len(stats.connect_times)
+    print()
+    print(f"Clients connected   {connected}/{args.clients} ({stats.connect_failures} failed)")
+    print(f"Connect time ms     p50 {format_ms(percentile(stats.connect_times, 50))}"
+          f"  p99 {format_ms(percentile(stats.connect_times, 99))}")
+    print(f"Send phase          {elapsed:.1f}s, {sum(stats.sent.values())} messages sent "
+          f"({sum(stats.sent.values()) / max(elapsed, 1e-9):.0f}/s)")
+    print(f"Messages received   {sum(stats.received.values())}")
+
+    print()
+    print(f"{'fan-out latency ms':<20} {'count':>9} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'dropped':>8}")
+    dropped = stats.dropped()
+    for message_type in ("page_update", "cursor_position"):
+        values = stats.latencies.get(message_type, [])
+        print(f"{message_type:<20} {len(values):>9} {format_ms(percentile(values, 50)):>8} "
+              f"{format_ms(percentile(values, 90)):>8} {format_ms(percentile(values, 99)):>8} "
+              f"{format_ms(max(values, default=0.0)):>8} {dropped.get(message_type, 0):>8}")
+
+    print()
+    if server_before and server_loaded and server_before.get("rss_bytes") and server_loaded.get("rss_bytes"):
+        per_connection = (server_loaded["rss_bytes"] - server_before["rss_bytes"]) / max(connected, 1)
+        print(f"Server memory       {server_loaded['rss_bytes'] / 2**20:.1f} MiB RSS, "
+              f"~{per_connection / 1024:.1f} KiB per connection")
+    if server_after:
+        lag = server_after["event_loop_lag"]
+        print(f"Server loop lag ms  avg {lag['avg_ms']}  max {lag['max_ms']}")
+    lag = client_lag.stats()
+    print(f"Client loop lag ms  avg {lag['avg_ms']}  max {lag['max_ms']}"
+          + ("  (generator saturated, results are pessimistic)" if client_lag.max_lag > 0.25 else ""))
+
+async def fetch_stats(http: httpx.AsyncClient, token: str, reset: bool = False) -> Optional[dict]:
+    try:
+        resp = await http.get(
+            "/api/ws/stats", params={"reset": reset}, headers={"Authorization": f"Bearer {token}"}
+        )
+    except httpx.TransportError:
+        return None
+    if resp.status_code != 200:
+        return None
+    return resp.json()
+
+async def run(args):
+    mix = {}
+    for part in args.mix.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+
+    server = None
+    db_dir = None
+    base_url = args.url
+    if args.spawn_server:
+        db_dir = tempfile.TemporaryDirectory()
+        server = spawn_server(args.port, os.path.join(db_dir.name, "ws_load.db"))
+        base_url = f"http://127.0.0.1:{args.port}"
+    ws_base = base_url.replace("http://", "ws://").replace("https://", "wss://")
+
+    codec = Codec(args.protocol)
+    stats = LoadStats()
+    page_clients: Counter = Counter()
+    client_lag = EventLoopMonitor(interval=0.05)
+    sockets = []
+    tasks = []
+
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+            await wait_for_server(http)
+            print(f"Seeding {args.users} users and {args.pages} pages...")
+            page_editors = await seed(http, args.users, args.pages, args.editors_per_page)
+            # Any seeded user may read the stats
+            stats_token = next(iter(page_editors.values()))[0]
+            server_before = await fetch_stats(http, stats_token)
+            if server_before is None:
+                print("GET /api/ws/stats unavailable (server not in DEBUG mode?), server metrics are skipped")
+
+            print(f"Connecting {args.clients} clients...")
+            client_lag.start()
+            semaphore = asyncio.Semaphore(args.connect_concurrency)
+            page_ids = list(page_editors)
+            assignments = []
+            for i in range(args.clients):
+                page_id = page_ids[i % len(page_ids)]
+                editors = page_editors[page_id]
+                assignments.append((page_id, editors[(i // len(page_ids)) % len(editors)]))
+
+            sockets = await asyncio.gather(*[
+                connect_client(ws_base, page_id, token, codec, stats, page_clients, semaphore, tasks)
+                for page_id, token in assignments
+            ])
+            # Let join events and snapshots settle before measuring
+            await asyncio.sleep(1)
+            server_loaded = await fetch_stats(http, stats_token, reset=True)
+
+            print(f"Sending for {args.duration}s...")
+            stop = asyncio.Event()
+            for i, (ws, (page_id, _)) in enumerate(zip(sockets, assignments)):
+                if ws is None:
+                    continue
+                tasks.append(asyncio.create_task(send_loop(
+                    ws, page_id, codec, stats, args, mix, page_clients, random.Random(i), stop
+                )))
+
+            started = time.perf_counter()
+            await asyncio.sleep(args.duration)
+            stop.set()
+            elapsed = time.perf_counter() - started
+            # Give in-flight broadcasts time to arrive before counting drops
+            await asyncio.sleep(args.drain)
+            server_after = await fetch_stats(http, stats_token)
+
+            report(stats, args, elapsed, server_before, server_loaded, server_after, client_lag)
+    finally:
+        await client_lag.stop()
+        await asyncio.gather(*[ws.close() for ws in sockets if ws is not None], return_exceptions=True)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        if db_dir is not None:
+            db_dir.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server to test, ignored with --spawn-server")
+    parser.add_argument("--spawn-server", action="store_true", help="Start a local server on a temporary SQLite database")
+    parser.add_argument("--port", type=int, default=8765, help="Port for --spawn-server")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--editors-per-page", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of sending")
+    parser.add_argument("--rate", type=float, default=1.0, help="Messages per second per client")
+    parser.add_argument("--mix", default="page_update=0.2,cursor_position=0.6,typing=0.2")
+    parser.add_argument("--content-bytes", type=int, default=2000, help="Size of page_update content")
+    parser.add_argument("--protocol", choices=list(SUBPROTOCOLS), default="json")
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--drain", type=float, default=3.0, help="Seconds to wait for late messages")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()